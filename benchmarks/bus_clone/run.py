@@ -0,0 +1,68 @@
+"""Compare `Bus.clone` with `copy.deepcopy` on the buses of the test programs."""
+
+import glob
+import json
+import os
+import timeit
+from copy import deepcopy
+
+from pyp4 import PacketIO
+from pyp4.packet import BinaryPacket
+from pyp4.process import Process
+
+PROGRAMS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests", "p4", "*.json",
+)
+
+
+class BenchProcess(Process):
+    """A process for any program."""
+
+    def __init__(self, name, program):
+        super().__init__(name, program, PacketIO.STACK)
+
+    @staticmethod
+    def _validate_program(program):
+        pass
+
+
+def make_bus(program):
+    """A bus with all headers valid and every field written."""
+    process = BenchProcess("bus_clone", program)
+    bus = process.bus()
+    headers = list(bus.metadata.values())
+    for name in program["headers"]:
+        if not name["metadata"]:
+            bus.packet.add_header(name["name"])
+            headers.append(bus.packet[name["name"]])
+    for header in headers:
+        for field_name in header:
+            field = header[field_name]
+            field.val = 1 if field.bitwidth else 0
+    bus.packet.unparsed = BinaryPacket(bytes(64))
+    return bus, headers
+
+
+def main(number=2000):
+    print(f"{'':20}{'headers':>8}{'deepcopy [us]':>16}{'clone [us]':>12}{'lists [us]':>12}")
+    for program_file_name in sorted(glob.glob(PROGRAMS)):
+        with open(program_file_name) as program_file:
+            program = json.load(program_file)
+        bus, headers = make_bus(program)
+        # The cost of copying one list per header for reference.
+        lists = [list(header.as_dict().values()) for header in headers]
+
+        times = [
+            min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e6
+            for statement in (
+                lambda: deepcopy(bus),
+                bus.clone,
+                lambda: [values.copy() for values in lists],
+            )
+        ]
+        name = os.path.basename(program_file_name)
+        print(f"{name:20}{len(headers):8}{times[0]:16.1f}{times[1]:12.1f}{times[2]:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measure the memory allocated per packet by `V1ModelProcessor.input` with and without pooling."""
+
+import gc
+import json
+import os
+import timeit
+import tracemalloc
+
+from pyp4 import PacketIO
+from pyp4.packet import BinaryPacket
+from pyp4.processors.v1model import (
+    V1ModelPortMeta,
+    V1ModelProcess,
+    V1ModelProcessor,
+    V1ModelRuntimeAbc,
+)
+
+PROGRAM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests", "p4", "complex.json",
+)
+
+
+class UnpooledProcess(V1ModelProcess):
+    """A process that never reuses a bus."""
+
+    BUS_POOL_SIZE = 0
+
+
+class Runtime(V1ModelRuntimeAbc):
+
+    def time(self):
+        return 0
+
+
+def make_processor(process_cls):
+    with open(PROGRAM) as program_file:
+        program = json.load(program_file)
+    process = process_cls("bus_pool", program, PacketIO.BINARY)
+    processor = V1ModelProcessor(Runtime()).load(process)
+    processor.table("ingress", "ProcessIngress.ethernet_fib").insert_entry(
+        key=0x001122334455,
+        action_name="ProcessIngress.act_hit",
+        action_data=[0x07],
+    )
+
+    ethernet = process.header("ethernet")
+    ethernet["dst_addr"].val = 0x001122334455
+    ethernet["ethertype"].val = 0x0800
+    ipv4 = process.header("ipv4")
+    ipv4["dst_addr"].val = 0x0a010203
+    ipv4["ttl"].val = 64
+    binary = bytes(ethernet.to_bytes() + ipv4.to_bytes()) + b"payload"
+
+    def run():
+        return processor.input(
+            V1ModelPortMeta(standard_metadata={"ingress_port": 1}), BinaryPacket(binary),
+        )
+
+    return run
+
+
+def measure_memory(run, count):
+    """Return the net and the peak memory allocated per packet.
+
+    The net memory is what remains allocated after processing ``count`` packets, once the pool
+    and all caches were filled by a warm-up. The peak memory is the largest amount allocated
+    while processing a single packet and freed afterwards.
+    """
+    for _ in range(10):
+        run()
+    gc.collect()
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    peak = 0
+    for _ in range(count):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        _, packet_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, packet_peak - before)
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (end - start) / count, peak
+
+
+def main(count=1000, number=2000):
+    print(f"{'':28}{'unpooled':>12}{'pooled':>12}")
+
+    runs = [make_processor(UnpooledProcess), make_processor(V1ModelProcess)]
+    (net, peak) = zip(*[measure_memory(run, count) for run in runs])
+    print(f"{'net memory [B/packet]':28}{net[0]:12.1f}{net[1]:12.1f}")
+    print(f"{'peak memory [B/packet]':28}{peak[0]:12.0f}{peak[1]:12.0f}")
+
+    times = [min(timeit.repeat(run, number=number, repeat=5)) / number * 1e6 for run in runs]
+    print(f"{'time [us/packet]':28}{times[0]:12.1f}{times[1]:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compare full and incremental updates of an IPv4 header checksum by `Checksum.update`."""
+
+import json
+import os
+import random
+import timeit
+
+from pyp4 import PacketIO
+from pyp4.calculation import Calculation, Checksum
+from pyp4.processors.v1model import V1ModelProcess
+
+PROGRAM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests", "p4", "complex.json",
+)
+
+# Binary packets need whole-byte fields so the version and the flags share a field each.
+IPV4_FIELDS = (
+    ("version_ihl", 8), ("diffserv", 8), ("total_len", 16), ("identification", 16),
+    ("flags_frag_offset", 16), ("ttl", 8), ("protocol", 8), ("hdr_checksum", 16),
+    ("src_addr", 32), ("dst_addr", 32),
+)
+
+
+def make_checksum():
+    """The checksum of a full IPv4 header."""
+    with open(PROGRAM) as program_file:
+        program = json.load(program_file)
+    ipv4_t = next(hdr_t for hdr_t in program["header_types"] if hdr_t["name"] == "ipv4_header_t")
+    ipv4_t["fields"] = [[name, bitwidth, False] for name, bitwidth in IPV4_FIELDS]
+    process = V1ModelProcess("checksum", program, PacketIO.BINARY)
+
+    bitwidths = dict(IPV4_FIELDS)
+    calculation = Calculation(
+        {
+            "name": "calc",
+            "algo": "csum16",
+            "input": [
+                {"type": "field", "value": ["ipv4", name]}
+                for name, _ in IPV4_FIELDS if name != "hdr_checksum"
+            ],
+        },
+        lambda _header_name, field_name: bitwidths[field_name],
+    )
+    checksum = Checksum(
+        {"name": "cksum", "target": ["ipv4", "hdr_checksum"], "type": "generic"}, calculation,
+    )
+    return process, checksum
+
+
+def make_buses(process, checksum, count, modify):
+    """Buses with IPv4 headers decoded from binary as by the parser, verified and then modified."""
+    rng = random.Random(0)
+    buses = []
+    for _ in range(count):
+        header = process.header("ipv4")
+        for name, bitwidth in IPV4_FIELDS:
+            header[name].val = rng.getrandbits(bitwidth)
+        bus = process.bus()
+        bus.packet.add_header("ipv4")
+        ipv4 = bus.get_hdr("ipv4")
+        ipv4.from_bytes(bytes(header.to_bytes()), lazy=True)
+        baselines = {}
+        checksum.verify(bus, baselines)
+        modify(ipv4, rng)
+        buses.append((bus, baselines))
+    return buses
+
+
+def decrement_ttl(ipv4, _rng):
+    ipv4["ttl"].val = (ipv4["ttl"].val - 1) & 0xff
+
+
+def translate_addresses(ipv4, rng):
+    ipv4["src_addr"].val = rng.getrandbits(32)
+    ipv4["dst_addr"].val = rng.getrandbits(32)
+
+
+def rewrite_all(ipv4, rng):
+    for name, bitwidth in IPV4_FIELDS:
+        ipv4[name].val = rng.getrandbits(bitwidth)
+
+
+def main(packets=1000, repeat=5):
+    process, checksum = make_checksum()
+    print(f"{'change':24}{'full':>16}{'incremental':>16}")
+    print(f"{'':24}{'[us/packet]':>16}{'[us/packet]':>16}")
+    for name, modify in (
+            ("TTL decrement", decrement_ttl),
+            ("address translation", translate_addresses),
+            ("all fields", rewrite_all),
+    ):
+        buses = make_buses(process, checksum, packets, modify)
+        baselines = [dict(bus_baselines) for _, bus_baselines in buses]
+
+        def full():
+            for bus, _ in buses:
+                checksum.update(bus, {})
+
+        def incremental():
+            for (bus, _), bus_baselines in zip(buses, baselines):
+                checksum.update(bus, bus_baselines)
+
+        def reset():
+            # Each update leaves the new state behind so start again from the verified one.
+            for (_, verified), bus_baselines in zip(buses, baselines):
+                bus_baselines.update(verified)
+
+        times = [
+            min(timeit.repeat(run, setup=reset, number=1, repeat=repeat)) / packets * 1e6
+            for run in (full, incremental)
+        ]
+        print(f"{name:24}{times[0]:16.2f}{times[1]:16.2f}")
+
+
+if __name__ == "__main__":
+    main()
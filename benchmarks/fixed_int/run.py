@@ -0,0 +1,84 @@
+"""Compare the memory use and speed of `FixedInt` with the dict-based class it replaced."""
+
+import timeit
+import tracemalloc
+from copy import deepcopy
+
+from pyp4.packet import FixedInt
+
+# The bitwidths of the fields of a typical Ethernet/IPv4/TCP bus.
+BITWIDTHS = [48, 48, 16, 4, 4, 8, 16, 16, 3, 13, 8, 8, 16, 32, 32, 16, 16, 32, 32, 4]
+
+
+class LegacyFixedInt:
+    """The `FixedInt` before it was given `__slots__` and a shared per-width descriptor."""
+
+    def __init__(self, value, bitwidth):
+        self.__bitwidth = bitwidth
+        self.__bytewidth = int((bitwidth + 7) / 8)
+        self.__byteint = ((self.__bytewidth * 8) == self.__bitwidth)
+
+        self.__mask = (1 << self.__bitwidth) - 1
+        self.__value = None
+
+        self.val = value
+        self.__dirty = False
+
+    @property
+    def val(self):
+        return self.__value
+
+    @val.setter
+    def val(self, value):
+        assert isinstance(value, int)
+        assert value == (value & self.__mask)
+        self.__value = value
+        self.__dirty = True
+
+
+def measure_memory(cls, count):
+    """Return the number of bytes allocated per instance of the class."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    instances = [cls(0, BITWIDTHS[i % len(BITWIDTHS)]) for i in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # The list itself holds one pointer per instance.
+    return (after - before) / len(instances) - 8
+
+
+def measure_speed(statement, setup_globals, number):
+    """Return the time per execution of the statement in nanoseconds."""
+    timer = timeit.Timer(statement, globals=setup_globals)
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e9
+
+
+def main(count=100000, number=200000):
+    print(f"{'':24}{'legacy':>12}{'FixedInt':>12}")
+
+    legacy = measure_memory(LegacyFixedInt, count)
+    current = measure_memory(FixedInt, count)
+    print(f"{'memory [B/instance]':24}{legacy:12.1f}{current:12.1f}")
+
+    env = {
+        "LegacyFixedInt": LegacyFixedInt,
+        "FixedInt": FixedInt,
+        "deepcopy": deepcopy,
+        "legacy": LegacyFixedInt(0, 16),
+        "current": FixedInt(0, 16),
+    }
+    cases = [
+        ("construct [ns]", "LegacyFixedInt(0, 16)", "FixedInt(0, 16)"),
+        ("read [ns]", "legacy.val", "current.val"),
+        ("write [ns]", "legacy.val = 0x0800", "current.val = 0x0800"),
+        ("unchecked write [ns]", "legacy.val = 0x0800", "current.set_unchecked(0x0800)"),
+        ("deepcopy [ns]", "deepcopy(legacy)", "deepcopy(current)"),
+    ]
+    for name, legacy_statement, current_statement in cases:
+        legacy = measure_speed(legacy_statement, env, number)
+        current = measure_speed(current_statement, env, number)
+        print(f"{name:24}{legacy:12.1f}{current:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import runpy
+
+# This file is used to run all the benchmarks in this folder and subfolders. Each file should be of
+# the form run.py and contain a `main`-method which prints its results.
+
+
+def main():
+    path_to_here = os.path.dirname(os.path.abspath(__file__))
+    for root, folders, files in sorted(os.walk(path_to_here)):
+        for filename in files:
+            if filename == "run.py":
+                filepath = os.path.join(root, filename)
+                _run_benchmark(filepath)
+
+
+def _run_benchmark(filepath):
+    namespace = runpy.run_path(filepath)
+    if "main" not in namespace:
+        return
+
+    name = os.path.basename(os.path.dirname(filepath))
+    print("=" * len(name))
+    print(name)
+    print("=" * len(name))
+    namespace["main"]()
+    print()
+
+
+if __name__ == '__main__':
+    main()
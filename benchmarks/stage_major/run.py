@@ -0,0 +1,106 @@
+"""Compare packet-major and stage-major batch processing by `V1ModelProcessor.input_batch`."""
+
+import json
+import os
+import random
+import timeit
+
+from pyp4 import PacketIO
+from pyp4.packet import BinaryPacket
+from pyp4.processors.v1model import (
+    V1ModelPortMeta,
+    V1ModelProcess,
+    V1ModelProcessor,
+    V1ModelRuntimeAbc,
+)
+
+PROGRAM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests", "p4", "complex.json",
+)
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Runtime(V1ModelRuntimeAbc):
+
+    def time(self):
+        return 0
+
+
+def make_processor():
+    with open(PROGRAM) as program_file:
+        program = json.load(program_file)
+    process = V1ModelProcess("stage_major", program, PacketIO.BINARY)
+    processor = V1ModelProcessor(Runtime()).load(process)
+    processor.table("ingress", "ProcessIngress.ethernet_fib").insert_entry(
+        key=0x001122334455,
+        action_name="ProcessIngress.act_hit",
+        action_data=[0x07],
+    )
+    return process, processor
+
+
+def make_binaries(process, count):
+    """IPv4 packets to a few destinations, most of which are routed."""
+    rng = random.Random(0)
+    binaries = []
+    for _ in range(count):
+        ethernet = process.header("ethernet")
+        ethernet["dst_addr"].val = rng.choice([0x001122334455, 0x665544332211, 0x665544332211])
+        ethernet["ethertype"].val = 0x0800
+        ipv4 = process.header("ipv4")
+        ipv4["dst_addr"].val = rng.choice([0x0a010203, 0x0a020304, 0x0b000001])
+        ipv4["ttl"].val = 64
+        binaries.append(bytes(ethernet.to_bytes() + ipv4.to_bytes()) + b"payload")
+    return binaries
+
+
+def main(packets=1024, repeat=5):
+    process, processor = make_processor()
+    binaries = make_binaries(process, packets)
+    port_in_meta = V1ModelPortMeta(standard_metadata={"ingress_port": 1})
+
+    def run(batch_size, stage_major):
+        for start in range(0, packets, batch_size):
+            processor.input_batch(
+                [(port_in_meta, BinaryPacket(binary))
+                 for binary in binaries[start:start + batch_size]],
+                stage_major=stage_major,
+            )
+
+    # Packet-major processing looks up tables with `Table.apply`, which checks every entry, while
+    # stage-major processing uses the index of `Table.apply_batch`. Stage-major processing of
+    # batches of one packet stands in for packet-major processing with the index, including the
+    # overhead of batching, so the crossover is reported against both lookups.
+    print(f"{'batch size':12}{'packet-major':>16}{'stage-major':>16}")
+    print(f"{'':12}{'[us/packet]':>16}{'[us/packet]':>16}")
+    results = []
+    for batch_size in BATCH_SIZES:
+        times = [
+            min(timeit.repeat(lambda: run(batch_size, stage_major), number=1, repeat=repeat))
+            / packets * 1e6
+            for stage_major in (False, True)
+        ]
+        print(f"{batch_size:<12}{times[0]:16.1f}{times[1]:16.1f}")
+        results.append((batch_size, times))
+
+    indexed = dict(results)[1][1]
+    for lookup, crossover in (
+            ("Table.apply", next(
+                (size for size, (packet_major, stage) in results if stage < packet_major), None,
+            )),
+            ("the index of Table.apply_batch", next(
+                (size for size, (_, stage) in results if (size > 1) and (stage < indexed)), None,
+            )),
+    ):
+        if crossover is None:
+            print(f"Stage-major is not faster than packet-major with {lookup} at any batch size")
+        else:
+            print(
+                f"Stage-major is faster than packet-major with {lookup} from a batch size of "
+                f"{crossover}"
+            )
+
+
+if __name__ == "__main__":
+    main()
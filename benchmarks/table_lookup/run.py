@@ -0,0 +1,82 @@
+"""Compare `Table.apply` per packet with `Table.apply_batch` over key columns."""
+
+import json
+import os
+import random
+import timeit
+
+from pyp4 import PacketIO
+from pyp4.processors.v1model import V1ModelProcess
+
+PROGRAM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests", "p4", "complex.json",
+)
+
+
+def make_table(entries):
+    with open(PROGRAM) as program_file:
+        program = json.load(program_file)
+    process = V1ModelProcess("table_lookup", program, PacketIO.BINARY)
+    table = process.blocks["ingress"].tables[
+        "ProcessIngress.process_ingress_ipv4.ethernet_ipv4_fib"
+    ]
+
+    rng = random.Random(0)
+    keys = set()
+    while len(keys) < entries:
+        prefix_length = rng.choice([8, 16, 24, 32])
+        prefix = rng.getrandbits(prefix_length) << (32 - prefix_length)
+        keys.add((rng.choice([0x001122334455, 0x665544332211]), (prefix, prefix_length)))
+    for dst_addr, prefix in keys:
+        table.insert_entry(
+            key=[dst_addr, prefix],
+            action_name="ProcessIngress.process_ingress_ipv4.act_hit",
+            action_data=[rng.randrange(512)],
+        )
+    return process, table
+
+
+def make_buses(process, count):
+    rng = random.Random(1)
+    buses = []
+    for _ in range(count):
+        bus = process.bus()
+        bus.packet.add_header("ethernet")
+        bus.packet["ethernet"]["dst_addr"].val = rng.choice([0x001122334455, 0x665544332211])
+        bus.packet.add_header("ipv4")
+        bus.packet["ipv4"]["dst_addr"].val = rng.getrandbits(32)
+        buses.append(bus)
+    return buses
+
+
+def main(packets=1000, repeat=3):
+    print(f"{'entries':12}{'apply':>16}{'apply_batch':>16}{'index build':>16}")
+    print(f"{'':12}{'[us/packet]':>16}{'[us/packet]':>16}{'[ms]':>16}")
+    for entries in (10, 100, 1000, 10000, 100000):
+        process, table = make_table(entries)
+        buses = make_buses(process, packets)
+        key_columns = table.key_columns(buses)
+        # Build the index once outside of the measurement.
+        start = timeit.default_timer()
+        table.apply_batch(key_columns)
+        build = (timeit.default_timer() - start) * 1e3
+
+        # The brute-force lookup checks every entry, so it is timed on fewer packets for large
+        # tables.
+        apply_buses = buses[:max(packets * 100 // entries, 10)]
+
+        def apply():
+            for bus in apply_buses:
+                table.apply(bus)
+
+        times = [
+            min(timeit.repeat(run, number=1, repeat=repeat)) / count * 1e6
+            for run, count in (
+                (apply, len(apply_buses)), (lambda: table.apply_batch(key_columns), packets),
+            )
+        ]
+        print(f"{entries:<12}{times[0]:16.1f}{times[1]:16.1f}{build:16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,19 @@ from enum import auto, Enum
 class PacketIO(Enum):
     """Encoding/decoding type for packets."""
     BINARY = auto()
-    """Encode/decode packets in binary as `~pyp4.packet.BinaryPacket` objects."""
+    """Encode/decode packets in binary as `~pyp4.binary.BinaryPacket` objects."""
     STACK = auto()
     """Encode/decode packets as `~pyp4.packet.HeaderStack` objects."""
+
+
+class DeparseMode(Enum):
+    """Deparse mode for binary packets."""
+    COPY = auto()
+    """Emit the headers into a new buffer followed by views of the unparsed payload."""
+    HEADROOM = auto()
+    """Write the headers into the headroom directly in front of the unparsed payload.
+
+    This modifies the buffer of the input packet which means that the headers of the deparsed packet
+    must not be used after deparsing. If the buffer is read-only or does not have enough headroom,
+    the deparser falls back to `~pyp4.DeparseMode.COPY`.
+    """
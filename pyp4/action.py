@@ -6,6 +6,27 @@ from pyp4.trace import get_logger, Trace
 logger = get_logger(__name__)
 
 
+def bus_extern(function):
+    """Mark an extern function as one that is passed the bus before its parameters.
+
+    Externs that make requests to the architecture, e.g. to clone or to resubmit the packet,
+    record them in `pyp4.bus.Bus.requests` of the bus they are called for.
+
+    Parameters
+    ----------
+    function : callable
+        The extern function.
+
+    Returns
+    -------
+    callable
+        The function itself.
+
+    """
+    function.bus_extern = True
+    return function
+
+
 class Action:
     """A P4 action.
 
@@ -20,6 +41,12 @@ class Action:
 
     """
 
+    # The primitives executed by the action itself rather than by an extern.
+    __BUILTIN_OPS = frozenset(["assign", "remove_header", "add_header"])
+
+    # The expression types whose value does not depend on the bus.
+    __CONSTANT_TYPES = frozenset(["hexstr", "runtime_data", "bool"])
+
     @Trace(logger)
     def __init__(self, process_name, bm_action, extern):
         self.__process_name = process_name
@@ -43,53 +70,96 @@ class Action:
 
         Parameters
         ----------
-        bus : `pyp4.packet.Bus`
+        bus : `pyp4.bus.Bus`
             The metadata + headers bus.
         runtime_data : list of `str`
             The runtime parameters.
 
         """
         for prim in self.__bm_action["primitives"]:
-            self.logger.debug(
-                f"op-{prim['op']}-\"{prim.get('source_info', {}).get('source_fragment', '')}\""
-            )
-            if prim["op"] == "assign":
-                assert len(prim["parameters"]) == 2
-                left = expr.lval(bus, prim["parameters"][0], runtime_data)
-                right = expr.rval(bus, prim["parameters"][1], runtime_data)
-                self.logger.debug(f"rval={right}")
-                left.val = right
-
-            elif prim["op"] == "remove_header":
-                assert len(prim["parameters"]) == 1
-                param = prim["parameters"][0]
-                assert param["type"] == "header"
-
-                hdr_name = param["value"]
-                if hdr_name in bus.packet:
-                    hdr = bus.get_hdr(hdr_name)
-                    hdr.set_invalid()
-
-            elif prim["op"] == "add_header":
-                assert len(prim["parameters"]) == 1
-                param = prim["parameters"][0]
-                assert param["type"] == "header"
-                bus.packet.add_header(param["value"])
+            self.__primitive(prim, bus, runtime_data)
 
-            else:
-                assert self.__extern is not None
-
-                extern_func_name = prim["op"]
+    @Trace(logger)
+    def process_batch(self, buses, runtime_data):
+        """Execute the action on a batch of buses with the same runtime parameters.
 
-                # If an extern clashes with a python keyword prepend with extern_
-                if extern_func_name in set(["assert"]):
-                    extern_func_name = f"extern_{extern_func_name}"
+        The action runs one primitive at a time over the whole batch. The right-hand side of an
+        assignment that depends on neither the bus nor an extern is evaluated once for the batch.
+        An action that calls externs runs packet by packet instead as externs may share state
+        between the primitives of an action, e.g. to read, modify and write a register.
 
-                extern_func = getattr(self.__extern, extern_func_name)
+        Parameters
+        ----------
+        buses : list of `pyp4.bus.Bus`
+            The metadata + headers buses.
+        runtime_data : list of `str`
+            The runtime parameters.
 
-                param_list = tuple(
-                    expr.param(bus, param, runtime_data) for param in prim["parameters"]
-                )
+        """
+        primitives = self.__bm_action["primitives"]
+        if not all(prim["op"] in self.__BUILTIN_OPS for prim in primitives):
+            for bus in buses:
+                self.process(bus, runtime_data)
+            return
+
+        for prim in primitives:
+            if (prim["op"] == "assign") and self.__is_constant(prim["parameters"][1]):
+                right = expr.rval(None, prim["parameters"][1], runtime_data)
+                self.logger.debug(f"op-assign-rval={right}")
+                for bus in buses:
+                    expr.lval(bus, prim["parameters"][0], runtime_data).val = right
+            else:
+                for bus in buses:
+                    self.__primitive(prim, bus, runtime_data)
+
+    @classmethod
+    def __is_constant(cls, expression):
+        return ("op" not in expression) and (expression.get("type") in cls.__CONSTANT_TYPES)
+
+    def __primitive(self, prim, bus, runtime_data):
+        self.logger.debug(
+            f"op-{prim['op']}-\"{prim.get('source_info', {}).get('source_fragment', '')}\""
+        )
+        if prim["op"] == "assign":
+            assert len(prim["parameters"]) == 2
+            left = expr.lval(bus, prim["parameters"][0], runtime_data)
+            right = expr.rval(bus, prim["parameters"][1], runtime_data)
+            self.logger.debug(f"rval={right}")
+            left.val = right
+
+        elif prim["op"] == "remove_header":
+            assert len(prim["parameters"]) == 1
+            param = prim["parameters"][0]
+            assert param["type"] == "header"
+
+            hdr_name = param["value"]
+            if hdr_name in bus.packet:
+                hdr = bus.get_hdr(hdr_name)
+                hdr.set_invalid()
+
+        elif prim["op"] == "add_header":
+            assert len(prim["parameters"]) == 1
+            param = prim["parameters"][0]
+            assert param["type"] == "header"
+            bus.packet.add_header(param["value"])
+
+        else:
+            assert self.__extern is not None
+
+            extern_func_name = prim["op"]
+
+            # If an extern clashes with a python keyword prepend with extern_
+            if extern_func_name in set(["assert"]):
+                extern_func_name = f"extern_{extern_func_name}"
+
+            extern_func = getattr(self.__extern, extern_func_name)
+
+            param_list = tuple(
+                expr.param(bus, param, runtime_data) for param in prim["parameters"]
+            )
 
-                self.logger.debug(f"{extern_func_name}{param_list}")
+            self.logger.debug(f"{extern_func_name}{param_list}")
+            if getattr(extern_func, "bus_extern", False):
+                extern_func(bus, *param_list)
+            else:
                 extern_func(*param_list)
@@ -0,0 +1,248 @@
+"""Columnar representation of a batch of packets."""
+
+from array import array
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from pyp4 import PacketIO
+from pyp4.binary import BinaryPacket
+from pyp4.bus import Bus
+from pyp4.layout import HeaderType
+from pyp4.packet import Header
+from pyp4.process import Process
+
+# The array type codes of unsigned integers keyed on their size in bytes.
+_TYPECODES = {array(code).itemsize: code for code in "LQIHB"}
+
+Column = Union[array, List]
+
+
+def _zero_column(bitwidth: Optional[int], size: int) -> Column:
+    """A zero-initialised column for a field.
+
+    Fields of up to 64 bits are stored in an `array` of the smallest unsigned integer type that fits
+    them. Wider and variable-size fields are stored in a list.
+
+    """
+    if (bitwidth is not None) and (bitwidth <= 64):
+        bytewidth = (bitwidth + 7) // 8
+        itemsize = min(itemsize for itemsize in _TYPECODES if itemsize >= bytewidth)
+        return array(_TYPECODES[itemsize], bytes(itemsize * size))
+    return [0] * size
+
+
+class PacketBatch:
+    """A batch of packets of one process stored field by field.
+
+    Every field of every packet header and metadata struct is stored as one column holding the value
+    of the field for each packet in the batch. A header that is invalid in a packet has zero values.
+    The validity of the packet headers is stored as a matrix with one row per header and one column
+    per packet.
+
+    Parameters
+    ----------
+    process
+        The process whose header layouts the batch uses.
+    size
+        The number of packets in the batch. All packets start with zero metadata and no valid
+        headers.
+
+    """
+    # pylint: disable=too-many-instance-attributes
+    # Reason: the columns are kept with the header and metadata layouts that they are decoded with.
+
+    def __init__(self, process: Process, size: int):
+        self.__process = process
+        self.__size = size
+
+        self.__header_types = {name: process.header_type(name) for name in process.header_names}
+        self.__metadata_types = {
+            name: process.header_type(name, metadata=True) for name in process.used_metadata
+        }
+
+        self.__columns = {}
+        for name, header_type in {**self.__metadata_types, **self.__header_types}.items():
+            self.__columns[name] = {
+                field_name: _zero_column(None if width is None else width.bitwidth, size)
+                for field_name, width in zip(header_type.names, header_type.widths)
+            }
+
+        self.__validity = {name: bytearray(size) for name in self.__header_types}
+        self.__unparsed = [None] * size
+        self.__parser_errors = _zero_column(32, size)
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @classmethod
+    def from_packets(
+            cls, process: Process, packets: Iterable[BinaryPacket], parser: str = "parser",
+    ) -> 'PacketBatch':
+        """Parse binary packets into a batch.
+
+        Each packet is run through the parser to find its valid headers. The fields are then
+        decoded per header for the whole batch at once with a single `struct.iter_unpack` over the
+        wire bytes of that header in all packets.
+
+        Parameters
+        ----------
+        process
+            The process whose parser to use. Its packet IO must be `pyp4.PacketIO.BINARY`.
+        packets
+            The packets to parse.
+        parser : optional
+            The name of the parser to use.
+
+        Returns
+        -------
+        :
+            The parsed batch.
+
+        """
+        if process.packet_io != PacketIO.BINARY:
+            raise ValueError("Only PacketIO.BINARY packets can be parsed into a batch")
+        packets = list(packets)
+        batch = cls(process, len(packets))
+        batch.__parse(process.parsers[parser], packets)
+        return batch
+
+    def __parse(self, parser, packets: List[BinaryPacket]) -> None:
+        # pylint: disable=unused-private-member
+        # reason: parse calls it on the batch it creates, which pylint does not recognise
+        # The wire bytes of each header and the indices of the packets they belong to.
+        wires = {name: [] for name in self.__header_types}
+        indices = {name: [] for name in self.__header_types}
+
+        for index, packet in enumerate(packets):
+            bus = self.__process.bus()
+            self.__parser_errors[index] = parser.process(bus, packet)
+            self.__unparsed[index] = bus.packet.unparsed
+
+            for name, header_type in self.__header_types.items():
+                if not bus.packet.is_valid(name):
+                    continue
+                header = bus.packet[name]
+                self.__validity[name][index] = 1
+                if header_type.struct_format is None:
+                    # Variable-size headers are decoded one by one.
+                    self.__store_header(name, header, index)
+                else:
+                    wires[name].append(header.to_bytes() if header.dirty else header.wire)
+                    indices[name].append(index)
+
+            # The parser may set metadata.
+            for name, metadata in bus.metadata.created.items():
+                self.__store_header(name, metadata, index)
+
+            self.__process.release(bus)
+
+        for name, header_type in self.__header_types.items():
+            if wires[name]:
+                self.__unpack(name, header_type, b"".join(wires[name]), indices[name])
+
+    def __store_header(self, name: str, header: Header, index: int) -> None:
+        columns = self.__columns[name]
+        for field_name, value in header.as_dict().items():
+            columns[field_name][index] = value
+        if header.varbit is not None:
+            # The variable-size field keeps its bytes so that its bitwidth is known.
+            field_name = header.header_type.names[header.header_type.varbit]
+            columns[field_name][index] = bytes(header.varbit.to_bytes())
+
+    def __unpack(
+            self, name: str, header_type: HeaderType, binary: bytes, indices: List[int],
+    ) -> None:
+        # Transpose the rows of unpacked integers into one sequence per struct code.
+        unpacked = iter(zip(*struct.iter_unpack(header_type.struct_format, binary)))
+        columns = self.__columns[name]
+        for field_name, chunks in zip(header_type.names, header_type.struct_chunks):
+            values = next(unpacked)
+            if chunks is not None:
+                # Reassemble the fields that were split into several integers.
+                values = [value << chunks[0][0] for value in values]
+                for shift, _ in chunks[1:]:
+                    values = [value | (low << shift) for value, low in zip(values, next(unpacked))]
+            self.__store(columns, field_name, values, indices)
+
+    def __store(self, columns: Dict, field_name: str, values, indices: List[int]) -> None:
+        column = columns[field_name]
+        if len(indices) == self.__size:
+            columns[field_name] = (
+                array(column.typecode, values) if isinstance(column, array) else list(values)
+            )
+        else:
+            for index, value in zip(indices, values):
+                column[index] = value
+
+    @property
+    def process(self) -> Process:
+        """The process whose header layouts the batch uses."""
+        return self.__process
+
+    @property
+    def columns(self) -> Dict[str, Dict[str, Column]]:
+        """The columns keyed on the header or metadata name and then on the field name.
+
+        Variable-size fields hold the bytes of the field.
+        """
+        return self.__columns
+
+    @property
+    def validity(self) -> Dict[str, bytearray]:
+        """The validity matrix keyed on the header name with one byte per packet."""
+        return self.__validity
+
+    @property
+    def unparsed(self) -> List[Optional[BinaryPacket]]:
+        """The unparsed part of each packet."""
+        return self.__unparsed
+
+    @property
+    def parser_errors(self) -> array:
+        """The error code the parser returned for each packet."""
+        return self.__parser_errors
+
+    def bus(self, index: int) -> Bus:
+        """Get one packet of the batch as a bus.
+
+        Parameters
+        ----------
+        index
+            The index of the packet in the batch.
+
+        Returns
+        -------
+        :
+            A bus of the batch's process holding the metadata and headers of the packet.
+
+        """
+        bus = self.__process.bus()
+        for name in self.__metadata_types:
+            self.__load(bus.metadata[name], name, index)
+
+        for name in self.__header_types:
+            if self.__validity[name][index]:
+                bus.packet.add_header(name)
+                self.__load(bus.packet[name], name, index)
+        bus.packet.unparsed = self.__unparsed[index]
+        return bus
+
+    def __load(self, header: Header, name: str, index: int) -> None:
+        for field_name, column in self.__columns[name].items():
+            value = column[index]
+            if isinstance(value, bytes):
+                header.set_varbit_bitwidth(len(value) * 8)
+                header[field_name].from_bytes(value)
+            else:
+                header[field_name].set_unchecked(value)
+
+    def buses(self) -> Iterator[Bus]:
+        """Get all packets of the batch as buses in order.
+
+        Returns
+        -------
+        :
+            An iterator over the buses of the packets.
+
+        """
+        return (self.bus(index) for index in range(self.__size))
@@ -0,0 +1,331 @@
+"""Binary packets."""
+
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+class BinaryPacket:
+    """A packet in binary.
+
+    The packet does not copy the binary it is constructed or extended with. It keeps a list of
+    views (segments) into the provided buffers and parses through them with an internal pointer.
+    Any object supporting the buffer protocol can be used, e.g. ``bytes``, ``bytearray``,
+    ``memoryview`` or ``mmap.mmap``. The provided buffers must not be modified whilst the packet is
+    in use. A packet compares equal to the bytes it is made up of.
+
+    A packet may also reserve headroom: writable space in front of the packet that a deparser can
+    prepend headers into without copying the payload (see `~pyp4.DeparseMode.HEADROOM`). Bytes that
+    have already been parsed can also be reused as headroom if the underlying buffer is writable.
+
+    Parameters
+    ----------
+    binary : optional
+        The initial binary of the packet.
+    headroom : optional
+        The number of bytes to reserve in front of the packet. Reserving headroom requires copying
+        ``binary`` once into a new buffer.
+
+    """
+
+    def __init__(self, binary: Optional[Any] = None, headroom: int = 0):
+        self.__segments = []
+        self.__offsets = []
+        # For each segment, the buffer it is a view of and the segment's start within that buffer.
+        self.__bases = []
+        self.__base_starts = []
+        self.__length = 0
+        self.__ptr = 0
+        self.__claimed = False
+
+        if headroom:
+            binary = bytes(binary) if binary is not None else b""
+            buffer = bytearray(headroom + len(binary))
+            buffer[headroom:] = binary
+            self.__append(memoryview(buffer), headroom, len(buffer))
+        elif binary is not None:
+            self.extend(binary)
+
+    def __repr__(self) -> str:
+        return f"BinaryPacket({bytes(self)!r}, ptr={self.__ptr})"
+
+    def __deepcopy__(self, memo: Dict) -> 'BinaryPacket':
+        # pylint: disable=protected-access,unused-private-member
+        # reason: there is no public way to move the pointer of a packet that was not parsed
+        packet = BinaryPacket(bytes(self))
+        packet.__ptr = self.__ptr
+        memo[id(self)] = packet
+        return packet
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def copy(self) -> 'BinaryPacket':
+        """A copy of the packet which shares its buffers.
+
+        No bytes are copied. As the buffers are shared, neither this packet nor the copy can claim
+        headroom afterwards.
+
+        Returns
+        -------
+        :
+            The copy of the packet with the same internal pointer.
+
+        """
+        # pylint: disable=protected-access,unused-private-member
+        # reason: the segment tables are copied as they are rather than extended view by view
+        packet = BinaryPacket()
+        packet.__segments = self.__segments.copy()
+        packet.__offsets = self.__offsets.copy()
+        packet.__bases = self.__bases.copy()
+        packet.__base_starts = self.__base_starts.copy()
+        packet.__length = self.__length
+        packet.__ptr = self.__ptr
+        packet.__claimed = True
+        self.__claimed = True
+        return packet
+
+    def __bytes__(self) -> bytes:
+        return b"".join(self.__segments)
+
+    def __eq__(self, other: Any) -> bool:
+        # Packets compare equal to packets and to bytes-like objects with the same bytes.
+        if isinstance(other, BinaryPacket):
+            return (self.__length == len(other)) and (bytes(self) == bytes(other))
+        try:
+            other = memoryview(other)
+        except TypeError:
+            return NotImplemented
+        return (self.__length == other.nbytes) and (bytes(self) == other.tobytes())
+
+    __hash__ = None
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[int, memoryview, bytes]:
+        # Indices are relative to the start of the packet and not the internal pointer. Only a slice
+        # that spans multiple segments needs to be copied.
+        if isinstance(key, slice):
+            (start, stop, step) = key.indices(self.__length)
+            if step != 1:
+                return bytes(self)[key]
+            return self.__view(start, max(start, stop))
+        if key < 0:
+            key += self.__length
+        if not 0 <= key < self.__length:
+            raise IndexError("BinaryPacket index out of range")
+        index = bisect_right(self.__offsets, key) - 1
+        return self.__segments[index][key - self.__offsets[index]]
+
+    def extend(self, binary: Any) -> None:
+        """Extend the packet.
+
+        The binary is not copied, the packet only keeps a view of it.
+
+        Parameters
+        ----------
+        binary
+            The binary to add to the end of the packet.
+        """
+        base = memoryview(binary)
+        if (base.ndim != 1) or (base.format != "B"):
+            base = base.cast("B")
+        if base.nbytes:
+            self.__append(base, 0, base.nbytes)
+
+    def __append(self, base: memoryview, start: int, end: int) -> None:
+        self.__segments.append(base[start:end])
+        self.__offsets.append(self.__length)
+        self.__bases.append(base)
+        self.__base_starts.append(start)
+        self.__length += end - start
+
+    def reset(self) -> None:
+        """Reset the internal packet pointer."""
+        self.__ptr = 0
+
+    def __view(self, start: int, end: int) -> memoryview:
+        if start == end:
+            return memoryview(b"")
+
+        index = bisect_right(self.__offsets, start) - 1
+        offset = self.__offsets[index]
+        segment = self.__segments[index]
+        if (end - offset) <= segment.nbytes:
+            return segment[(start - offset):(end - offset)]
+
+        # The requested bytes span multiple segments, only this case requires a copy.
+        pieces = []
+        while start < end:
+            offset = self.__offsets[index]
+            segment = self.__segments[index]
+            pieces.append(segment[(start - offset):(end - offset)])
+            start = offset + segment.nbytes
+            index += 1
+        return memoryview(b"".join(pieces))
+
+    def get_next(self, bytewidth: int) -> memoryview:
+        """Get the next bytes of the packet from the start of the internal pointer.
+
+        This moves the internal packet pointer the same number of bytes.
+
+        Parameters
+        ----------
+        bytewidth
+            The number of bytes to extract.
+
+        Returns
+        -------
+        :
+            A view of the next ``bytewidth`` bytes. The bytes are only copied if they span more than
+            one segment.
+
+        """
+        start = self.__ptr
+        end = self.__ptr + bytewidth
+        if end > self.__length:
+            raise ValueError
+        self.__ptr = end
+        return self.__view(start, end)
+
+    def peek(self, bitoffset: int, bitwidth: int) -> int:
+        """Get the value of the bits at an offset from the internal pointer without moving it.
+
+        Parameters
+        ----------
+        bitoffset
+            The offset in bits from the internal pointer.
+        bitwidth
+            The number of bits to read.
+
+        Returns
+        -------
+        :
+            The unsigned big-endian value of the bits.
+
+        """
+        start = self.__ptr + (bitoffset // 8)
+        end = self.__ptr + ((bitoffset + bitwidth + 7) // 8)
+        if end > self.__length:
+            raise ValueError
+        value = int.from_bytes(self.__view(start, end), byteorder="big", signed=False)
+        shift = ((end - start) * 8) - (bitoffset % 8) - bitwidth
+        return (value >> shift) & ((1 << bitwidth) - 1)
+
+    def get_remaining(self) -> memoryview:
+        """Get the remaining bytes of the packet from the start of the internal pointer.
+
+        This moves the internal packet pointer to the end of the packet.
+
+        Returns
+        -------
+        :
+            A view of the remaining bytes. The bytes are only copied if they span more than one
+            segment.
+
+        """
+        return self.get_next(self.__length - self.__ptr)
+
+    def remaining_segments(self) -> List[memoryview]:
+        """Get views of the remaining bytes of the packet from the start of the internal pointer.
+
+        Unlike :py:meth:`get_remaining`, this never copies and does not move the internal pointer.
+
+        Returns
+        -------
+        :
+            Views of the remaining bytes, one per segment.
+
+        """
+        if self.__ptr == self.__length:
+            return []
+
+        index = bisect_right(self.__offsets, self.__ptr) - 1
+        views = [self.__segments[index][(self.__ptr - self.__offsets[index]):]]
+        views.extend(self.__segments[(index + 1):])
+        return views
+
+    @property
+    def position(self) -> int:
+        """The position of the internal pointer from the start of the packet."""
+        return self.__ptr
+
+    def from_position(self, position: int) -> 'BinaryPacket':
+        """Get the bytes of the packet from the provided position onwards as a new packet.
+
+        The new packet shares the buffers of this packet and no bytes are copied.
+
+        Parameters
+        ----------
+        position
+            The position from the start of the packet.
+
+        Returns
+        -------
+        :
+            A new packet made up of the bytes from ``position`` to the end of this packet.
+
+        """
+        assert 0 <= position <= self.__length
+        if position == self.__length:
+            return BinaryPacket()
+        index = bisect_right(self.__offsets, position) - 1
+        base_start = self.__base_starts[index] + (position - self.__offsets[index])
+        return self.__packet_from(index, base_start)
+
+    def __packet_from(self, index: int, base_start: int) -> 'BinaryPacket':
+        """A new packet that starts at ``base_start`` in the buffer of segment ``index``."""
+        # pylint: disable=protected-access
+        # reason: the segments keep their base buffers, which extend would replace by the views
+        packet = BinaryPacket()
+        for next_index in range(index, len(self.__segments)):
+            packet.__append(
+                self.__bases[next_index],
+                base_start if next_index == index else self.__base_starts[next_index],
+                self.__base_starts[next_index] + self.__segments[next_index].nbytes,
+            )
+        return packet
+
+    def __pointer_position(self) -> Tuple[int, int]:
+        """The index of the segment at the pointer and the pointer's position in its buffer."""
+        index = bisect_right(self.__offsets, self.__ptr) - 1
+        return index, self.__base_starts[index] + (self.__ptr - self.__offsets[index])
+
+    @property
+    def headroom(self) -> int:
+        """The number of writable bytes directly in front of the internal pointer.
+
+        This includes the bytes that have already been parsed as well as any reserved headroom. It
+        is zero if the underlying buffer is read-only or if the headroom has already been claimed.
+
+        """
+        if self.__claimed or not self.__segments:
+            return 0
+        index, position = self.__pointer_position()
+        if self.__bases[index].readonly:
+            return 0
+        return position
+
+    def claim_headroom(self, bytewidth: int) -> Tuple[memoryview, 'BinaryPacket']:
+        """Claim headroom directly in front of the internal pointer.
+
+        The headroom can only be claimed once as any subsequent claim would overwrite the data
+        written into the first claim.
+
+        Parameters
+        ----------
+        bytewidth
+            The number of bytes to claim.
+
+        Returns
+        -------
+        :
+            A writable view of the claimed bytes and a new packet that starts with the claimed bytes
+            and is followed by the remaining bytes of this packet. Neither involves a copy.
+
+        """
+        if bytewidth > self.headroom:
+            raise ValueError(f"Cannot claim {bytewidth} bytes of headroom : "
+                             f"only {self.headroom} bytes available")
+        self.__claimed = True
+
+        index, position = self.__pointer_position()
+        region = self.__bases[index][(position - bytewidth):position]
+        return region, self.__packet_from(index, position - bytewidth)
@@ -1,5 +1,7 @@
 """P4-programmable blocks."""
 
+from functools import partial
+
 from pyp4.table import Conditional, Table
 from pyp4.trace import get_logger, Trace
 
@@ -17,29 +19,56 @@ class Block:
         Block definition in BM JSON format.
     actions : dict of {`int` -> `pyp4.action.Action`}
         The dictionary of actions keyed on the action ID.
+    field_bitwidth : Callable[[`str`, `str`], `int`], optional
+        Get the bitwidth of a field from its header and field names.
+    table_hit : Callable[[`str`, `int`, `pyp4.bus.Bus`], None], optional
+        Called with the table name, the entry handle and the bus when a table with direct counters
+        or meters hits an entry, before the action of the entry runs.
+    table_reset : Callable[[`str`, `int`], None], optional
+        Called with the table name and the entry handle when an entry is inserted into a table with
+        direct counters or meters and with the table name and None when such a table is reset.
 
     """
+    # pylint: disable=too-many-instance-attributes
+    # Reason: the block also holds the direct resource hook and the tables it applies to.
 
     @Trace(logger)
-    def __init__(self, process_name, bm_block, actions):
+    def __init__(
+            self, process_name, bm_block, actions, field_bitwidth=None, table_hit=None,
+            table_reset=None,
+    ):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # Reason: the direct resource hooks are optional and only passed by processors with them.
         self.__process_name = process_name
         self.__bm_block = bm_block
         self.__actions = actions
         self.logger = None
 
+        # The tables with direct resources and the hook that updates them.
+        self.__table_hit = table_hit
+        self.__direct_tables = frozenset(
+            tab["name"] for tab in self.__bm_block["tables"]
+            if tab.get("with_counters") or tab.get("direct_meters")
+        ) if table_hit is not None else frozenset()
+
         # Mappings required for tables.
         action_id_to_name = {act_id: act.name for act_id, act in self.__actions.items()}
         action_name_to_id = {act.name: act_id for act_id, act in self.__actions.items()}
 
         # Separate tables and conditionals as that's what BM does
         self.__tables = {
-            tab["name"]: Table(self.__process_name, tab, action_id_to_name, action_name_to_id)
+            tab["name"]: Table(
+                self.__process_name, tab, action_id_to_name, action_name_to_id, field_bitwidth,
+                partial(table_reset, tab["name"])
+                if (table_reset is not None) and (tab["name"] in self.__direct_tables) else None,
+            )
             for tab in self.__bm_block["tables"]
         }
         self.__conditionals = {
             cond["name"]: Conditional(self.__process_name, cond)
             for cond in self.__bm_block["conditionals"]
         }
+        self.__order = None
 
     @property
     def name(self):
@@ -66,7 +95,7 @@ class Block:
         ----------
         conditional : `pyp4.table.Conditional`
             Conditional definition in BM JSON format.
-        bus : `pyp4.packet.Bus`
+        bus : `pyp4.bus.Bus`
             The metadata + headers bus.
 
         Returns
@@ -84,7 +113,7 @@ class Block:
         ----------
         table : `pyp4.table.Table`
             The table definition in BM JSON format.
-        bus : `pyp4.packet.Bus`
+        bus : `pyp4.bus.Bus`
             The metadata + headers bus.
 
         Returns
@@ -94,6 +123,8 @@ class Block:
 
         """
         apply_result = table.apply(bus)
+        if apply_result.hit and (table.name in self.__direct_tables):
+            self.__table_hit(table.name, apply_result.entry_handle, bus)
         action_id = apply_result.action_run.action_id
         action_data = apply_result.action_run.action_data
         action = self.__actions[action_id]
@@ -107,7 +138,7 @@ class Block:
 
         Parameters
         ----------
-        bus : `pyp4.packet.Bus`
+        bus : `pyp4.bus.Bus`
             The metadata + headers bus.
 
         """
@@ -125,3 +156,114 @@ class Block:
                 next_table = self.__conditional(self.__conditionals[next_table], bus)
 
         self.logger.debug(f"next_table={next_table}")
+
+    def __successors(self, name):
+        if name in self.__tables:
+            return self.__tables[name].next_tables
+        conditional = self.__conditionals[name]
+        return (conditional.true_next, conditional.false_next)
+
+    def __topological_order(self):
+        """Order the tables and conditionals such that each comes before all its successors.
+
+        Returns
+        -------
+        list of `str`
+            The names of the tables and conditionals reachable from the initial table.
+
+        """
+        order = []
+        visited = set()
+        # Iterative depth-first search which appends each node after all its successors.
+        stack = [(self.__bm_block["init_table"], False)]
+        while stack:
+            (name, done) = stack.pop()
+            if done:
+                order.append(name)
+                continue
+            if (name is None) or (name in visited):
+                continue
+            visited.add(name)
+            stack.append((name, True))
+            stack.extend((successor, False) for successor in self.__successors(name))
+        order.reverse()
+        return order
+
+    @Trace(logger)
+    def process_batch(self, buses):
+        """Process the block stage by stage over a batch of buses.
+
+        Each table and conditional is applied to all the buses that reach it before moving on to
+        the next one in topological order. The buses that take different branches are split into
+        sub-batches which merge again where the branches join. Each bus goes through the same
+        tables and actions as with `process`. Externs with state shared between packets may
+        however see the packets in a different order.
+
+        Parameters
+        ----------
+        buses : list of `pyp4.bus.Bus`
+            The metadata + headers buses.
+
+        """
+        if self.__order is None:
+            self.__order = self.__topological_order()
+
+        # The indices of the buses waiting at each table or conditional.
+        pending = {}
+        if self.__bm_block["init_table"] is not None:
+            pending[self.__bm_block["init_table"]] = list(range(len(buses)))
+        for name in self.__order:
+            indices = pending.pop(name, None)
+            if not indices:
+                continue
+            # Keep the sub-batches in the order of the batch when branches merge.
+            indices.sort()
+            self.logger.debug(f"next_table={name}; batch={len(indices)}")
+
+            batch = [buses[index] for index in indices]
+            if name in self.__tables:
+                next_tables = self.__table_batch(self.__tables[name], batch)
+            else:
+                next_tables = [self.__conditional(self.__conditionals[name], bus) for bus in batch]
+
+            for index, next_table in zip(indices, next_tables):
+                if next_table is not None:
+                    pending.setdefault(next_table, []).append(index)
+
+        assert not pending
+
+    def __table_batch(self, table, buses):
+        """Apply a table to a batch of buses.
+
+        Parameters
+        ----------
+        table : `pyp4.table.Table`
+            The table definition in BM JSON format.
+        buses : list of `pyp4.bus.Bus`
+            The metadata + headers buses.
+
+        Returns
+        -------
+        list of `str`
+            The name of the next table of each bus.
+
+        """
+        result = table.apply_batch(table.key_columns(buses), len(buses))
+
+        if table.name in self.__direct_tables:
+            for bus, hit, index in zip(buses, result.hits, result.action_data_indices):
+                if hit:
+                    self.__table_hit(table.name, result.entry_handles[index], bus)
+
+        # Run each action once over all the buses with the same action and action data.
+        action_buses = {}
+        for bus, index in zip(buses, result.action_data_indices):
+            action_buses.setdefault(index, []).append(bus)
+
+        for index, buses_of_action in action_buses.items():
+            action_run = result.action_runs[index]
+            action = self.__actions[action_run.action_id]
+            assert action.name == action_run.action_name
+            action.process_batch(buses_of_action, action_run.action_data)
+
+        return [table.next_table(apply_result) for apply_result in result.apply_results()]
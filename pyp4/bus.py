@@ -0,0 +1,156 @@
+"""The metadata + headers bus."""
+
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from pyp4.packet import Header, Packet
+
+
+class Metadata(Mapping):
+    """The metadata structs of a bus keyed on their names.
+
+    A struct is only created, zero-initialised, when it is first accessed. Iterating over the
+    metadata creates all of its structs, whereas :py:attr:`created` only includes those that have
+    already been created.
+
+    Parameters
+    ----------
+    names
+        The names of the metadata structs.
+    factory : optional
+        Creates a new zero-initialised struct given its name.
+    structs : optional
+        Structs that have already been created keyed on their names.
+
+    """
+
+    def __init__(
+            self,
+            names: Iterable[str],
+            factory: Optional[Callable[[str], Header]] = None,
+            structs: Optional[Dict[str, Header]] = None,
+    ):
+        self.__names = dict.fromkeys(names)
+        self.__factory = factory
+        self.__structs = structs if structs is not None else {}
+        assert (factory is not None) or (len(self.__structs) == len(self.__names))
+
+    def __repr__(self) -> str:
+        return repr(self.__structs)
+
+    def __getitem__(self, name: str) -> Header:
+        struct = self.__structs.get(name)
+        if struct is None:
+            if name not in self.__names:
+                raise KeyError(name)
+            struct = self.__structs[name] = self.__factory(name)
+        return struct
+
+    def __iter__(self):
+        return iter(self.__names)
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def __contains__(self, name: Any) -> bool:
+        return name in self.__names
+
+    def get(self, key: str, default: Optional[Any] = None) -> Optional[Header]:
+        # Avoid raising and catching a KeyError for every name that is not metadata.
+        return self[key] if key in self.__names else default
+
+    @property
+    def created(self) -> Dict[str, Header]:
+        """The structs that have been created so far keyed on their names."""
+        return self.__structs
+
+    def copy(self) -> 'Metadata':
+        """A copy of the metadata with copies of the structs created so far.
+
+        Returns
+        -------
+        :
+            The copy of the metadata.
+
+        """
+        return Metadata(
+            self.__names,
+            self.__factory,
+            {name: struct.copy() for name, struct in self.__structs.items()},
+        )
+
+
+class Bus:
+    """The metadata + headers bus.
+
+    Parameters
+    ----------
+    metadata
+        Architecture defined metadata mapped by name.
+    packet
+        The internal packet representation.
+
+    """
+
+    def __init__(self, metadata: Union[Dict[str, Header], Metadata], packet: Packet):
+        if not isinstance(metadata, Metadata):
+            metadata = Metadata(metadata, structs=dict(metadata))
+        self.__metadata = metadata
+        self.__packet = packet
+        self.__requests = {}
+
+    def __repr__(self) -> str:
+        """Create a string representation of  Bus."""
+        return repr({**self.__metadata.created, "packet": self.__packet})
+
+    def reset(self) -> None:
+        """Reset the metadata and the packet to the state of a new bus so that it can be reused."""
+        for struct in self.__metadata.created.values():
+            struct.reset()
+            struct.set_valid()
+        self.__packet.reset()
+        self.__requests.clear()
+
+    def clone(self) -> 'Bus':
+        """A clone of the bus.
+
+        The clone has copies of all metadata and packet headers. It shares their header types and
+        wire bytes which are never modified. The clone has no requests.
+        """
+        return Bus(self.__metadata.copy(), self.__packet.copy())
+
+    @property
+    def metadata(self) -> Metadata:
+        """Dictionary of all the metadata blocks."""
+        return self.__metadata
+
+    @property
+    def packet(self) -> Packet:
+        """The packet itself."""
+        return self.__packet
+
+    @property
+    def requests(self) -> Dict[str, Any]:
+        """The requests externs made to the architecture keyed on the request name.
+
+        The architecture acts on the requests at the end of a pipeline stage, e.g. to clone or to
+        resubmit the packet.
+        """
+        return self.__requests
+
+    def get_hdr(self, name: str) -> Header:
+        """Get a metadata/header.
+
+        Parameters
+        ----------
+        name
+            The name of the metadata/header.
+
+        Returns
+        -------
+        :
+            The metadata/header.
+
+        """
+        hdr = self.__metadata.get(name)
+        return hdr if hdr is not None else self.__packet[name]
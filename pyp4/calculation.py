@@ -0,0 +1,548 @@
+"""Hash and checksum calculations.
+
+A calculation of a program in BM JSON format hashes a list of fields with one of the algorithms
+of BMv2. The algorithms are kept in a registry keyed on their BM names so that more can be added
+with :py:func:`register_algorithm`. All the algorithms produce the same outputs as BMv2. A
+checksum of a program verifies or updates a field with a calculation.
+"""
+
+from array import array
+from functools import lru_cache
+import sys
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import zlib
+
+from pyp4 import expr
+from pyp4.bus import Bus
+from pyp4.packet import Header
+
+# A hash algorithm maps the serialised input to an unsigned integer.
+Algorithm = Callable[[bytes], int]
+
+
+def _reflect(value: int, width: int) -> int:
+    """Reverse the order of the lowest ``width`` bits of a value."""
+    return int(format(value, f"0{width}b")[::-1], 2)
+
+
+@lru_cache(maxsize=None)
+def _crc_table(width: int, polynomial: int, reflected: bool) -> array:
+    """The 256-entry lookup table of a CRC which processes a byte at a time."""
+    mask = (1 << width) - 1
+    table = array("Q" if width > 32 else "L")
+    if reflected:
+        polynomial = _reflect(polynomial, width)
+        for byte in range(256):
+            crc = byte
+            for _ in range(8):
+                crc = (crc >> 1) ^ polynomial if crc & 1 else crc >> 1
+            table.append(crc)
+    else:
+        top_bit = 1 << (width - 1)
+        for byte in range(256):
+            crc = byte << (width - 8)
+            for _ in range(8):
+                crc = ((crc << 1) ^ polynomial) if crc & top_bit else (crc << 1)
+            table.append(crc & mask)
+    return table
+
+
+class Crc:
+    """A table-driven cyclic redundancy check.
+
+    The CRC is parametrised as in the Rocksoft model which BMv2 uses for its custom CRCs. The CRC
+    processes a byte at a time with a precomputed 256-entry table that is shared by all CRCs with
+    the same polynomial. The CRC-32 of zlib is used where it is bit-compatible.
+
+    Parameters
+    ----------
+    width
+        The width of the CRC in bits, a multiple of 8 of at most 64.
+    polynomial
+        The generator polynomial without its top bit.
+    initial : optional
+        The initial value of the register.
+    final_xor : optional
+        The value to XOR the result with.
+    reflect_input : optional
+        Whether the bits of each input byte are processed least significant bit first.
+    reflect_output : optional
+        Whether the bits of the result are reversed before the final XOR.
+
+    """
+    # pylint: disable=too-many-instance-attributes
+    # reason: the parameters are kept both as given and as derived for the table-driven loop
+
+    # The parameters of the CRC-32 computed by zlib.
+    __ZLIB_CRC32 = (32, 0x04C11DB7, 0xFFFFFFFF, 0xFFFFFFFF, True, True)
+
+    def __init__(
+            self,
+            width: int,
+            polynomial: int,
+            initial: int = 0,
+            final_xor: int = 0,
+            reflect_input: bool = False,
+            reflect_output: bool = False,
+    ):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # reason: these are the parameters of the Rocksoft model, in its order
+        if (width % 8 != 0) or not 8 <= width <= 64:
+            raise ValueError(f"Unsupported CRC width {width}")
+        mask = (1 << width) - 1
+        if any(value != (value & mask) for value in (polynomial, initial, final_xor)):
+            raise ValueError(f"CRC parameters do not fit in {width} bits")
+
+        self.__parameters = (
+            width, polynomial, initial, final_xor, bool(reflect_input), bool(reflect_output),
+        )
+        self.__width = width
+        self.__table = _crc_table(width, polynomial, bool(reflect_input))
+        self.__initial = _reflect(initial, width) if reflect_input else initial
+        self.__final_xor = final_xor
+        self.__reflect_input = bool(reflect_input)
+        self.__reflect_result = bool(reflect_input) != bool(reflect_output)
+        self.__zlib = self.__parameters == self.__ZLIB_CRC32
+
+    @property
+    def parameters(self) -> Tuple[int, int, int, int, bool, bool]:
+        """The width, polynomial, initial value, final XOR and input and output reflection."""
+        return self.__parameters
+
+    def __call__(self, data: bytes) -> int:
+        """Compute the CRC of the data."""
+        if self.__zlib:
+            return zlib.crc32(data)
+
+        table = self.__table
+        crc = self.__initial
+        if self.__reflect_input:
+            for byte in data:
+                crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+        else:
+            shift = self.__width - 8
+            mask = (1 << self.__width) - 1
+            for byte in data:
+                crc = table[((crc >> shift) ^ byte) & 0xff] ^ ((crc << 8) & mask)
+
+        if self.__reflect_result:
+            crc = _reflect(crc, self.__width)
+        return crc ^ self.__final_xor
+
+
+def csum16(data: bytes) -> int:
+    """The 16-bit ones' complement checksum of RFC 1071 as computed by BMv2's ``csum16``.
+
+    An odd number of bytes is padded with a zero byte.
+    """
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    # Adding the 16-bit words as one big integer and folding it is the same as adding them up one by
+    # one with end-around carry, as 2**16 is 1 modulo 2**16 - 1.
+    total = int.from_bytes(data, "big")
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def xor16(data: bytes) -> int:
+    """The XOR of the 16-bit words as computed by BMv2's ``xor16``.
+
+    An odd number of bytes is padded with a zero byte.
+    """
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    # XOR the words in native byte order and swap the bytes of the result if needed.
+    result = 0
+    for word in array("H", data):
+        result ^= word
+    if sys.byteorder == "little":
+        result = ((result & 0xff) << 8) | (result >> 8)
+    return result
+
+
+def identity(data: bytes) -> int:
+    """The first eight bytes as a big-endian integer as computed by BMv2's ``identity``."""
+    return int.from_bytes(data[:8], "big")
+
+
+# The factories of the algorithms keyed on their BM names. Each calculation gets its own instance
+# so that the parameters of custom CRCs can be set per calculation.
+_ALGORITHMS: Dict[str, Callable[[], Algorithm]] = {
+    "crc16": lambda: Crc(16, 0x8005, 0, 0, True, True),
+    "crc16_custom": lambda: Crc(16, 0x8005, 0, 0, True, True),
+    "crc32": lambda: Crc(32, 0x04C11DB7, 0xFFFFFFFF, 0xFFFFFFFF, True, True),
+    "crc32_custom": lambda: Crc(32, 0x04C11DB7, 0xFFFFFFFF, 0xFFFFFFFF, True, True),
+    "crcCCITT": lambda: Crc(16, 0x1021, 0xFFFF, 0, False, False),
+    "csum16": lambda: csum16,
+    "xor16": lambda: xor16,
+    "identity": lambda: identity,
+}
+
+
+def register_algorithm(name: str, factory: Callable[[], Algorithm]) -> None:
+    """Register a hash algorithm.
+
+    Parameters
+    ----------
+    name
+        The name of the algorithm in the BM JSON ``algo`` of calculations.
+    factory
+        Creates the algorithm for a calculation. The algorithm maps the serialised input of the
+        calculation to an unsigned integer.
+
+    """
+    _ALGORITHMS[name] = factory
+
+
+def algorithm(name: str) -> Algorithm:
+    """Create a registered hash algorithm.
+
+    Parameters
+    ----------
+    name
+        The name of the algorithm.
+
+    Returns
+    -------
+    :
+        The algorithm.
+
+    """
+    if name not in _ALGORITHMS:
+        raise NotImplementedError(f"Unsupported hash algorithm: {name}")
+    return _ALGORITHMS[name]()
+
+
+class Calculation:
+    """A hash calculation over a list of fields.
+
+    The fields are serialised as in BMv2: they are concatenated bit by bit into the fewest whole
+    bytes with zero bits in front of the first field. The values are concatenated into a single
+    integer which is converted into bytes once per calculation.
+
+    Parameters
+    ----------
+    bm_calculation
+        Calculation definition in BM JSON format.
+    field_bitwidth
+        Get the bitwidth of a field from its header and field names. A variable-size field has no
+        fixed bitwidth.
+
+    """
+
+    def __init__(
+            self,
+            bm_calculation: Dict,
+            field_bitwidth: Callable[[str, str], Optional[int]],
+    ):
+        self.__bm_calculation = bm_calculation
+        self.__algorithm = None
+        # Each input as (header name, field name, bitwidth) or (None, value, bitwidth).
+        input_ = []
+        for element in bm_calculation["input"]:
+            if element["type"] == "field":
+                (header_name, field_name) = element["value"]
+                input_.append((header_name, field_name, field_bitwidth(header_name, field_name)))
+            elif element["type"] == "hexstr":
+                input_.append((None, int(element["value"], 16), element["bitwidth"]))
+            else:
+                raise NotImplementedError(f"Unsupported calculation input: {element['type']}")
+        self.__input = tuple(input_)
+
+    @property
+    def name(self) -> str:
+        """The name of the calculation."""
+        return self.__bm_calculation["name"]
+
+    @property
+    def input(self) -> Tuple[Tuple[Optional[str], Union[str, int], Optional[int]], ...]:
+        """The inputs in order.
+
+        A field is given as (header name, field name, bitwidth), where a variable-size field has no
+        bitwidth, and a constant as (None, value, bitwidth).
+        """
+        return self.__input
+
+    @property
+    def algorithm(self) -> Algorithm:
+        """The hash algorithm of the calculation.
+
+        It is created from the registry when it is first used and may be replaced, e.g. by a
+        `Crc` with custom parameters.
+        """
+        if self.__algorithm is None:
+            self.__algorithm = algorithm(self.__bm_calculation["algo"])
+        return self.__algorithm
+
+    @algorithm.setter
+    def algorithm(self, function: Algorithm) -> None:
+        self.__algorithm = function
+
+    def values(self, bus: Bus) -> Tuple[int, ...]:
+        """Read the values of the inputs of a packet.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+
+        Returns
+        -------
+        :
+            The value of each input in order.
+
+        """
+        return tuple(
+            field_name if header_name is None else bus.get_hdr(header_name)[field_name].val
+            for header_name, field_name, _ in self.__input
+        )
+
+    def serialise(self, bus: Bus) -> bytes:
+        """Serialise the input fields of a packet.
+
+        As in BMv2, the fields of invalid headers are serialised as they are.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+
+        Returns
+        -------
+        :
+            The serialised input.
+
+        """
+        value = 0
+        nbits = 0
+        for header_name, field_name, bitwidth in self.__input:
+            if header_name is None:
+                field_value = field_name
+            else:
+                field = bus.get_hdr(header_name)[field_name]
+                field_value = field.val
+                if bitwidth is None:
+                    bitwidth = field.bitwidth
+            value = (value << bitwidth) | field_value
+            nbits += bitwidth
+        return value.to_bytes((nbits + 7) // 8, "big")
+
+    def compute(self, bus: Bus) -> int:
+        """Compute the hash of the input fields of a packet.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+
+        Returns
+        -------
+        :
+            The hash.
+
+        """
+        compute = self.algorithm
+        return compute(self.serialise(bus))
+
+
+class Checksum:
+    """A checksum that is verified after parsing and updated before deparsing.
+
+    A ``csum16`` checksum of fixed-size fields is updated incrementally as in RFC 1624 when the
+    packet changed only a few of its 16-bit words since it was verified, e.g. when the TTL of an
+    IPv4 header was decremented. Since 2**16 is 1 modulo 2**16 - 1, a field shifted left by ``n``
+    bits adds ``field << (n % 16)`` to the ones' complement sum, so the sum is updated with the
+    difference of each changed field instead of being computed over all the words again. The
+    fields of a header decoded from binary that were not written since are not read again. The
+    result is the same as that of a full computation.
+
+    Parameters
+    ----------
+    bm_checksum
+        Checksum definition in BM JSON format.
+    calculation
+        The calculation of the checksum.
+
+    """
+    # pylint: disable=too-many-instance-attributes
+    # reason: the per-input shifts, words and bits are precomputed for the incremental update
+
+    # A checksum is updated incrementally if at most this fraction of its words changed.
+    INCREMENTAL_WORDS = 0.5
+
+    def __init__(self, bm_checksum: Dict, calculation: Calculation):
+        if bm_checksum.get("type", "generic") != "generic":
+            raise NotImplementedError(f"Unsupported checksum type: {bm_checksum['type']}")
+        self.__bm_checksum = bm_checksum
+        self.__calculation = calculation
+        (self.__header_name, self.__field_name) = bm_checksum["target"]
+        self.__if_cond = bm_checksum.get("if_cond")
+        # Checksums without the flags are both verified and updated as in BMv2.
+        self.__verify = bm_checksum.get("verify", True)
+        self.__update = bm_checksum.get("update", True)
+
+        # The shift of each input within the ones' complement sum and the number of 16-bit words
+        # it spans. Only fixed-size inputs can be updated incrementally.
+        self.__shifts = None
+        bitwidths = [bitwidth for _, _, bitwidth in calculation.input]
+        if None not in bitwidths:
+            nbits = sum(bitwidths)
+            # An odd number of bytes is padded with a zero byte at the end.
+            shift = 8 if ((nbits + 7) // 8) % 2 else 0
+            shifts = []
+            for bitwidth in reversed(bitwidths):
+                shifts.append(shift % 16)
+                shift += bitwidth
+            self.__shifts = tuple(reversed(shifts))
+            self.__words = tuple((bitwidth + 15) // 16 for bitwidth in bitwidths)
+            self.__max_words = self.INCREMENTAL_WORDS * ((nbits + 15) // 16)
+
+        # The input fields of each header as (input index, field name).
+        self.__header_inputs = {}
+        for index, (header_name, field_name, _) in enumerate(calculation.input):
+            if header_name is not None:
+                self.__header_inputs.setdefault(header_name, []).append((index, field_name))
+        # The input fields of each header with their bits in the header's written bitmap, keyed on
+        # the header name. Each is filled in when the header is first seen.
+        self.__header_bits = {}
+
+    @property
+    def name(self) -> str:
+        """The name of the checksum."""
+        return self.__bm_checksum["name"]
+
+    @property
+    def calculation(self) -> Calculation:
+        """The calculation of the checksum."""
+        return self.__calculation
+
+    @property
+    def target(self) -> Tuple[str, str]:
+        """The header and field names of the checksum field."""
+        return (self.__header_name, self.__field_name)
+
+    def __enabled(self, bus: Bus) -> bool:
+        return (self.__if_cond is None) or bool(expr.rval(bus, self.__if_cond, None))
+
+    def __incremental(self) -> bool:
+        return (self.__shifts is not None) and (self.__calculation.algorithm is csum16)
+
+    def __sum(self, values: List[int]) -> int:
+        """The ones' complement sum of the serialised values modulo 2**16 - 1."""
+        return sum(value << shift for value, shift in zip(values, self.__shifts)) % 0xffff
+
+    @staticmethod
+    def __csum16(total: int, values: List[int]) -> int:
+        """The checksum from the sum as computed by `csum16`."""
+        # The folded sum is 0xffff rather than 0 unless all the words are 0.
+        if (total == 0) and any(values):
+            total = 0xffff
+        return ~total & 0xffff
+
+    def __bits(self, header_name: str, header: Header) -> Tuple[int, List[Tuple[int, str, int]]]:
+        bits = self.__header_bits.get(header_name)
+        if bits is None:
+            header_type = header.header_type
+            inputs = [
+                (index, field_name, 1 << header_type.index(field_name))
+                for index, field_name in self.__header_inputs[header_name]
+            ]
+            mask = 0
+            for _, _, bit in inputs:
+                mask |= bit
+            bits = self.__header_bits[header_name] = (mask, inputs)
+        return bits
+
+    def verify(self, bus: Bus, baselines: Dict) -> bool:
+        """Verify the checksum of a packet.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        baselines
+            The state of the packet's checksums, keyed on the calculation input, from which they
+            are updated incrementally. It is updated with this checksum.
+
+        Returns
+        -------
+        :
+            False if the checksum is verified and the checksum field does not hold the checksum.
+
+        """
+        if not (self.__verify and self.__enabled(bus)):
+            return True
+        field = bus.get_hdr(self.__header_name)[self.__field_name]
+        calculation = self.__calculation
+        if self.__incremental():
+            values = list(calculation.values(bus))
+            total = self.__sum(values)
+            headers = {}
+            for header_name in self.__header_inputs:
+                header = bus.get_hdr(header_name)
+                headers[header_name] = (header, header.wire)
+            baselines[calculation.input] = (values, total, headers)
+            checksum = self.__csum16(total, values)
+        else:
+            checksum = calculation.compute(bus)
+        return field.val == checksum & ((1 << field.bitwidth) - 1)
+
+    def update(self, bus: Bus, baselines: Dict) -> None:
+        """Update the checksum field of a packet.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        baselines
+            The state of the packet's checksums as left by `verify`. Without the state of this
+            checksum, it is computed over all of its input.
+
+        """
+        if not (self.__update and self.__enabled(bus)):
+            return
+        field = bus.get_hdr(self.__header_name)[self.__field_name]
+        calculation = self.__calculation
+        baseline = baselines.get(calculation.input) if self.__incremental() else None
+        if baseline is None:
+            field.val = calculation.compute(bus) & ((1 << field.bitwidth) - 1)
+            return
+
+        (values, total, headers) = baseline
+        values = values.copy()
+        (delta, words) = self.__changes(bus, values, headers)
+        if words <= self.__max_words:
+            total = (total + delta) % 0xffff
+        else:
+            total = self.__sum(values)
+        baselines[calculation.input] = (values, total, headers)
+        field.val = self.__csum16(total, values) & ((1 << field.bitwidth) - 1)
+
+    def __changes(self, bus: Bus, values: List[int], headers: Dict) -> Tuple[int, int]:
+        """Update the input values to those of the packet.
+
+        Returns
+        -------
+        :
+            The change of the ones' complement sum and the number of 16-bit words that changed.
+
+        """
+        delta = 0
+        words = 0
+        for header_name, (header, wire) in headers.items():
+            current = bus.get_hdr(header_name)
+            (mask, inputs) = self.__bits(header_name, current)
+            if (current is header) and (wire is not None) and (current.wire is wire):
+                # Only the fields written since the header was decoded can have changed.
+                mask &= current.written
+                if not mask:
+                    continue
+                inputs = [field_input for field_input in inputs if field_input[2] & mask]
+            for index, field_name, _ in inputs:
+                value = current[field_name].val
+                if value != values[index]:
+                    delta += (value - values[index]) << self.__shifts[index]
+                    words += self.__words[index]
+                    values[index] = value
+        return delta, words
@@ -1,8 +1,10 @@
 """P4 deparsers."""
 
 from abc import ABC, abstractmethod
+import struct
 
-from pyp4 import PacketIO
+from pyp4 import DeparseMode, PacketIO
+from pyp4.binary import BinaryPacket
 from pyp4.packet import HeaderStack
 from pyp4.trace import get_logger, Trace
 
@@ -12,6 +14,9 @@ logger = get_logger(__name__)
 class Deparser:
     """A P4 deparser.
 
+    The deparser is reentrant. All per-packet state is kept in an emitter that is created for each
+    packet so one deparser can deparse packets from multiple threads concurrently.
+
     Parameters
     ----------
     process_name : `str`
@@ -20,21 +25,36 @@ class Deparser:
         Deparser definition in  BM JSON format.
     packet_io : `pyp4.PacketIO`
         External packet representation type.
+    deparse_mode : `pyp4.DeparseMode`
+        Deparse mode for binary packets.
 
     """
 
     @Trace(logger)
-    def __init__(self, process_name, bm_deparser, packet_io=PacketIO.BINARY):
+    def __init__(
+            self,
+            process_name,
+            bm_deparser,
+            packet_io=PacketIO.BINARY,
+            deparse_mode=DeparseMode.COPY,
+    ):
+        # pylint: disable=too-many-arguments
+        # reason: all arguments are required during initialisation
         self.__process_name = process_name
         self.__bm_deparser = bm_deparser
-        self.__emitter = None
+        self.__emitter_cls = None
+        self.__plans = {}
         self.logger = None
 
         if packet_io == PacketIO.BINARY:
-            self.__emitter = BinaryEmitter()
+            if deparse_mode == DeparseMode.HEADROOM:
+                self.__emitter_cls = HeadroomEmitter
+            else:
+                assert deparse_mode == DeparseMode.COPY
+                self.__emitter_cls = BinaryEmitter
         else:
             assert packet_io == PacketIO.STACK
-            self.__emitter = StackEmitter()
+            self.__emitter_cls = StackEmitter
 
     @property
     def name(self):
@@ -61,13 +81,132 @@ class Deparser:
             The output packet.
 
         """
-        self.__emitter.reset(packet)
+        # The emitter holds all the per-packet state so that the deparser itself is never mutated.
+        # Emit plans are shared, but they are immutable and memoising one is idempotent.
+        emitter = self.__emitter_cls()
+        emitter.reset(packet)
+        emitter.emit_plan(self.__plan(packet))
+        return emitter.finalise()
+
+    def __plan(self, packet):
+        """The emit plan for the packet's header validity bitmap.
+
+        Plans are memoised per validity bitmap. The bitmap is updated whenever a header is made
+        valid or invalid, by the parser or by actions, so it always selects the plan of the headers
+        to emit without having to look at them.
+
+        """
+        plan = self.__plans.get(packet.validity)
+        if plan is None:
+            header_names = tuple(
+                name for name in self.__bm_deparser["order"] if packet.is_valid(name)
+            )
+            plan = EmitPlan(header_names, packet)
+            self.__plans[packet.validity] = plan
+            self.logger.debug(f"plan={header_names}")
+        return plan
+
+
+class EmitPlan:
+    """A deparser emit plan for a particular set of valid headers.
+
+    The plan holds the headers to emit in order. If all the headers have a fixed size, it also
+    holds the slot of each header in the output, the total output length and a `struct` format that
+    encodes all the headers at once. Fields that are not 1, 2, 4 or 8 bytes wide are split into
+    chunks that are.
+
+    Parameters
+    ----------
+    header_names : tuple of `str`
+        The names of the headers to emit in order.
+    packet : `pyp4.packet.Packet`
+        A packet in which exactly these headers are valid.
+
+    """
+
+    def __init__(self, header_names, packet):
+        self.__header_names = header_names
+        self.__slots = None
+        self.__bytelen = None
+        self.__format = None
+
+        headers = [packet[name] for name in header_names]
+        if all(self.__packable(header) for header in headers):
+            self.__slots = []
+            offset = 0
+            for header in headers:
+                (header_format, fields) = self.__header_format(header)
+                self.__slots.append((offset, header.bytelen, header_format, fields))
+                offset += header.bytelen
+            self.__bytelen = offset
+            self.__format = ">" + "".join(slot[2][1:] for slot in self.__slots)
+
+    @property
+    def header_names(self):
+        """tuple of `str`: The names of the headers to emit in order."""
+        return self.__header_names
 
-        for header_name in self.__bm_deparser["order"]:
-            if self.__emitter.emit(header_name):
-                self.logger.debug(f"header={header_name}")
+    @property
+    def bytelen(self):
+        """`int`: The total length of the emitted headers or None if they are not all fixed size."""
+        return self.__bytelen
+
+    @property
+    def format(self):
+        """`str`: The `struct` format of the emitted headers or None if they cannot be packed."""
+        return self.__format
+
+    @staticmethod
+    def __packable(header):
+        return header.header_type.struct_format is not None
+
+    @staticmethod
+    def __header_format(header):
+        header_type = header.header_type
+        return header_type.struct_format, list(zip(header_type.names, header_type.struct_chunks))
+
+    @staticmethod
+    def __values(header, fields):
+        for name, chunks in fields:
+            value = header[name].val
+            if chunks is None:
+                yield value
+            else:
+                for shift, mask in chunks:
+                    yield (value >> shift) & mask
+
+    def pack(self, headers):
+        """Encode the headers.
+
+        Headers that were not modified since they were parsed are copied from their wire bytes. If
+        none of them are, all headers are encoded with a single pack.
+
+        Parameters
+        ----------
+        headers : list of `pyp4.packet.Header`
+            The headers of the plan in order.
+
+        Returns
+        -------
+        `bytearray`
+            The encoded headers.
 
-        return self.__emitter.finalise()
+        """
+        assert self.__format is not None
+        binary = bytearray(self.__bytelen)
+        if all(header.dirty for header in headers):
+            values = []
+            for header, (_, _, _, fields) in zip(headers, self.__slots):
+                values.extend(self.__values(header, fields))
+            struct.pack_into(self.__format, binary, 0, *values)
+            return binary
+
+        for header, (offset, bytelen, header_format, fields) in zip(headers, self.__slots):
+            if header.dirty:
+                struct.pack_into(header_format, binary, offset, *self.__values(header, fields))
+            else:
+                binary[offset:(offset + bytelen)] = header.wire
+        return binary
 
 
 class Emitter(ABC):
@@ -127,6 +266,18 @@ class Emitter(ABC):
             return True
         return False
 
+    def emit_plan(self, plan):
+        """Emit the headers of an emit plan without checking their validity.
+
+        Parameters
+        ----------
+        plan : `pyp4.deparser.EmitPlan`
+            The emit plan for the packet.
+
+        """
+        for header_name in plan.header_names:
+            self._emit(header_name)
+
     @abstractmethod
     def _emit(self, header_name):
         raise NotImplementedError
@@ -154,13 +305,18 @@ class Emitter(ABC):
 
 
 class StackEmitter(Emitter):
-    """A header stack deparse emitter."""
+    """A header stack deparse emitter.
+
+    The emitted headers are released from the deparsed packet and moved to the output header stack
+    without copying them, so a parser can adopt them in turn.
+
+    """
 
     def _reset(self):
         self._packet_out = []
 
     def _emit(self, header_name):
-        self._packet_out.append(self._packet[header_name])
+        self._packet_out.append(self._packet.release(header_name))
 
     def _finalise(self):
         packet_out = self._packet.unparsed if self._packet.unparsed is not None else HeaderStack()
@@ -170,13 +326,97 @@ class StackEmitter(Emitter):
 
 
 class BinaryEmitter(Emitter):
-    """A binary deparse emitter."""
+    """A binary deparse emitter.
+
+    The deparsed packet is a `~pyp4.binary.BinaryPacket` made up of the emitted headers followed by
+    views of the unparsed payload. The payload itself is never copied. Headers that were not
+    modified since they were parsed are copied from their wire bytes rather than re-encoded. If the
+    emitted headers are exactly the unmodified headers that were parsed, the input packet is passed
+    through untouched.
+
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__plan = None
 
     def _reset(self):
-        self._packet_out = bytearray()
+        self._packet_out = []
+        self.__plan = None
+
+    def emit_plan(self, plan):
+        self.__plan = plan
+        super().emit_plan(plan)
 
     def _emit(self, header_name):
-        self._packet_out.extend(self._packet[header_name].to_bytes())
+        self._packet_out.append(self._packet[header_name])
 
     def _finalise(self):
-        self._packet_out.extend(self._packet.unparsed.get_remaining())
+        unparsed = self._packet.unparsed
+        position = self.__unmodified_position(self._packet_out, unparsed.position)
+        if position is not None:
+            self._packet_out = unparsed.from_position(position)
+            return
+
+        if (self.__plan is not None) and (self.__plan.format is not None):
+            header_bytes = self.__plan.pack(self._packet_out)
+        else:
+            header_bytes = bytearray()
+            for header in self._packet_out:
+                header_bytes += header.to_bytes() if header.dirty else header.wire
+        self._packet_out = self._prepend(header_bytes, unparsed)
+
+    @staticmethod
+    def __unmodified_position(headers, end):
+        """The position of the first header if the headers are unmodified and precede ``end``."""
+        position = end
+        for header in reversed(headers):
+            if (
+                    header.dirty or
+                    (header.wire_offset is None) or
+                    ((header.wire_offset + header.bytelen) != position)
+            ):
+                return None
+            position = header.wire_offset
+        return position
+
+    def _prepend(self, header_bytes, unparsed):
+        """Prepend the header bytes to the unparsed payload.
+
+        Parameters
+        ----------
+        header_bytes : `bytearray`
+            The encoded headers.
+        unparsed : `pyp4.binary.BinaryPacket`
+            The unparsed payload.
+
+        Returns
+        -------
+        `pyp4.binary.BinaryPacket`
+            The deparsed packet.
+
+        """
+        # pylint:disable=no-self-use
+        packet_out = BinaryPacket(header_bytes)
+        for segment in unparsed.remaining_segments():
+            packet_out.extend(segment)
+        return packet_out
+
+
+class HeadroomEmitter(BinaryEmitter):
+    """A binary deparse emitter that writes the headers into the headroom of the unparsed payload.
+
+    The headers are written directly in front of the unparsed payload in the original buffer which
+    makes the deparsed packet a view of that buffer. Only the header bytes are written regardless of
+    whether the header layout has grown or shrunk since parsing. If there is not enough headroom,
+    this falls back to the behaviour of `~pyp4.deparser.BinaryEmitter`.
+
+    """
+
+    def _prepend(self, header_bytes, unparsed):
+        if len(header_bytes) > unparsed.headroom:
+            return super()._prepend(header_bytes, unparsed)
+
+        region, packet_out = unparsed.claim_headroom(len(header_bytes))
+        region[:] = header_bytes
+        return packet_out
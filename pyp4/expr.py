@@ -51,7 +51,7 @@ def lval(bus, expr, runtime_data):
 
     Parameters
     ----------
-    bus : `pyp4.packet.Bus`
+    bus : `pyp4.bus.Bus`
         The metadata + headers bus.
     expr : dict
         The expression in BM AST format.
@@ -72,7 +72,7 @@ def rval(bus, expr, runtime_data):
 
     Parameters
     ----------
-    bus : `pyp4.packet.Bus`
+    bus : `pyp4.bus.Bus`
         The metadata + headers bus.
     expr : dict
         The expression in BM AST format.
@@ -93,7 +93,7 @@ def param(bus, expr, runtime_data):
 
     Parameters
     ----------
-    bus : `pyp4.packet.Bus`
+    bus : `pyp4.bus.Bus`
         The metadata + headers bus.
     expr : dict
         The expression in BM AST format.
@@ -171,8 +171,14 @@ def __expr_parameters_vector(bus, expr, runtime_data, is_lval):
     return tuple(__evaluate(bus, value, runtime_data, is_lval) for value in expr["value"])
 
 
+def __expr_lookahead(bus, expr, _runtime_data, _is_lval):
+    # Lookahead is only valid during parsing when the unparsed packet is the input packet.
+    (bitoffset, bitwidth) = expr["value"]
+    return bus.packet.unparsed.peek(bitoffset, bitwidth)
+
+
 def __expr_value(_bus, expr, _runtime_data, _is_lval):
-    assert expr["type"] in ["meter_array", "counter_array", "register_array"]
+    assert expr["type"] in ["meter_array", "counter_array", "register_array", "calculation"]
     return expr["value"]
 
 
@@ -188,6 +194,7 @@ EXPR_DISPATCHES = {
     "runtime_data": __ExprDispatch(__expr_runtime_data, False),
     "local": __ExprDispatch(__expr_runtime_data, False),
     "parameters_vector": __ExprDispatch(__expr_parameters_vector, False),
+    "lookahead": __ExprDispatch(__expr_lookahead, False),
 }
 
 
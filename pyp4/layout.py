@@ -0,0 +1,532 @@
+"""Fixed-width integers and the layouts of header types."""
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+class FixedWidth:
+    """The properties shared by all fixed-size integers of the same bitwidth.
+
+    Use :py:meth:`pyp4.layout.FixedWidth.get` to obtain the shared instance for a bitwidth.
+
+    Parameters
+    ----------
+    bitwidth
+        The fixed bitwidth.
+
+    """
+
+    __slots__ = ("bitwidth", "bytewidth", "byteint", "mask")
+
+    __widths: Dict[int, 'FixedWidth'] = {}
+
+    def __init__(self, bitwidth: int):
+        self.bitwidth = bitwidth
+        self.bytewidth = (bitwidth + 7) // 8
+        self.byteint = ((self.bytewidth * 8) == bitwidth)
+        self.mask = (1 << bitwidth) - 1
+
+    def __repr__(self):
+        return f"FixedWidth({self.bitwidth})"
+
+    def __deepcopy__(self, memo: Dict) -> 'FixedWidth':
+        # The instances are shared and never modified.
+        return self
+
+    @classmethod
+    def get(cls, bitwidth: int) -> 'FixedWidth':
+        """Get the shared instance for a bitwidth.
+
+        Parameters
+        ----------
+        bitwidth
+            The fixed bitwidth.
+
+        Returns
+        -------
+        :
+            The properties of fixed-size integers of the bitwidth.
+
+        """
+        width = cls.__widths.get(bitwidth)
+        if width is None:
+            width = cls.__widths.setdefault(bitwidth, cls(bitwidth))
+        return width
+
+
+class FixedInt:
+    """A fixed-size unsigned integer.
+
+    Parameters
+    ----------
+    value
+        Initial value.
+    bitwidth
+        The fixed bitwidth.
+
+    """
+
+    __slots__ = ("__width", "__value", "__dirty")
+
+    def __init__(self, value: int, bitwidth: int):
+        self.__width = FixedWidth.get(bitwidth)
+        assert isinstance(value, int)
+        assert value == (value & self.__width.mask)
+        self.__value = value
+        self.__dirty = False
+
+    def __repr__(self):
+        return f"0x{self.__value:X}"
+
+    def __eq__(self, other: 'FixedInt') -> bool:
+        # Header fields behave like the fixed-size integers they are views of.
+        return (self.__width is other.width) and (self.__value == other.val)
+
+    def __int__(self) -> int:
+        return self.__value
+
+    def __deepcopy__(self, memo: Dict) -> 'FixedInt':
+        # pylint: disable=protected-access,unused-private-member
+        # reason: the copy skips __init__ and its range check as the value is already in range
+        fixed_int = FixedInt.__new__(FixedInt)
+        fixed_int.__width = self.__width
+        fixed_int.__value = self.__value
+        fixed_int.__dirty = self.__dirty
+        return fixed_int
+
+    @property
+    def width(self) -> FixedWidth:
+        """The properties shared with all fixed-size integers of the same bitwidth."""
+        return self.__width
+
+    @property
+    def bitwidth(self) -> int:
+        """The bitwidth of the fixed-size integer."""
+        return self.__width.bitwidth
+
+    @property
+    def bytewidth(self) -> int:
+        """The bytewidth of the fixed-size integer."""
+        return self.__width.bytewidth
+
+    @property
+    def byteint(self) -> bool:
+        """True if the bitwidth is a multiple of an 8-bit byte."""
+        return self.__width.byteint
+
+    @property
+    def dirty(self) -> bool:
+        """True if the value was written since construction or since it was last decoded."""
+        return self.__dirty
+
+    def set_max_val(self) -> None:
+        """Set the internal value to the maximum possible value."""
+        self.__value = self.__width.mask
+        self.__dirty = True
+
+    def is_max_val(self) -> bool:
+        """True if the value stored is equal to maximum possible value."""
+        return self.__value == self.__width.mask
+
+    @property
+    def val(self) -> int:
+        """The integer value of the fixed-size integer."""
+        return self.__value
+
+    @val.setter
+    def val(self, value: int) -> None:
+        assert isinstance(value, int)
+        assert value == (value & self.__width.mask)
+        self.__value = value
+        self.__dirty = True
+
+    def set_unchecked(self, value: int) -> None:
+        """Set the value without checking that it fits the bitwidth.
+
+        Only for values already known to be in range, e.g. a value read from a field of the same
+        bitwidth.
+
+        Parameters
+        ----------
+        value
+            The new value.
+
+        """
+        self.__value = value
+        self.__dirty = True
+
+    def from_bytes(self, binary: Union[bytearray, bytes]) -> None:
+        """Set the value to the value provided in the encoded binary.
+
+        Parameters
+        ----------
+        binary
+            The binary representation of the value.
+
+        """
+        width = self.__width
+        assert width.byteint
+        assert len(binary) >= width.bytewidth
+        self.__value = int.from_bytes(binary[:width.bytewidth], byteorder="big", signed=False)
+        self.__dirty = False
+
+    def to_bytes(self) -> bytes:
+        """Return the value as encoded binary.
+
+        Returns
+        -------
+        :
+            The binary encoded value.
+
+        """
+        width = self.__width
+        assert width.byteint
+        return self.__value.to_bytes(width.bytewidth, byteorder="big", signed=False)
+
+
+class VarBit:
+    """A variable-size unsigned integer.
+
+    The value is kept as a view of the binary it was decoded from. It is only converted to an
+    integer when it is read as one and it is encoded by copying the view.
+
+    Parameters
+    ----------
+    max_bitwidth
+        The maximum bitwidth.
+
+    """
+
+    def __init__(self, max_bitwidth: int):
+        self.__max_bitwidth = max_bitwidth
+        self.__bitwidth = 0
+        self.__binary = memoryview(b"")
+        self.__dirty = False
+
+    def __repr__(self):
+        return f"0x{self.val:X}/{self.__bitwidth}"
+
+    def __eq__(self, other: 'VarBit') -> bool:
+        # pylint:disable=protected-access
+        return (
+            (self.__max_bitwidth == other.__max_bitwidth) and
+            (self.__bitwidth == other.__bitwidth) and
+            (self.__binary == other.__binary)
+        )
+
+    def __int__(self) -> int:
+        return self.val
+
+    def __deepcopy__(self, memo: Dict) -> 'VarBit':
+        # pylint: disable=protected-access,unused-private-member
+        # reason: the value and dirty flag are copied as they are, which the setters cannot do
+        # The value is a view which cannot be deep copied, but it can be shared.
+        varbit = VarBit(self.__max_bitwidth)
+        varbit.__bitwidth = self.__bitwidth
+        varbit.__binary = self.__binary
+        varbit.__dirty = self.__dirty
+        memo[id(self)] = varbit
+        return varbit
+
+    @property
+    def max_bitwidth(self) -> int:
+        """The maximum bitwidth of the variable-size integer."""
+        return self.__max_bitwidth
+
+    @property
+    def bitwidth(self) -> int:
+        """The current bitwidth of the variable-size integer."""
+        return self.__bitwidth
+
+    @bitwidth.setter
+    def bitwidth(self, bitwidth: int) -> None:
+        # A new bitwidth invalidates the current value.
+        assert 0 <= bitwidth <= self.__max_bitwidth
+        self.__bitwidth = bitwidth
+        self.__binary = memoryview(bytes(self.bytewidth))
+        self.__dirty = True
+
+    @property
+    def bytewidth(self) -> int:
+        """The current bytewidth of the variable-size integer."""
+        return (self.__bitwidth + 7) // 8
+
+    @property
+    def byteint(self) -> bool:
+        """True if the current bitwidth is a multiple of an 8-bit byte."""
+        return (self.__bitwidth % 8) == 0
+
+    @property
+    def dirty(self) -> bool:
+        """True if the value was written since construction or since it was last decoded."""
+        return self.__dirty
+
+    @property
+    def val(self) -> int:
+        """The integer value of the variable-size integer."""
+        return int.from_bytes(self.__binary, byteorder="big", signed=False)
+
+    @val.setter
+    def val(self, value: int) -> None:
+        assert isinstance(value, int)
+        assert value == (value & ((1 << self.__bitwidth) - 1))
+        self.__binary = memoryview(value.to_bytes(self.bytewidth, byteorder="big", signed=False))
+        self.__dirty = True
+
+    def from_bytes(self, binary: Any) -> None:
+        """Set the value to a view of the provided binary.
+
+        The binary must therefore not be modified whilst the value is in use.
+
+        Parameters
+        ----------
+        binary
+            The binary representation of the value.
+
+        """
+        assert self.byteint
+        binary = memoryview(binary)
+        assert binary.nbytes >= self.bytewidth
+        self.__binary = binary[:self.bytewidth]
+        self.__dirty = False
+
+    def to_bytes(self) -> memoryview:
+        """Return the value as encoded binary.
+
+        Returns
+        -------
+        :
+            A view of the binary encoded value.
+
+        """
+        assert self.byteint
+        return self.__binary
+
+
+class HeaderType:
+    """The layout shared by all headers of the same type.
+
+    A header type is immutable and is created once per header type of a program. The headers of the
+    type only keep a reference to it together with their values.
+
+    Parameters
+    ----------
+    fields
+         List of header fields defined by the 3-tuple (name, bitwidth, signed). A variable-size
+         field is defined by the 2-tuple (name, "*").
+    max_length : optional
+         The maximum length of the header in bytes. Only required for variable-size headers.
+    name : optional
+         The name of the header type.
+
+    """
+    # pylint: disable=too-many-instance-attributes
+    # Reason: the layout is precomputed once per header type so that headers only look it up.
+
+    def __init__(
+            self, fields: List[Tuple], max_length: Optional[int] = None, name: Optional[str] = None,
+    ):
+        self.__name = name
+        self.__max_length = max_length
+
+        self.__names = tuple(field[0] for field in fields)
+        self.__indices = {field_name: index for index, field_name in enumerate(self.__names)}
+
+        # BM JSON defines variable-size fields as a 2-tuple (name, "*").
+        self.__widths = tuple(
+            None if field[1] == "*" else FixedWidth.get(field[1]) for field in fields
+        )
+        varbits = [index for index, width in enumerate(self.__widths) if width is None]
+        assert len(varbits) <= 1
+        self.__varbit = varbits[0] if varbits else None
+
+        # The bit offset of each field assuming the variable-size field is empty.
+        self.__offsets = []
+        self.__bitlen = 0
+        for width in self.__widths:
+            self.__offsets.append(self.__bitlen)
+            self.__bitlen += 0 if width is None else width.bitwidth
+        self.__offsets = tuple(self.__offsets)
+
+        self.__max_varbit_bitwidth = None
+        if self.__varbit is not None:
+            assert max_length is not None
+            self.__max_varbit_bitwidth = (max_length * 8) - self.__bitlen
+
+        self.__byteints = all((width is None) or width.byteint for width in self.__widths)
+        self.__zeros = tuple(0 for _ in self.__widths)
+
+        self.__struct_format = None
+        self.__struct_chunks = None
+        if self.__byteints and (self.__varbit is None):
+            self.__struct_layout()
+
+    # The struct codes of the unsigned integers a field is split into, largest first.
+    __CHUNKS = ((8, "Q"), (4, "I"), (2, "H"), (1, "B"))
+
+    def __struct_layout(self) -> None:
+        struct_format = ">"
+        struct_chunks = []
+        for width in self.__widths:
+            bytewidth = width.bytewidth
+            chunks = []
+            for chunk_bytewidth, code in self.__CHUNKS:
+                while bytewidth >= chunk_bytewidth:
+                    bytewidth -= chunk_bytewidth
+                    struct_format += code
+                    chunks.append((bytewidth * 8, (1 << (chunk_bytewidth * 8)) - 1))
+            struct_chunks.append(None if len(chunks) == 1 else tuple(chunks))
+        self.__struct_format = struct_format
+        self.__struct_chunks = tuple(struct_chunks)
+
+    def __repr__(self) -> str:
+        return f"HeaderType({self.__name!r}, {self.__names!r})"
+
+    def __eq__(self, other: 'HeaderType') -> bool:
+        # Header types with the same fields are equal, e.g. those of different processes running
+        # the same program or those created for a user-built `Header`.
+        if not isinstance(other, HeaderType):
+            return NotImplemented
+        return (self is other) or (
+            (self.__names == other.names) and
+            (self.__widths == other.widths) and
+            (self.__max_length == other.max_length)
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.__names, self.__widths, self.__max_length))
+
+    def __deepcopy__(self, memo: Dict) -> 'HeaderType':
+        # Header types are shared and never modified.
+        return self
+
+    @classmethod
+    def from_bm(cls, bm_header_type: Dict) -> 'HeaderType':
+        """Create the header type of a BM JSON header type definition.
+
+        Parameters
+        ----------
+        bm_header_type
+            The BM JSON header type definition.
+
+        Returns
+        -------
+        :
+            The header type.
+
+        """
+        return cls(
+            bm_header_type["fields"], bm_header_type.get("max_length"), bm_header_type.get("name"),
+        )
+
+    @property
+    def name(self) -> Optional[str]:
+        """The name of the header type if known."""
+        return self.__name
+
+    @property
+    def max_length(self) -> Optional[int]:
+        """The maximum length of the header in bytes if it has a variable-size field."""
+        return self.__max_length
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """The names of the fields in order."""
+        return self.__names
+
+    @property
+    def widths(self) -> Tuple[Optional[FixedWidth], ...]:
+        """The widths of the fields in order, None for the variable-size field."""
+        return self.__widths
+
+    @property
+    def masks(self) -> Tuple[Optional[int], ...]:
+        """The masks of the fields in order, None for the variable-size field."""
+        return tuple(None if width is None else width.mask for width in self.__widths)
+
+    @property
+    def offsets(self) -> Tuple[int, ...]:
+        """The bit offsets of the fields in order assuming the variable-size field is empty."""
+        return self.__offsets
+
+    @property
+    def bitlen(self) -> int:
+        """The length of the header in bits without its variable-size field."""
+        return self.__bitlen
+
+    @property
+    def byteints(self) -> bool:
+        """True if the bitwidths of all fixed-size fields are a multiple of an 8-bit byte."""
+        return self.__byteints
+
+    @property
+    def struct_format(self) -> Optional[str]:
+        """The `struct` format of the encoded header.
+
+        Each field is split into as few unsigned integers as possible. None if the header has a
+        variable-size field or fields that are not a multiple of an 8-bit byte.
+        """
+        return self.__struct_format
+
+    @property
+    def struct_chunks(self) -> Optional[Tuple[Optional[Tuple[Tuple[int, int], ...]], ...]]:
+        """How each field is split in :py:attr:`struct_format`.
+
+        For each field, None if it is a single integer. Otherwise, the (shift, mask) of each of the
+        integers it is split into, most significant first. None if there is no struct format.
+        """
+        return self.__struct_chunks
+
+    @property
+    def zeros(self) -> Tuple[int, ...]:
+        """The field values of a zero-initialised header."""
+        return self.__zeros
+
+    @property
+    def varbit(self) -> Optional[int]:
+        """The index of the variable-size field if there is one."""
+        return self.__varbit
+
+    @property
+    def max_varbit_bitwidth(self) -> Optional[int]:
+        """The maximum bitwidth of the variable-size field if there is one."""
+        return self.__max_varbit_bitwidth
+
+    def index(self, name: str) -> int:
+        """Get the index of a field.
+
+        Parameters
+        ----------
+        name
+            The name of the field.
+
+        Returns
+        -------
+        :
+            The position of the field in the header.
+
+        """
+        return self.__indices[name]
+
+    def spans(self, varbit_bytewidth: int = 0) -> Tuple[Tuple[int, int], ...]:
+        """Get the byte span of each field in the encoded header.
+
+        Only meaningful if the bitwidths of all fields are a multiple of an 8-bit byte.
+
+        Parameters
+        ----------
+        varbit_bytewidth : optional
+            The current bytewidth of the variable-size field.
+
+        Returns
+        -------
+        :
+            The (start, end) byte offsets of the fields in order.
+
+        """
+        spans = []
+        start = 0
+        for width in self.__widths:
+            end = start + (varbit_bytewidth if width is None else width.bytewidth)
+            spans.append((start, end))
+            start = end
+        return tuple(spans)
@@ -1,79 +1,115 @@
-"""Structures representing packets."""
+"""Structures representing packets.
+
+The fixed-width integers and header layouts of `pyp4.layout` and the binary packets of
+`pyp4.binary` can also be imported from this module.
+
+"""
 
 from copy import deepcopy
-from functools import reduce
 from typing import Any, Dict, List, Optional, Tuple, Union
 
+from pyp4.binary import BinaryPacket
+from pyp4.layout import FixedInt, FixedWidth, HeaderType, VarBit
+
+
+class HeaderField:
+    """A view of a fixed-size field of a `Header`.
 
-class FixedInt:
-    """A fixed-size unsigned integer.
+    The field behaves like a `FixedInt` whose value is stored in the header.
 
     Parameters
     ----------
-    value
-        Initial value.
-    bitwidth
-        The fixed bitwidth.
+    header
+        The header the field belongs to.
+    index
+        The position of the field in the header.
 
     """
 
-    def __init__(self, value: int, bitwidth: int):
-        self.__bitwidth = bitwidth
-        self.__bytewidth = int((bitwidth + 7) / 8)
-        self.__byteint = ((self.__bytewidth * 8) == self.__bitwidth)
+    # pylint: disable=duplicate-code
+    # Reason: the field repeats the properties of `FixedInt` so that neither pays for a base class.
+    __slots__ = ("__header", "__index", "__width")
 
-        self.__mask = (1 << self.__bitwidth) - 1
-        self.__value = None
-
-        self.val = value
+    def __init__(self, header: 'Header', index: int):
+        self.__header = header
+        self.__index = index
+        self.__width = header.header_type.widths[index]
 
     def __repr__(self):
         return f"0x{self.val:X}"
 
-    def __eq__(self, other: 'FixedInt') -> bool:
-        # pylint:disable=protected-access
-        return (
-            (self.__bitwidth == other.__bitwidth) and
-            (self.__mask == other.__mask) and
-            (self.__value == other.__value)
-        )
+    def __eq__(self, other: Union[FixedInt, 'HeaderField']) -> bool:
+        return (self.__width is other.width) and (self.val == other.val)
 
     def __int__(self) -> int:
-        return self.__value
+        return self.val
+
+    def __deepcopy__(self, memo: Dict) -> FixedInt:
+        # A field copied on its own is detached from its header.
+        fixed_int = FixedInt(self.val, self.__width.bitwidth)
+        if self.dirty:
+            fixed_int.set_unchecked(self.val)
+        return fixed_int
+
+    @property
+    def width(self) -> FixedWidth:
+        """The properties shared with all fixed-size integers of the same bitwidth."""
+        return self.__width
 
     @property
     def bitwidth(self) -> int:
-        """The bitwidth of the fixed-size integer."""
-        return self.__bitwidth
+        """The bitwidth of the field."""
+        return self.__width.bitwidth
 
     @property
     def bytewidth(self) -> int:
-        """The bytewidth of the fixed-size integer."""
-        return self.__bytewidth
+        """The bytewidth of the field."""
+        return self.__width.bytewidth
 
     @property
     def byteint(self) -> bool:
         """True if the bitwidth is a multiple of an 8-bit byte."""
-        return self.__byteint
+        return self.__width.byteint
+
+    @property
+    def dirty(self) -> bool:
+        """True if the value was written since construction or since it was last decoded."""
+        # pylint:disable=protected-access
+        return self.__header._written(self.__index)
 
     def set_max_val(self) -> None:
-        """Set the internal value to the maximum possible value."""
-        self.__value = self.__mask
+        """Set the value to the maximum possible value."""
+        # pylint:disable=protected-access
+        self.__header._set_val(self.__index, self.__width.mask)
 
     def is_max_val(self) -> bool:
         """True if the value stored is equal to maximum possible value."""
-        return self.__value == self.__mask
+        return self.val == self.__width.mask
 
     @property
     def val(self) -> int:
-        """The integer value of the fixed-size integer."""
-        return self.__value
+        """The integer value of the field."""
+        # pylint:disable=protected-access
+        return self.__header._get_val(self.__index)
 
     @val.setter
     def val(self, value: int) -> None:
+        # pylint:disable=protected-access
         assert isinstance(value, int)
-        assert value == (value & self.__mask)
-        self.__value = value
+        assert value == (value & self.__width.mask)
+        self.__header._set_val(self.__index, value)
+
+    def set_unchecked(self, value: int) -> None:
+        """Set the value without checking that it fits the bitwidth.
+
+        Parameters
+        ----------
+        value
+            The new value.
+
+        """
+        # pylint:disable=protected-access
+        self.__header._set_val(self.__index, value)
 
     def from_bytes(self, binary: Union[bytearray, bytes]) -> None:
         """Set the value to the value provided in the encoded binary.
@@ -84,9 +120,12 @@ class FixedInt:
             The binary representation of the value.
 
         """
-        assert self.__byteint
-        assert len(binary) >= self.__bytewidth
-        self.__value = int.from_bytes(binary[:self.__bytewidth], byteorder="big", signed=False)
+        # pylint:disable=protected-access
+        width = self.__width
+        assert width.byteint
+        assert len(binary) >= width.bytewidth
+        value = int.from_bytes(binary[:width.bytewidth], byteorder="big", signed=False)
+        self.__header._set_val(self.__index, value, written=False)
 
     def to_bytes(self) -> bytes:
         """Return the value as encoded binary.
@@ -97,8 +136,9 @@ class FixedInt:
             The binary encoded value.
 
         """
-        assert self.__byteint
-        return self.__value.to_bytes(self.__bytewidth, byteorder="big", signed=False)
+        width = self.__width
+        assert width.byteint
+        return self.val.to_bytes(width.bytewidth, byteorder="big", signed=False)
 
 
 class Header:
@@ -109,41 +149,139 @@ class Header:
     is not possible to add or remove headers after construction and whilst it is possible modify the
     `FixedInt` value, changing its bitwidth is not.
 
+    The layout of the header is kept in its `HeaderType`, which is shared by all headers of the same
+    type, and the header itself only stores a list of its field values. The fixed-size fields are
+    accessed through `HeaderField` views of these values which behave like a `FixedInt`.
+
+    A header that was decoded from binary keeps a view of that binary (its wire bytes). For as long
+    as none of its fields are written, the header is clean and it is encoded by copying the wire
+    bytes rather than re-encoding each field. A header can also be decoded lazily in which case each
+    field is only decoded from the wire bytes when it is first accessed.
+
+    A header may have one variable-size field, a `VarBit`, whose bitwidth is set with
+    :py:meth:`set_varbit_bitwidth` before the header is decoded.
+
     Parameters
     ----------
     fields
-         List of header types defined by the 3-tuple (name, bitwidth, signed).
+         The header type or the list of header fields defined by the 3-tuple (name, bitwidth,
+         signed). A variable-size field is defined by the 2-tuple (name, "*").
+    max_length : optional
+         The maximum length of the header in bytes. Only required for variable-size headers
+         defined by a list of fields.
 
     """
+    # pylint: disable=too-many-instance-attributes
+    # Reason: the values are kept with the wire bytes and the validity binding of the header.
 
-    def __init__(self, fields: List[Tuple[str, int, bool]]):
-        self.__fields = {name: FixedInt(0, bitwidth) for name, bitwidth, _ in fields}
+    def __init__(self, fields: Union[HeaderType, List[Tuple]], max_length: Optional[int] = None):
+        header_type = fields if isinstance(fields, HeaderType) else HeaderType(fields, max_length)
+        self.__type = header_type
 
-        bitlen = reduce(
-            lambda width, next_fixed_int: width + next_fixed_int.bitwidth,
-            self.__fields.values(),
-            0,
-        )
-        self.__bytelen = int(bitlen / 8)
-        self.__byteheader = ((self.__bytelen * 8) == bitlen)
+        # The values of the fields in order. An undecoded field has the value None.
+        self.__values = list(header_type.zeros)
+        self.__views = [None] * len(header_type.names)
+        # Bitmap of the fields written since construction or since the header was last decoded.
+        self.__written = 0
+
+        self.__varbit = None
+        if header_type.varbit is not None:
+            self.__varbit = VarBit(header_type.max_varbit_bitwidth)
+            self.__values[header_type.varbit] = self.__varbit
+            self.__views[header_type.varbit] = self.__varbit
+
+        self.__resize()
 
         self.__valid = True
+        self.__owner = None
+        self.__bit = 0
+        self.__wire = None
+        self.__wire_offset = None
+
+    def __resize(self) -> None:
+        if self.__varbit is None:
+            bitlen = self.__type.bitlen
+            self.__byteints = self.__type.byteints
+            self.__spans = self.__type.spans() if self.__byteints else None
+        else:
+            bitlen = self.__type.bitlen + self.__varbit.bitwidth
+            self.__byteints = self.__type.byteints and self.__varbit.byteint
+            self.__spans = self.__type.spans(self.__varbit.bytewidth) if self.__byteints else None
+
+        self.__bytelen = bitlen // 8
+        self.__byteheader = ((self.__bytelen * 8) == bitlen)
 
     def __repr__(self) -> str:
-        return repr({**self.__fields, "valid": self.__valid})
+        return repr({**self.__fields(), "valid": self.__valid})
+
+    def __deepcopy__(self, memo: Dict) -> 'Header':
+        header = self.copy(memo.get(id(self.__owner)))
+        memo[id(self)] = header
+        return header
 
     def __len__(self) -> int:
-        return len(self.__fields)
+        return len(self.__values)
 
-    def __contains__(self, name: str) -> bool:
-        return name in self.__fields
+    def __iter__(self):
+        return iter(self.__type.names)
 
-    def __getitem__(self, name: str) -> FixedInt:
-        return self.__fields[name]
+    def __contains__(self, name: str) -> bool:
+        return name in self.__type.names
+
+    def __getitem__(self, name: str) -> Union[HeaderField, VarBit]:
+        index = self.__type.index(name)
+        view = self.__views[index]
+        if view is None:
+            view = self.__views[index] = HeaderField(self, index)
+        elif self.__values[index] is None:
+            # The variable-size field is its own view.
+            self.__decode(index)
+        return view
+
+    def __fields(self) -> Dict:
+        return {name: self[name] for name in self.__type.names}
+
+    def __decode(self, index: int) -> None:
+        start, end = self.__spans[index]
+        if index == self.__type.varbit:
+            self.__varbit.from_bytes(self.__wire[start:end])
+            self.__values[index] = self.__varbit
+        else:
+            self.__values[index] = int.from_bytes(
+                self.__wire[start:end], byteorder="big", signed=False,
+            )
+
+    def __decode_all(self) -> None:
+        values = self.__values
+        for index, value in enumerate(values):
+            if value is None:
+                self.__decode(index)
+
+    def _get_val(self, index: int) -> int:
+        value = self.__values[index]
+        if value is None:
+            self.__decode(index)
+            value = self.__values[index]
+        return value
+
+    def _set_val(self, index: int, value: int, written: bool = True) -> None:
+        self.__values[index] = value
+        if written:
+            self.__written |= (1 << index)
+        else:
+            self.__written &= ~(1 << index)
+
+    def _written(self, index: int) -> bool:
+        return (self.__written & (1 << index)) != 0
 
     def as_dict(self) -> Dict:
         """The header in dict format."""
-        return {name: field.val for name, field in self.__fields.items()}
+        return {name: field.val for name, field in self.__fields().items()}
+
+    @property
+    def header_type(self) -> HeaderType:
+        """The type of the header."""
+        return self.__type
 
     @property
     def valid(self) -> bool:
@@ -156,30 +294,167 @@ class Header:
         assert self.__byteheader
         return self.__bytelen
 
+    @property
+    def varbit(self) -> Optional[VarBit]:
+        """The variable-size field of the header if it has one."""
+        return self.__varbit
+
+    def copy(self, owner: Optional['Packet'] = None) -> 'Header':
+        """A copy of the header.
+
+        The copy shares the header type and the wire bytes, which are never modified, and copies
+        the field values.
+
+        Parameters
+        ----------
+        owner : optional
+            The packet the copy belongs to. The copy keeps the header's bit in the validity bitmap,
+            but the packet is not notified of its validity.
+
+        Returns
+        -------
+        :
+            The copy of the header.
+
+        """
+        # pylint: disable=protected-access,unused-private-member
+        # reason: __init__ would build new field values and views that the copy replaces anyway
+        header = Header.__new__(Header)
+        header.__type = self.__type
+        header.__values = self.__values.copy()
+        header.__views = [None] * len(self.__views)
+        header.__written = self.__written
+        header.__varbit = None
+        header.__byteints = self.__byteints
+        header.__spans = self.__spans
+        header.__bytelen = self.__bytelen
+        header.__byteheader = self.__byteheader
+        header.__valid = self.__valid
+        header.__owner = owner
+        header.__bit = self.__bit
+        header.__wire = self.__wire
+        header.__wire_offset = self.__wire_offset
+        if self.__varbit is not None:
+            header.__varbit = deepcopy(self.__varbit)
+            if self.__values[self.__type.varbit] is not None:
+                header.__values[self.__type.varbit] = header.__varbit
+            header.__views[self.__type.varbit] = header.__varbit
+        return header
+
+    def reset(self) -> None:
+        """Reset the header to zero values without wire bytes.
+
+        The header keeps its validity and its fields remain valid views of the header.
+        """
+        self.__values[:] = self.__type.zeros
+        self.__written = 0
+        self.__wire = None
+        self.__wire_offset = None
+        if self.__varbit is not None:
+            self.__values[self.__type.varbit] = self.__varbit
+            self.__varbit.bitwidth = 0
+            self.__resize()
+
+    def set_varbit_bitwidth(self, bitwidth: int) -> None:
+        """Set the bitwidth of the variable-size field.
+
+        This resets the value of the variable-size field.
+
+        Parameters
+        ----------
+        bitwidth
+            The new bitwidth of the variable-size field.
+
+        """
+        assert self.__varbit is not None
+        self.__decode_all()
+        self.__varbit.bitwidth = bitwidth
+        self.__resize()
+
+    @property
+    def written(self) -> int:
+        """Bitmap of the fields written since construction or since the header was last decoded."""
+        return self.__written
+
+    @property
+    def dirty(self) -> bool:
+        """True if the header has no wire bytes or if any of its fields were written since."""
+        return (
+            (self.__wire is None) or (self.__written != 0) or
+            ((self.__varbit is not None) and self.__varbit.dirty)
+        )
+
+    @property
+    def wire(self) -> Optional[memoryview]:
+        """The binary the header was last decoded from if any."""
+        return self.__wire
+
+    @property
+    def wire_offset(self) -> Optional[int]:
+        """The position of the wire bytes in the binary packet they were extracted from if known."""
+        return self.__wire_offset
+
+    @property
+    def owner(self) -> Optional['Packet']:
+        """The packet the header belongs to if any."""
+        return self.__owner
+
+    def bind(self, owner: Optional['Packet'], bit: int = 0) -> None:
+        """Bind the header to a packet which is then notified of changes to the header's validity.
+
+        Parameters
+        ----------
+        owner
+            The packet the header belongs to or None to unbind the header.
+        bit : optional
+            The header's bit in the validity bitmap of the packet.
+
+        """
+        self.__owner = owner
+        self.__bit = bit
+        if owner is not None:
+            owner.update_validity(bit, self.__valid)
+
     def set_valid(self) -> None:
         """Set the header to status to valid."""
+        if (not self.__valid) and (self.__owner is not None):
+            self.__owner.update_validity(self.__bit, True)
         self.__valid = True
 
     def set_invalid(self) -> None:
         """Set the header status to invalid."""
+        if self.__valid and (self.__owner is not None):
+            self.__owner.update_validity(self.__bit, False)
         self.__valid = False
 
-    def from_bytes(self, binary: Union[bytearray, bytes]) -> None:
+    def from_bytes(
+            self, binary: Any, offset: Optional[int] = None, lazy: bool = False,
+    ) -> None:
         """Set the field values to the values decoded from the provided binary.
 
+        The header keeps a view of the binary as its wire bytes. The binary must therefore not be
+        modified whilst the header is in use.
+
         Parameters
         ----------
         binary
             The binary representation of the value.
+        offset : optional
+            The position of the binary in the binary packet it was extracted from.
+        lazy : optional
+            If True, the fields are only decoded when they are first accessed.
 
         """
-        start = 0
-        end = 0
-        for field in self.__fields.values():
-            assert field.byteint
-            end += int(field.bytewidth)
-            field.from_bytes(binary[start:end])
-            start = end
+        assert self.__byteints
+        binary = memoryview(binary)[:self.bytelen]
+        assert binary.nbytes == self.__bytelen
+        self.__wire = binary
+        self.__wire_offset = offset
+
+        self.__values = [None] * len(self.__values)
+        self.__written = 0
+        if not lazy:
+            self.__decode_all()
 
     def to_bytes(self) -> bytearray:
         """Return the value as encoded binary.
@@ -190,8 +465,12 @@ class Header:
             The binary encoded header.
 
         """
+        if not self.dirty:
+            return bytearray(self.__wire)
+
+        self.__decode_all()
         binary = bytearray()
-        for field in self.__fields.values():
+        for field in self.__fields().values():
             binary += field.to_bytes()
         return binary
 
@@ -229,6 +508,21 @@ class HeaderStack:
     def payload(self, payload: Optional[Any]):
         self.__payload = payload
 
+    def copy(self) -> 'HeaderStack':
+        """A copy of the packet with copies of its headers which shares the payload.
+
+        Returns
+        -------
+        :
+            The copy of the packet.
+
+        """
+        # pylint: disable=protected-access,unused-private-member
+        # reason: the copied headers are set as the stack without pushing them one by one
+        packet = HeaderStack(self.__payload)
+        packet.__stack = [header.copy() for header in self.__stack]
+        return packet
+
     def push(self, header: Header) -> None:
         """Push a header on top of the packet.
 
@@ -251,65 +545,14 @@ class HeaderStack:
         """
         return self.__stack.pop()
 
+    def peek(self, bitoffset: int, bitwidth: int) -> int:
+        """Lookahead is not supported for header stack packets.
 
-class BinaryPacket:
-    """A packet in binary.
-
-    """
-
-    def __init__(self):
-        self.__bytes = bytearray()
-        self.__ptr = 0
-
-    def extend(self, binary: Union[bytearray, bytes]) -> None:
-        """Extend the packet.
+        Headers on the stack do not have a binary representation that could be looked into.
 
-        Parameters
-        ----------
-        binary
-            The binary to add to the end of the packet.
         """
-        self.__bytes += binary
-
-    def reset(self) -> None:
-        """Reset the internal packet pointer."""
-        self.__ptr = 0
-
-    def get_next(self, bytewidth: int) -> bytearray:
-        """Get the next bytes of the packet from the start of the internal pointer.
-
-        This moves the internal packet pointer the same number of bytes.
-
-        Parameters
-        ----------
-        bytewidth
-            The number of bytes to extract.
-
-        Returns
-        -------
-        :
-            The next ``bytewidth`` bytes.
-
-        """
-        start = self.__ptr
-        end = self.__ptr + bytewidth
-        if end > len(self.__bytes):
-            raise ValueError
-        self.__ptr = end
-        return self.__bytes[start:end]
-
-    def get_remaining(self) -> bytearray:
-        """Get the remaining bytes of the packet from the start of the internal pointer.
-
-        This moves the internal packet pointer to the end of the packet.
-
-        Returns
-        -------
-        :
-            The remaining bytes.
-
-        """
-        return self.get_next(len(self.__bytes) - self.__ptr)
+        # pylint:disable=no-self-use,unused-argument
+        raise NotImplementedError
 
 
 class Packet:
@@ -319,10 +562,16 @@ class Packet:
     on the running P4 program. It is also unordered and stores headers by name (as defined in P4
     program) rather than the order they were placed on the original packet.
 
+    A header assigned to the packet, ``packet[name] = header``, is copied so that the header of the
+    caller and the header of the packet are independent. :py:meth:`adopt` sets a header without
+    copying it and :py:meth:`release` hands a header of the packet over to the caller, so headers
+    can be moved from one packet to another.
+
     Parameters
     ----------
     header_types
-        Dictionary of header types keyed on the header type name.
+        Dictionary of header types keyed on the header type name. The header types are either
+        `HeaderType` objects or BM JSON header type definitions.
     header_defs
         Dictionary of header definitions ("headers" in BM JSON) keyed on the header name.
     unparsed : optional
@@ -331,12 +580,20 @@ class Packet:
     """
 
     def __init__(self, header_types: Dict, header_defs: Dict, unparsed: Optional[Any] = None):
-        self.__header_types = header_types
+        self.__header_types = {
+            name: header_type if isinstance(header_type, HeaderType) else
+            HeaderType.from_bm(header_type)
+            for name, header_type in header_types.items()
+        }
         self.__header_defs = header_defs
 
         self.__headers = {}
         self.__unparsed = unparsed
 
+        # Header validity is kept as a bitmap with one bit per header definition.
+        self.__bits = {name: (1 << index) for index, name in enumerate(header_defs)}
+        self.__validity = 0
+
         for name in header_defs:
             self.add_header(name)
             self.__headers[name].set_invalid()
@@ -344,6 +601,34 @@ class Packet:
     def __repr__(self) -> str:
         return repr({**self.__headers, "unparsed": repr(self.__unparsed)})
 
+    def copy(self) -> 'Packet':
+        """A copy of the packet.
+
+        The copy shares the header types with this packet and has copies of its headers and of its
+        unparsed part. A binary unparsed part shares its buffers with this packet.
+
+        Returns
+        -------
+        :
+            The copy of the packet.
+
+        """
+        # pylint: disable=protected-access,unused-private-member
+        # reason: __init__ would create every header only for the copies to replace them
+        packet = Packet.__new__(Packet)
+        packet.__header_types = self.__header_types
+        packet.__header_defs = self.__header_defs
+        packet.__bits = self.__bits
+        packet.__headers = {name: header.copy(packet) for name, header in self.__headers.items()}
+        unparsed = self.__unparsed
+        if isinstance(unparsed, (BinaryPacket, HeaderStack)):
+            unparsed = unparsed.copy()
+        elif unparsed is not None:
+            unparsed = deepcopy(unparsed)
+        packet.__unparsed = unparsed
+        packet.__validity = self.__validity
+        return packet
+
     def __contains__(self, name: str) -> bool:
         return name in self.__headers
 
@@ -351,36 +636,107 @@ class Packet:
         return self.__headers[name]
 
     def __setitem__(self, name: str, header: Header):
+        """Set a copy of a header as a header of the packet and make it valid.
+
+        Parameters
+        ----------
+        name
+            The name of the header definition.
+        header
+            The header.
+
+        """
+        self.__set(name, header, share=False)
+
+    def adopt(self, name: str, header: Header) -> None:
+        """Set a header of the packet and make it valid without copying it.
+
+        A header whose header type is equal to the one of the header definition, i.e. has the same
+        fields, is adopted without validation. The packet then shares the header with the caller,
+        which must not use it any more unless it is meant to change the packet. Headers that belong
+        to another packet and headers of other types are copied as for ``packet[name] = header``.
+
+        Parameters
+        ----------
+        name
+            The name of the header definition.
+        header
+            The header.
+
+        """
+        self.__set(name, header, share=True)
+
+    def __set(self, name: str, header: Header, share: bool) -> None:
         # Header must be one defined in BM JSON.
         assert name in self.__header_defs
 
-        # Find header type and field list to verify provided header.
-        header_type = self.__header_defs[name]["header_type"]
-        header_fields = self.__header_types[header_type]["fields"]
+        # Find header type to verify provided header.
+        header_type = self.__header_types[self.__header_defs[name]["header_type"]]
+
+        if header.header_type == header_type:
+            # The values of a header of the expected type are in range by construction so the
+            # header is not validated. A header that belongs to another packet is copied even when
+            # shared so that the packets do not share it.
+            if (not share) or (header.owner is not None):
+                header = header.copy()
+        else:
+            header = self.__copy_foreign(header_type, header)
+        header.set_valid()
 
+        if name in self.__headers:
+            self.__headers[name].bind(None)
+        header.bind(self, self.__bits[name])
+        self.__headers[name] = header
+
+    def release(self, name: str) -> Header:
+        """Remove a header from the packet and hand it over to the caller.
+
+        The header no longer belongs to the packet, so another packet can adopt it without copying.
+        The header is created again by :py:meth:`add_header` or :py:meth:`reset`.
+
+        Parameters
+        ----------
+        name
+            The name of the header.
+
+        Returns
+        -------
+        :
+            The header.
+
+        """
+        header = self.__headers.pop(name)
+        self.__validity &= ~self.__bits[name]
+        header.bind(None)
+        return header
+
+    @staticmethod
+    def __copy_foreign(header_type: HeaderType, header: Header) -> Header:
         # We will copy the entire header to ensure the PyP4 internals do not have to worry about
         # whether they're dealing with a copy or reference.
-        header_copy = Header(header_fields)
+        header_copy = Header(header_type)
 
         # Check that the provided header matches the definition from BM.
-        assert len(header) == len(header_fields)
-        for field in header_fields:
-            field_name = field[0]
-            field_bitwidth = field[1]
-
+        assert len(header) == len(header_type.names)
+        for field_name, field_width in zip(header_type.names, header_type.widths):
             field_value = header[field_name]
-            mask = (1 << field_bitwidth) - 1
+            if field_width is None:
+                # A variable-size field only needs to agree on the maximum number of bits.
+                assert field_value.max_bitwidth == header_copy.varbit.max_bitwidth
+                header_copy.set_varbit_bitwidth(field_value.bitwidth)
+                header_copy[field_name].val = field_value.val
+                continue
 
             # We verify both, that the value is indeed legal and that the FixedInt struct agrees as
             # to the number of bits.
-            assert (field_value.val & mask) == field_value.val
-            assert field_value.bitwidth == field_bitwidth
+            assert (field_value.val & field_width.mask) == field_value.val
+            assert field_value.bitwidth == field_width.bitwidth
 
             # And create a copy
-            header_copy[field_name].val = field_value.val
+            header_copy[field_name].set_unchecked(field_value.val)
             assert header_copy[field_name].bitwidth == field_value.bitwidth
 
-        self.__headers[name] = header_copy
+        return header_copy
 
     @property
     def unparsed(self) -> Optional[Any]:
@@ -391,6 +747,27 @@ class Packet:
     def unparsed(self, unparsed: Optional[Any]) -> None:
         self.__unparsed = unparsed
 
+    @property
+    def validity(self) -> int:
+        """The header validity bitmap.
+
+        Bit i is set if the i-th header definition of the program is valid.
+        """
+        return self.__validity
+
+    def update_validity(self, bit: int, valid: bool) -> None:
+        """Update the validity bitmap for a change in the validity of one of the headers.
+
+        Parameters
+        ----------
+        bit
+            The header's bit in the bitmap.
+        valid
+            The new validity of the header.
+
+        """
+        self.__validity = (self.__validity | bit) if valid else (self.__validity & ~bit)
+
     def add_header(self, name: str) -> None:
         """Add a zero-initialised, pre-defined header to the packet based on its name.
 
@@ -411,11 +788,12 @@ class Packet:
             return
 
         # Find header type and field list to verify provided header.
-        header_type = self.__header_defs[name]["header_type"]
-        header_fields = self.__header_types[header_type]["fields"]
+        header_type = self.__header_types[self.__header_defs[name]["header_type"]]
 
         # Create a zero header
-        self.__headers[name] = Header(header_fields)
+        header = Header(header_type)
+        header.bind(self, self.__bits[name])
+        self.__headers[name] = header
 
     def is_valid(self, name: str) -> bool:
         """Check if particular header is valid.
@@ -431,61 +809,28 @@ class Packet:
             Whether the header has its valid flag set.
 
         """
-        hdr = self.__headers.get(name)
-        return hdr.valid if hdr is not None else False
+        return (self.__validity & self.__bits.get(name, 0)) != 0
 
     def clear(self) -> None:
         """Clear the packet of all headers."""
+        for header in self.__headers.values():
+            header.bind(None)
         self.__headers.clear()
+        self.__validity = 0
 
+    def reset(self) -> None:
+        """Reset the packet to the state of a new packet without an unparsed part.
 
-class Bus:
-    """The metadata + headers bus.
-
-    Parameters
-    ----------
-    metadata
-        Architecture defined metadata mapped by name.
-    packet
-        The internal packet representation.
-
-    """
-
-    def __init__(self, metadata: Dict[str, Header], packet: Packet):
-        self.__metadata = metadata
-        self.__packet = packet
-
-    def __repr__(self) -> str:
-        """Create a string representation of  Bus."""
-        return repr({**self.__metadata, "packet": self.__packet})
-
-    def clone(self) -> 'Bus':
-        """A clone of the bus."""
-        return deepcopy(self)
-
-    @property
-    def metadata(self) -> Dict:
-        """Dictionary of all the metadata blocks."""
-        return self.__metadata
-
-    @property
-    def packet(self) -> Packet:
-        """The packet itself."""
-        return self.__packet
-
-    def get_hdr(self, name: str) -> Header:
-        """Get a metadata/header.
-
-        Parameters
-        ----------
-        name
-            The name of the metadata/header.
-
-        Returns
-        -------
-        :
-            The metadata/header.
-
+        The headers are reset in place and set to invalid. Headers that were removed with
+        :py:meth:`clear` are created again.
         """
-        hdr = self.__metadata.get(name)
-        return hdr if hdr is not None else self.__packet[name]
+        for header in self.__headers.values():
+            header.reset()
+            header.set_invalid()
+        if len(self.__headers) != len(self.__header_defs):
+            for name in self.__header_defs:
+                if name not in self.__headers:
+                    self.add_header(name)
+                    self.__headers[name].set_invalid()
+        self.__unparsed = None
+        self.__validity = 0
@@ -3,14 +3,29 @@
 from abc import ABC, abstractmethod
 
 from pyp4 import expr, PacketIO
+from pyp4.action import Action
 from pyp4.trace import get_logger, Trace
 
 logger = get_logger(__name__)
 
+# The error codes of the P4 core library as they are assigned by BM.
+CORE_ERRORS = {
+    "NoError": 0,
+    "PacketTooShort": 1,
+    "NoMatch": 2,
+    "StackOutOfBounds": 3,
+    "HeaderTooShort": 4,
+    "ParserTimeout": 5,
+    "ParserInvalidArgument": 6,
+}
+
 
 class Parser:
     """A P4 parser.
 
+    The parser is reentrant. All per-packet state is kept in a collector that is created for each
+    packet so one parser can parse packets from multiple threads concurrently.
+
     Parameters
     ----------
     process_name : `str`
@@ -19,6 +34,10 @@ class Parser:
         Parser definition in BM JSON format.
     packet_io : `pyp4.PacketIO`
         External packet representation type.
+    extern : `<processor specific ExternClass>`, optional
+        Processor specific object for handling externs called by primitive parser operations.
+    errors : dict, optional
+        The program's error codes keyed on their names. Defaults to the P4 core errors.
 
     """
 
@@ -28,31 +47,74 @@ class Parser:
             process_name,
             bm_parser,
             packet_io=PacketIO.BINARY,
+            extern=None,
+            errors=None,
     ):
         # pylint: disable=too-many-arguments
         # reason: all arguments are required during initialisation
         self.__process_name = process_name
         self.__bm_parser = bm_parser
-        self.__collector = None
+        self.__collector_cls = None
+        self.__errors = CORE_ERRORS if errors is None else errors
         self.logger = None
 
         if packet_io == PacketIO.BINARY:
-            self.__collector = BinaryCollector()
+            self.__collector_cls = BinaryCollector
         else:
             assert packet_io == PacketIO.STACK
-            self.__collector = StackCollector()
+            self.__collector_cls = StackCollector
 
         # The ParseState class is the actual work horse of the parser.
         self.__states = {
-            parse_state["name"]: ParseState(self.__process_name, parse_state)
+            parse_state["name"]: ParseState(
+                self.__process_name, parse_state, extern, self.__errors,
+            )
             for parse_state in self.__bm_parser["parse_states"]
         }
 
+        # The optimiser specialises the parser for the paths through the states.
+        self.__optimiser = ParserOptimiser(self.__states, self.__bm_parser["init_state"])
+
     @property
     def name(self):
         """`str`: Name of the parser."""
         return self.__bm_parser["name"]
 
+    @property
+    def optimiser(self):
+        """`pyp4.parser.ParserOptimiser`: The optimiser specialising the parse paths."""
+        return self.__optimiser
+
+    def __process_paths(self, collector):
+        """Parse along the specialised paths.
+
+        Returns
+        -------
+        `str`
+            The name of the state from which parsing has to continue state by state, if any.
+
+        """
+        node = self.__optimiser.root
+        while True:
+            for _, handler in node.ops:
+                handler(collector)
+                if collector.error is not None:
+                    return None
+
+            if node.fallback is not None:
+                return node.fallback
+
+            if node.state is None:
+                return None
+
+            target = node.targets.get(node.state.transition_key_value(collector), node.default)
+            if target is None:
+                return None
+            if target is NO_MATCH:
+                collector.reject(self.__errors["NoMatch"])
+                return None
+            node = target
+
     @property
     def process_name(self):
         """`str`: Name of the process running the P4 program this parser belongs to."""
@@ -64,41 +126,141 @@ class Parser:
 
         Parameters
         ----------
-        bus : `pyp4.packet.Bus`
+        bus : `pyp4.bus.Bus`
             The metadata + headers bus.
         packet_in : `<PacketIO specific PacketClass>`
             The input packet.
 
+        Returns
+        -------
+        `int`
+            The parser error code. If the packet was rejected, the headers extracted so far remain
+            in the bus and the rest of the packet is left unparsed.
+
         """
 
-        self.__collector.reset(bus, packet_in)
+        # The collector holds all the per-packet state so that the parser itself is never mutated.
+        collector = self.__collector_cls(self.__errors)
+        collector.reset(bus, packet_in)
 
-        state = self.__bm_parser["init_state"]
+        state = self.__process_paths(collector)
         while state is not None:
             self.logger.debug(f"state-{state}")
-            state = self.__states[state].process(self.__collector)
+            state = self.__states[state].process(collector)
 
-        self.__collector.finalise()
+        error = collector.error
+        collector.finalise()
+        if error is None:
+            return self.__errors["NoError"]
+        self.logger.debug(f"reject-{error}")
+        return error
 
 
 class ParseState:
     """A parser state.
 
+    The parser operations are resolved into handlers once on construction. The ``set`` and
+    ``primitive`` operations are executed as actions.
+
     Parameters
     ----------
     process_name : `str`
         The name of the process that will be running the P4 program.
     bm_parse_state : dict
         Parse state definition in BM JSON format.
+    extern : `<processor specific ExternClass>`, optional
+        Processor specific object for handling externs called by primitive parser operations.
+    errors : dict, optional
+        The program's error codes keyed on their names. Defaults to the P4 core errors.
 
     """
 
     @Trace(logger)
-    def __init__(self, process_name, bm_parse_state):
+    def __init__(self, process_name, bm_parse_state, extern=None, errors=None):
         self.__process_name = process_name
         self.__bm_parse_state = bm_parse_state
+        self.__extern = extern
+        self.__errors = CORE_ERRORS if errors is None else errors
         self.logger = None
 
+        self.__ops = [
+            (op["op"], self.__compile_op(index, op))
+            for index, op in enumerate(self.__bm_parse_state["parser_ops"])
+        ]
+
+    def __compile_op(self, index, op):
+        if op["op"] == "extract":
+            return self.__extract_handler(op["parameters"])
+
+        if op["op"] == "extract_VL":
+            return self.__extract_vl_handler(op["parameters"])
+
+        if op["op"] == "set":
+            assert len(op["parameters"]) == 2
+            return self.__action_handler(
+                index, [{"op": "assign", "parameters": op["parameters"]}],
+            )
+
+        if op["op"] == "primitive":
+            assert len(op["parameters"]) == 1
+            return self.__action_handler(index, op["parameters"])
+
+        if op["op"] == "verify":
+            return self.__verify_handler(op["parameters"])
+
+        if op["op"] == "advance":
+            return self.__advance_handler(op["parameters"])
+
+        # Eventually all operations should be supported
+        raise NotImplementedError(f"Unsupported parser operation: {op['op']}")
+
+    def __extract_handler(self, parameters):
+        def handler(collector):
+            header_name = collector.extract(parameters)
+            self.logger.debug(f"header={header_name}")
+        return handler
+
+    def __extract_vl_handler(self, parameters):
+        assert len(parameters) == 2
+        (header, bitwidth) = parameters
+
+        def handler(collector):
+            header_name = collector.extract_vl(
+                [header], expr.rval(collector.bus, bitwidth, None),
+            )
+            self.logger.debug(f"header={header_name}")
+        return handler
+
+    def __action_handler(self, index, primitives):
+        action = Action(
+            self.__process_name,
+            {"name": f"{self.name}.{index}", "primitives": primitives},
+            self.__extern,
+        )
+
+        def handler(collector):
+            action.process(collector.bus, None)
+        return handler
+
+    @staticmethod
+    def __verify_handler(parameters):
+        assert len(parameters) == 2
+        (condition, error) = parameters
+
+        def handler(collector):
+            if not expr.rval(collector.bus, condition, None):
+                collector.reject(expr.rval(collector.bus, error, None))
+        return handler
+
+    @staticmethod
+    def __advance_handler(parameters):
+        assert len(parameters) == 1
+        (bitwidth,) = parameters
+
+        def handler(collector):
+            collector.advance(expr.rval(collector.bus, bitwidth, None))
+        return handler
+
     @property
     def name(self):
         """`str`: Name of the parse state."""
@@ -121,25 +283,18 @@ class ParseState:
         Returns
         -------
         `str`
-            The name of the next state.
+            The name of the next state or None if the parser should stop, because the packet was
+            accepted or rejected.
 
         """
-        for op in self.__bm_parse_state["parser_ops"]:
-            self.logger.debug(f"op-{op['op']}")
-            if op["op"] == "extract":
-                header_name = collector.extract(op["parameters"])
-                self.logger.debug(f"header={header_name}")
-            else:
-                # Eventually all operations should be supported
-                raise NotImplementedError
-
-        transition_key = None
-        if self.__bm_parse_state["transition_key"]:
-            # More than one key is legal, but not sure what that means
-            assert len(self.__bm_parse_state["transition_key"]) == 1
-            transition_key = self.__bm_parse_state["transition_key"][0]
-            transition_key_val = expr.rval(collector.bus, transition_key, None)
-
+        for op_name, handler in self.__ops:
+            self.logger.debug(f"op-{op_name}")
+            handler(collector)
+            if collector.error is not None:
+                # Rejected packets skip the rest of the parser.
+                return None
+
+        transition_key_val = self.transition_key_value(collector)
         for transition in self.__bm_parse_state["transitions"]:
             if transition["type"] == "default":
                 return transition["next_state"]
@@ -148,23 +303,189 @@ class ParseState:
             if transition_key_val == rval:
                 return transition["next_state"]
 
-        # Should not get here
-        raise AssertionError
+        collector.reject(self.__errors["NoMatch"])
+        return None
 
+    @property
+    def ops(self):
+        """list of (`str`, callable): The operation names and their handlers."""
+        return self.__ops
 
-class Collector(ABC):
-    """A parse collector."""
+    @property
+    def transitions(self):
+        """list of dict: The transitions in BM JSON format."""
+        return self.__bm_parse_state["transitions"]
+
+    def transition_key_value(self, collector):
+        """Evaluate the transition key.
+
+        Parameters
+        ----------
+        collector : `pyp4.parser.Collector`
+            Parse collector.
+
+        Returns
+        -------
+        `int` or `bool`
+            The value of the transition key or None if the state has no transition key.
+
+        """
+        if not self.__bm_parse_state["transition_key"]:
+            return None
+
+        # More than one key is legal, but not sure what that means
+        assert len(self.__bm_parse_state["transition_key"]) == 1
+        transition_key = self.__bm_parse_state["transition_key"][0]
+        return expr.rval(collector.bus, transition_key, None)
+
+
+class ParsePath:
+    """A node in the trie of specialised parse paths.
+
+    A node is the straight-line run of the operations of one or more parse states up to and
+    including the next state that selects its transition with a key. The children of the node are
+    looked up directly on the value of that key.
+
+    """
 
     def __init__(self):
+        self.ops = []
+        self.state = None
+        self.targets = {}
+        self.default = NO_MATCH
+        self.fallback = None
+
+
+# The target of a transition lookup that did not match any transition.
+NO_MATCH = object()
+
+
+class ParserOptimiser:
+    """A parser optimiser that specialises the parser for the paths through its parse states.
+
+    The paths from the initial state are enumerated into a trie of `ParsePath` nodes. Chains of
+    states with a single unconditional transition are merged into one node and transitions are
+    looked up on the value of the transition key rather than matched one after the other.
+
+    A path is only specialised as long as each state is visited at most ``max_visits`` times and as
+    long as its transitions are exact matches on a single key. Beyond that, the path falls back to
+    processing the parse states one by one. Paths that reach the same state having visited each
+    state equally often share their node, so the trie is a graph of bounded loops. Once it has
+    ``max_nodes`` nodes, all further paths fall back.
+
+    Parameters
+    ----------
+    states : dict
+        The `pyp4.parser.ParseState` objects keyed on their names.
+    init_state : `str`
+        The name of the initial state.
+    max_visits : `int`, optional
+        The bound on how often a path may loop through the same state.
+    max_nodes : `int`, optional
+        The bound on the number of nodes of the trie.
+
+    """
+
+    def __init__(self, states, init_state, max_visits=2, max_nodes=4096):
+        self.__states = states
+        self.__max_visits = max_visits
+        self.__max_nodes = max_nodes
+        self.__built = {}
+        self.__root = self.__build(init_state, ())
+
+    @property
+    def size(self):
+        """`int`: The number of nodes of the trie."""
+        return len(self.__built)
+
+    @property
+    def root(self):
+        """`pyp4.parser.ParsePath`: The root of the trie."""
+        return self.__root
+
+    @staticmethod
+    def __specialisable(state):
+        if not state.transitions:
+            return False
+        for transition in state.transitions:
+            if transition["type"] == "default":
+                continue
+            if (transition["type"] != "hexstr") or (transition.get("mask") is not None):
+                return False
+        return True
+
+    def __build(self, state_name, visits):
+        """Build the node of the paths that reach a state.
+
+        ``visits`` is the sorted tuple of (state name, visit count) of the states visited so far.
+        The paths that follow only depend on these counts and not on the order of the visits.
+        """
+        built_key = (state_name, visits)
+        if built_key in self.__built:
+            return self.__built[built_key]
+
+        node = ParsePath()
+        if len(self.__built) >= self.__max_nodes:
+            node.fallback = state_name
+            return node
+        self.__built[built_key] = node
+
+        while True:
+            state = self.__states[state_name]
+            counts = dict(visits)
+            if (
+                    (counts.get(state_name, 0) >= self.__max_visits) or
+                    not self.__specialisable(state)
+            ):
+                node.fallback = state_name
+                return node
+
+            counts[state_name] = counts.get(state_name, 0) + 1
+            visits = tuple(sorted(counts.items()))
+            node.ops.extend(state.ops)
+
+            (first, *rest) = state.transitions
+            if (first["type"] == "default") and not rest:
+                if first["next_state"] is None:
+                    return node
+                state_name = first["next_state"]
+                continue
+
+            node.state = state
+            for transition in state.transitions:
+                target = None
+                if transition["next_state"] is not None:
+                    target = self.__build(transition["next_state"], visits)
+
+                if transition["type"] == "default":
+                    node.default = target
+                    break
+                node.targets.setdefault(int(transition["value"], 0), target)
+            return node
+
+
+class Collector(ABC):
+    """A parse collector.
+
+    Parameters
+    ----------
+    errors : dict, optional
+        The program's error codes keyed on their names. Defaults to the P4 core errors.
+
+    """
+
+    def __init__(self, errors=None):
         self.__packet_in = None
         self.__bus = None
+        self.__error = None
+        self.__errors = CORE_ERRORS if errors is None else errors
 
     def reset(self, bus, packet_in):
         """Reset the collector with a new input packet and bus.
 
         Parameters
         ----------
-        bus : `pyp4.packet.Bus`
+        bus : `pyp4.bus.Bus`
             The metadata + headers bus for an empty packet.
         packet_in : `<PacketIO specific PacketClass>`
             The input packet.
@@ -172,14 +493,38 @@ class Collector(ABC):
         """
         self.__bus = bus
         self.__packet_in = packet_in
+        self.__error = None
+
+        # The input packet is the unparsed packet whilst parsing so that lookahead can be used.
+        if bus is not None:
+            bus.packet.unparsed = packet_in
 
     @property
     def _packet_in(self):
         return self.__packet_in
 
+    @property
+    def error(self):
+        """`int`: The error code the packet was rejected with or None if it was not rejected."""
+        return self.__error
+
+    def reject(self, error):
+        """Reject the packet.
+
+        Parameters
+        ----------
+        error : `int`
+            The parser error code.
+
+        """
+        self.__error = error
+
+    def _reject(self, error_name):
+        self.reject(self.__errors[error_name])
+
     @property
     def bus(self):
-        """`pyp4.packet.Bus`: The bus that the collector is using."""
+        """`pyp4.bus.Bus`: The bus that the collector is using."""
         return self.__bus
 
     def extract(self, parameters):
@@ -209,6 +554,48 @@ class Collector(ABC):
     def _extract(self, header_name):
         raise NotImplementedError
 
+    def extract_vl(self, parameters, bitwidth):
+        """Extract a packet header with a variable-size field.
+
+        Parameters
+        ----------
+        parameters : dict
+            The header parameter of the parse operation in BM JSON format.
+        bitwidth : `int`
+            The bitwidth of the variable-size field.
+
+        Returns
+        -------
+        `str`
+            The name of extracted header.
+
+        """
+        assert self.__packet_in
+        assert len(parameters) == 1
+        header_name = parameters[0]["value"]
+        self._extract_vl(header_name, bitwidth)
+        return header_name
+
+    @abstractmethod
+    def _extract_vl(self, header_name, bitwidth):
+        raise NotImplementedError
+
+    def advance(self, bitwidth):
+        """Skip over bits of the packet.
+
+        Parameters
+        ----------
+        bitwidth : `int`
+            The number of bits to skip.
+
+        """
+        assert self.__packet_in
+        self._advance(bitwidth)
+
+    @abstractmethod
+    def _advance(self, bitwidth):
+        raise NotImplementedError
+
     def finalise(self):
         """Finalise the parsed packet.
 
@@ -223,13 +610,56 @@ class StackCollector(Collector):
     """A parse collector for header stack packets."""
 
     def _extract(self, header_name):
-        self.bus.packet[header_name] = self._packet_in.pop()
+        # The headers of the input stack are moved into the packet.
+        self.bus.packet.adopt(header_name, self._packet_in.pop())
+
+    def _extract_vl(self, header_name, bitwidth):
+        # The header on the stack already carries its variable-size field.
+        self._extract(header_name)
+        assert self.bus.packet[header_name].varbit.bitwidth == bitwidth
+
+    def _advance(self, bitwidth):
+        # Headers on the stack have no binary representation to skip over.
+        raise NotImplementedError
 
 
 class BinaryCollector(Collector):
-    """A parse collector for binary packets."""
+    """A parse collector for binary packets.
+
+    The extracted headers are decoded lazily so that fields which are never accessed are never
+    decoded.
+
+    """
 
     def _extract(self, header_name):
+        self.bus.packet.add_header(header_name)
+        self.__extract_header(self.bus.packet[header_name])
+
+    def _extract_vl(self, header_name, bitwidth):
         self.bus.packet.add_header(header_name)
         header = self.bus.packet[header_name]
-        header.from_bytes(self._packet_in.get_next(header.bytelen))
+        if bitwidth > header.varbit.max_bitwidth:
+            header.set_invalid()
+            self._reject("HeaderTooShort")
+            return
+        if (bitwidth % 8) != 0:
+            header.set_invalid()
+            self._reject("ParserInvalidArgument")
+            return
+        header.set_varbit_bitwidth(bitwidth)
+        self.__extract_header(header)
+
+    def __extract_header(self, header):
+        offset = self._packet_in.position
+        if (len(self._packet_in) - offset) < header.bytelen:
+            header.set_invalid()
+            self._reject("PacketTooShort")
+            return
+        header.from_bytes(self._packet_in.get_next(header.bytelen), offset, lazy=True)
+
+    def _advance(self, bitwidth):
+        assert (bitwidth % 8) == 0
+        if (len(self._packet_in) - self._packet_in.position) < (bitwidth // 8):
+            self._reject("PacketTooShort")
+            return
+        self._packet_in.get_next(bitwidth // 8)
@@ -1,13 +1,16 @@
 """P4 process."""
 
 from abc import ABC, abstractmethod
+from collections import deque
 from itertools import filterfalse, tee
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from pyp4 import PacketIO
+from pyp4 import DeparseMode, PacketIO
 from pyp4.action import Action
+from pyp4.bus import Bus, Metadata
 from pyp4.deparser import Deparser
-from pyp4.packet import Bus, Header, Packet
+from pyp4.layout import HeaderType
+from pyp4.packet import Header, Packet
 from pyp4.parser import Parser
 from pyp4.block import Block
 
@@ -37,12 +40,28 @@ class Process(ABC):
     packet_io
         External packet representation type.
     extern : <processor specific ExternClass>, optional
-        The processor's extern object for extern calls.
+        The processor's extern object for extern calls. If it has ``table_hit`` and
+        ``table_reset`` methods, the blocks call them when a table with direct counters or meters
+        hits and when entries are inserted into it or it is reset, see `pyp4.block.Block`.
+    deparse_mode : optional
+        Deparse mode for binary packets.
 
     """
     # pylint: disable=too-many-instance-attributes
     # Reason: this is the central class of PyP4 - it needs to hold a lot.
 
+    # The maximum number of released buses kept for reuse.
+    BUS_POOL_SIZE = 64
+
+    # The metadata the architecture accesses in addition to the metadata used by the program.
+    ARCHITECTURE_METADATA: Tuple[str, ...] = ()
+
+    # The sections of a program in BM JSON format that can refer to metadata when executed.
+    __EXECUTABLE_SECTIONS = (
+        "parsers", "deparsers", "actions", "pipelines", "calculations", "checksums", "field_lists",
+        "learn_lists", "extern_instances",
+    )
+
     # P4 spec only guarantees that individual extern calls are executed atomically. Multiple extern
     # operations do not have such a guarantee. Therefore, the P4 spec allows for an @atomic
     # annotation to indicate blocks that need to be executed atomically. However, it is not clear
@@ -59,7 +78,10 @@ class Process(ABC):
             program: Dict,
             packet_io: PacketIO = PacketIO.BINARY,
             extern: Optional[Any] = None,
+            deparse_mode: DeparseMode = DeparseMode.COPY,
     ):
+        # pylint: disable=too-many-arguments
+        # reason: all arguments are required during initialisation
         self.__name = name
 
         # Validate the program.
@@ -85,10 +107,27 @@ class Process(ABC):
 
         # We only need to validate the packet headers for packet IO.
         self.__validate_packet_io(self.__header_types, packet_io)
+        self.__packet_io = packet_io
+
+        # The layouts of the header types are shared by all the headers created by the process.
+        self.__header_layouts = {
+            name: HeaderType.from_bm(header_type)
+            for name, header_type in self.__header_types.items()
+        }
+        self.__metadata_layouts = {
+            name: HeaderType.from_bm(header_type)
+            for name, header_type in self.__metadata_types.items()
+        }
+
+        # The buses only hold the metadata that can ever be used.
+        used = self.__analyse_metadata(program, self.__metadata_defs)
+        used.update(self.ARCHITECTURE_METADATA)
+        self.__used_metadata = tuple(name for name in self.__metadata_defs if name in used)
 
         # Parsers.
+        errors = dict(program["errors"]) if "errors" in program else None
         self.__parsers = {
-            pars["name"]: Parser(self.name, pars, packet_io)
+            pars["name"]: Parser(self.name, pars, packet_io, extern, errors)
             for pars in program["parsers"]
         }
 
@@ -100,16 +139,22 @@ class Process(ABC):
 
         # Blocks (called pipelines in the JSON).
         self.__blocks = {
-            block["name"]: Block(self.name, block, actions)
+            block["name"]: Block(
+                self.name, block, actions, self.__field_bitwidth,
+                getattr(extern, "table_hit", None), getattr(extern, "table_reset", None),
+            )
             for block in program["pipelines"]
         }
 
         # Deparsers.
         self.__deparsers = {
-            depars["name"]: Deparser(self.name, depars, packet_io)
+            depars["name"]: Deparser(self.name, depars, packet_io, deparse_mode)
             for depars in program["deparsers"]
         }
 
+        # Released buses ready for reuse. Appending and popping is thread-safe.
+        self.__bus_pool = deque(maxlen=self.BUS_POOL_SIZE)
+
         # Keep track of enums so that they can be used by name.
         self.__enums = {
             enum["name"]: {kv[0]: kv[1] for kv in enum["entries"]}
@@ -121,6 +166,52 @@ class Process(ABC):
         """The name of the process."""
         return self.__name
 
+    @property
+    def packet_io(self) -> PacketIO:
+        """External packet representation type."""
+        return self.__packet_io
+
+    @property
+    def header_names(self) -> Tuple[str, ...]:
+        """The names of the packet headers of the program."""
+        return tuple(self.__header_defs)
+
+    @property
+    def used_metadata(self) -> Tuple[str, ...]:
+        """The names of the metadata the program or the architecture can access."""
+        return self.__used_metadata
+
+    @classmethod
+    def __analyse_metadata(cls, program: Dict, metadata_defs: Dict) -> Set[str]:
+        """Find the metadata the program refers to.
+
+        Any reference to a metadata name in the executable sections of the program counts as a use.
+
+        Parameters
+        ----------
+        program
+            The program in BM JSON format.
+        metadata_defs
+            The metadata definitions keyed on their names.
+
+        Returns
+        -------
+        :
+            The names of the metadata the program can use.
+
+        """
+        used = set()
+        pending = [program.get(section, []) for section in cls.__EXECUTABLE_SECTIONS]
+        while pending:
+            element = pending.pop()
+            if isinstance(element, dict):
+                pending.extend(element.values())
+            elif isinstance(element, list):
+                pending.extend(element)
+            elif isinstance(element, str) and (element in metadata_defs):
+                used.add(element)
+        return used
+
     @staticmethod
     @abstractmethod
     def _validate_program(program: Dict) -> None:
@@ -190,7 +281,10 @@ class Process(ABC):
         if packet_io == PacketIO.BINARY:
             # We do not support headers that do not divide nicely into 8-bit bytes.
             for hdr_t in header_types.values():
-                invalid = filter(lambda field: (field[1] % 8) != 0, hdr_t["fields"])
+                # Variable-size fields are checked when they are extracted.
+                invalid = filter(
+                    lambda field: (field[1] != "*") and ((field[1] % 8) != 0), hdr_t["fields"],
+                )
                 if next(invalid, None) is not None:
                     raise ValueError(
                         "Only bitwidths that are a multiple of 8 are supported for "
@@ -216,14 +310,37 @@ class Process(ABC):
             A new instance of that header.
 
         """
-        (defs, types) = ((self.__metadata_defs, self.__metadata_types) if metadata else
-                         (self.__header_defs, self.__header_types))
+        return Header(self.header_type(header_name, metadata))
+
+    def header_type(self, header_name: str, metadata: bool = False) -> HeaderType:
+        """Get the type of a header by its name.
+
+        Parameters
+        ----------
+        header_name
+            The name of the header.
+        metadata : optional
+            True if this is actually a metadata "header".
+
+        Returns
+        -------
+        :
+            The type shared by all instances of that header.
+
+        """
+        (defs, types) = ((self.__metadata_defs, self.__metadata_layouts) if metadata else
+                         (self.__header_defs, self.__header_layouts))
 
         assert header_name in defs
         header_type = defs[header_name]["header_type"]
         assert header_type in types
 
-        return Header(types[header_type]["fields"])
+        return types[header_type]
+
+    def __field_bitwidth(self, header_name: str, field_name: str) -> Optional[int]:
+        header_type = self.header_type(header_name, header_name not in self.__header_defs)
+        width = header_type.widths[header_type.index(field_name)]
+        return None if width is None else width.bitwidth
 
     def metadata(self) -> Dict[str, Header]:
         """Get a new instance of the program metadata dictionary.
@@ -236,6 +353,9 @@ class Process(ABC):
         """
         return {name: self.header(name, True) for name in self.__metadata_defs}
 
+    def __new_metadata(self, name: str) -> Header:
+        return Header(self.__metadata_layouts[self.__metadata_defs[name]["header_type"]])
+
     def packet(self) -> Packet:
         """Get a new instance of a packet.
 
@@ -245,18 +365,37 @@ class Process(ABC):
             A new instance of the internal representation of a packet.
 
         """
-        return Packet(self.__header_types, self.__header_defs)
+        return Packet(self.__header_layouts, self.__header_defs)
 
     def bus(self) -> Bus:
         """Get a new instance of a bus.
 
+        A bus that was released with :py:meth:`release` is reused if there is one.
+
         Returns
         -------
         :
             A new instance of the internal metadata + headers bus.
 
         """
-        return Bus(self.metadata(), self.packet())
+        try:
+            return self.__bus_pool.pop()
+        except IndexError:
+            return Bus(Metadata(self.__used_metadata, self.__new_metadata), self.packet())
+
+    def release(self, bus: Bus) -> None:
+        """Release a bus that is no longer used so that it can be reused by :py:meth:`bus`.
+
+        The bus is reset. Neither the bus nor any of its headers may be used after it was released.
+
+        Parameters
+        ----------
+        bus
+            A bus created by this process.
+
+        """
+        bus.reset()
+        self.__bus_pool.append(bus)
 
     @property
     def parsers(self) -> Dict[str, Parser]:
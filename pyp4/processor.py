@@ -1,7 +1,7 @@
 """P4 processor framework definition."""
 
 from abc import ABC, abstractmethod
-from typing import Any, List, Optional, Tuple
+from typing import Any, Iterable, List, Optional, Tuple
 
 from pyp4.process import Process
 from pyp4.table import Table
@@ -116,3 +116,23 @@ class Processor(ABC):
 
         """
         raise NotImplementedError
+
+    def input_batch(self, packets_in: Iterable[Tuple[Any, Any]]) -> List[List[Tuple[Any, Any]]]:
+        """Process a batch of incoming packets.
+
+        The default implementation processes each packet with :py:meth:`input`. Processors may
+        override it to amortise per-packet costs over the batch.
+
+        Parameters
+        ----------
+        packets_in : Iterable[Tuple[<processor specific PortMeta>, <process specific PacketClass>]]
+            The input port metadata and the input packet of each packet.
+
+        Returns
+        -------
+        List[List[Tuple[<processor specific PortMeta>, <process specific PacketClass>]]]
+            For each input packet in order, the list of its output packets as returned by
+            :py:meth:`input`.
+
+        """
+        return [self.input(port_in_meta, packet_in) for port_in_meta, packet_in in packets_in]
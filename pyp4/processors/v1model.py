@@ -1,16 +1,49 @@
-"""V1Model processor."""
+"""V1Model processor.
+
+The externs, the packet replication engine and the types of the V1Model are in their own modules
+and can also be imported from this module.
+
+"""
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-from pyp4 import PacketIO
+from pyp4 import DeparseMode, PacketIO
+from pyp4.binary import BinaryPacket
 from pyp4.block import Block
+from pyp4.bus import Bus
+from pyp4.calculation import Checksum
 from pyp4.deparser import Deparser
-from pyp4.packet import BinaryPacket, Bus, FixedInt, Header, HeaderStack
+from pyp4.packet import Header, HeaderStack
 from pyp4.parser import Parser
 from pyp4.process import Process
 from pyp4.processor import Processor
+from pyp4.processors.v1model_extern import Counter, Meter, Register, V1ModelExtern
+from pyp4.processors.v1model_pre import V1ModelPre
+from pyp4.processors.v1model_types import (
+    _V1ModelWork,
+    EgressItem,
+    IngressItem,
+    PortPacket,
+    Preserved,
+    V1ModelInstanceType,
+    V1ModelMeterColor,
+    V1ModelPortMeta,
+)
+
+__all__ = [
+    "Counter",
+    "Meter",
+    "Register",
+    "V1ModelExtern",
+    "V1ModelInstanceType",
+    "V1ModelMeterColor",
+    "V1ModelPortMeta",
+    "V1ModelPre",
+    "V1ModelProcess",
+    "V1ModelProcessor",
+    "V1ModelRuntimeAbc",
+]
 
 
 class V1ModelProcessor(Processor):
@@ -18,33 +51,119 @@ class V1ModelProcessor(Processor):
 
     For more details, see https://github.com/p4lang/p4c/blob/master/p4include/v1model.p4.
 
+    Clones, resubmitted packets and recirculated packets are processed iteratively as in BMv2's
+    simple_switch. A clone made at the end of ingress is the input packet parsed again, one made at
+    the end of egress is a copy of the bus. Both have their metadata reset except for the fields
+    of their field list. Each resubmit, recirculate and egress clone counts as a loop of the input
+    packet and a request that would exceed the loop limit is ignored, i.e. the packet is dropped
+    instead of resubmitted or recirculated and the egress clone is not made.
+
+    The checksums of the program are verified after parsing, setting ``checksum_error`` if any of
+    them is wrong, and updated before deparsing, see `pyp4.calculation.Checksum`.
+
     Parameters
     ----------
     runtime
         The runtime instance for the V1Model.
+    loop_limit : optional
+        The maximum number of loops of a packet.
 
     """
 
-    def __init__(self, runtime: 'V1ModelRuntimeAbc'):
+    # The default maximum number of loops of a packet.
+    LOOP_LIMIT = 16
+
+    def __init__(self, runtime: 'V1ModelRuntimeAbc', loop_limit: int = LOOP_LIMIT):
         # This processor requires a runtime
         assert runtime is not None
         super().__init__(runtime)
+        if loop_limit < 0:
+            raise ValueError(f"Invalid loop limit {loop_limit}")
+        self.__loop_limit = loop_limit
+        self.__pre = V1ModelPre()
 
     @property
-    def __parser(self) -> Parser:
-        return self._process.parsers["parser"]
+    def pre(self) -> V1ModelPre:
+        """The packet replication engine which holds the multicast groups and clone sessions."""
+        return self.__pre
 
     @property
-    def __ingress(self) -> Block:
-        return self._process.blocks["ingress"]
+    def loop_limit(self) -> int:
+        """The maximum number of resubmit, recirculate and egress clone loops of a packet."""
+        return self.__loop_limit
 
-    @property
-    def __egress(self) -> Block:
-        return self._process.blocks["egress"]
+    def register(self, name: str) -> Register:
+        """Access a register in the running P4 process.
 
-    @property
-    def __deparser(self) -> Deparser:
-        return self._process.deparsers["deparser"]
+        Parameters
+        ----------
+        name
+            The name of the register as defined by the program.
+
+        Returns
+        -------
+        :
+            The register.
+
+        """
+        registers = self._process.extern.registers
+        if name not in registers:
+            raise ValueError(f"Register {name} does not exist in this program")
+        return registers[name]
+
+    def counter(self, name: str) -> Counter:
+        """Access a counter in the running P4 process.
+
+        The cells of a direct counter are indexed by the entry handles of its table.
+
+        Parameters
+        ----------
+        name
+            The name of the counter as defined by the program.
+
+        Returns
+        -------
+        :
+            The counter.
+
+        """
+        counters = self._process.extern.counters
+        if name not in counters:
+            raise ValueError(f"Counter {name} does not exist in this program")
+        return counters[name]
+
+    def meter(self, name: str) -> Meter:
+        """Access a meter in the running P4 process.
+
+        The cells of a direct meter are indexed by the entry handles of its table.
+
+        Parameters
+        ----------
+        name
+            The name of the meter as defined by the program.
+
+        Returns
+        -------
+        :
+            The meter.
+
+        """
+        meters = self._process.extern.meters
+        if name not in meters:
+            raise ValueError(f"Meter {name} does not exist in this program")
+        return meters[name]
+
+    def __stages(self) -> Tuple[Parser, Block, Block, Deparser]:
+        process = self._process
+        return (
+            process.parsers["parser"],
+            process.blocks["ingress"],
+            process.blocks["egress"],
+            process.deparsers["deparser"],
+        )
+
+    def __time(self, timestamp: Optional[int]) -> int:
+        return int(self._runtime.time()) if timestamp is None else timestamp
 
     @staticmethod
     def __check_field(field_name: str, standard_metadata: Header) -> None:
@@ -52,47 +171,258 @@ class V1ModelProcessor(Processor):
             raise ValueError(f"Field {field_name} was not provided in standard_metadata")
 
     @staticmethod
-    def __initialise_metadata(bus: Bus, port_in_meta: 'V1ModelPortMeta') -> None:
+    def __initialise_metadata(bus: Bus, port_in_meta: V1ModelPortMeta) -> None:
         standard_metadata = bus.metadata["standard_metadata"]
 
         # Check the provided standard_metadata.
         V1ModelProcessor.__check_field("ingress_port", port_in_meta.standard_metadata)
 
         # Copy over the input standard_metadata.
-        for field, value in port_in_meta.standard_metadata.items():
-            standard_metadata[field].val = value
+        for field_name, value in port_in_meta.standard_metadata.items():
+            standard_metadata[field_name].val = value
 
         # Initialise certain fields to architecture-specific values.
         standard_metadata["egress_spec"].set_max_val()
 
-    def __ingress_process(self, bus: Bus) -> None:
-        bus.metadata["standard_metadata"]["ingress_global_timestamp"].val = int(
-            self._runtime.time())
-        self.__ingress.process(bus)
+    @staticmethod
+    def __loop_port_meta(
+            port_in_meta: V1ModelPortMeta, instance_type: V1ModelInstanceType,
+    ) -> V1ModelPortMeta:
+        return V1ModelPortMeta(
+            {**port_in_meta.standard_metadata, "instance_type": instance_type.value}
+        )
+
+    def __preserve(self, bus: Bus, field_list_id: int) -> Preserved:
+        return tuple(
+            (header_name, field_name, bus.get_hdr(header_name)[field_name].val)
+            for header_name, field_name in self._process.field_list(field_list_id)
+        )
+
+    @staticmethod
+    def __restore(bus: Bus, preserved: Preserved) -> None:
+        for header_name, field_name, value in preserved:
+            bus.get_hdr(header_name)[field_name].val = value
 
     @staticmethod
-    def __replication(bus: Bus) -> None:
-        bus_list = []
-        if not bus.metadata["standard_metadata"]["egress_spec"].is_max_val():
-            bus_list.append(bus)
-        return bus_list
+    def __clone_metadata(
+            bus: Bus, preserved: Preserved, instance_type: V1ModelInstanceType, port: int,
+            rid: int,
+    ) -> None:
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # Reason: a clone gets the preserved fields and its own instance type, port and rid.
+        V1ModelProcessor.__restore(bus, preserved)
+        standard_metadata = bus.metadata["standard_metadata"]
+        standard_metadata["instance_type"].val = instance_type.value
+        standard_metadata["egress_spec"].val = port
+        standard_metadata["egress_rid"].val = rid
+
+    def __new_bus(self, work: _V1ModelWork) -> Bus:
+        bus = self._process.bus()
+        work.buses.append(bus)
+        return bus
+
+    def __ingress_start(
+            self, work: _V1ModelWork, item: IngressItem, parser: Parser,
+    ) -> Tuple[Bus, Optional[Union[BinaryPacket, HeaderStack]]]:
+        (packet_in, port_in_meta, preserved, _) = item
 
-    def __egress_process(self, bus_list: List[Bus]) -> None:
-        for bus in bus_list:
-            bus.metadata["standard_metadata"]["egress_port"].val = (
-                bus.metadata["standard_metadata"]["egress_spec"].val)
-            bus.metadata["standard_metadata"]["egress_global_timestamp"].val = int(
-                self._runtime.time())
+        # Clones made at the end of ingress and resubmitted packets need the unparsed packet.
+        original = packet_in.copy() if self._process.needs_original_packet else None
 
-            self.__egress.process(bus)
+        bus = self.__new_bus(work)
+        self.__initialise_metadata(bus, port_in_meta)
+        if isinstance(packet_in, BinaryPacket) and (
+                "packet_length" not in port_in_meta.standard_metadata):
+            bus.metadata["standard_metadata"]["packet_length"].val = len(packet_in)
+        self.__restore(bus, preserved)
+
+        # A rejected packet goes straight to ingress with the parser error set.
+        parser_error = parser.process(bus, packet_in)
+        bus.metadata["standard_metadata"]["parser_error"].val = parser_error
+
+        checksums = self._process.checksums
+        if checksums:
+            baselines = work.checksums[id(bus)] = {}
+            verified = [checksum.verify(bus, baselines) for checksum in checksums]
+            bus.metadata["standard_metadata"]["checksum_error"].val = int(not all(verified))
+        return bus, original
+
+    def __ingress_process(self, bus: Bus, ingress: Block, timestamp: Optional[int]) -> None:
+        bus.metadata["standard_metadata"]["ingress_global_timestamp"].val = self.__time(timestamp)
+        ingress.process(bus)
+
+    def __ingress_end(
+            self,
+            work: _V1ModelWork,
+            bus: Bus,
+            original: Optional[Union[BinaryPacket, HeaderStack]],
+            item: IngressItem,
+            parser: Parser,
+    ) -> None:
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # Reason: the clones and the resubmitted packet are made from the original packet.
+        clone = bus.requests.get("clone")
+        resubmit = bus.requests.get("resubmit")
+        bus.requests.clear()
+
+        if clone is not None:
+            self.__ingress_clone(work, bus, clone, original, item, parser)
+
+        if resubmit is not None:
+            self.__resubmit(work, item, original, self.__preserve(bus, resubmit))
+            return
+
+        (_, port_in_meta, _, loops) = item
+        for replica in self.__replication(bus):
+            if replica is not bus:
+                work.buses.append(replica)
+            work.egress.append((replica, port_in_meta, loops))
+
+    def __ingress_clone(
+            self,
+            work: _V1ModelWork,
+            bus: Bus,
+            clone: Tuple[int, int],
+            original: Optional[Union[BinaryPacket, HeaderStack]],
+            item: IngressItem,
+            parser: Parser,
+    ) -> None:
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # Reason: ingress clones are parsed again from the original packet.
+        (_, port_in_meta, _, loops) = item
+        (session, field_list_id) = clone
+        preserved = self.__preserve(bus, field_list_id)
+        for port, rid in self.__pre.mirror_replicas(session):
+            clone_bus = self.__new_bus(work)
+            self.__initialise_metadata(clone_bus, port_in_meta)
+            parser.process(clone_bus, original.copy())
+            self.__clone_metadata(
+                clone_bus, preserved, V1ModelInstanceType.INGRESS_CLONE, port, rid,
+            )
+            work.egress.append((clone_bus, port_in_meta, loops))
+
+    def __resubmit(
+            self,
+            work: _V1ModelWork,
+            item: IngressItem,
+            original: Optional[Union[BinaryPacket, HeaderStack]],
+            preserved: Preserved,
+    ) -> None:
+        (_, port_in_meta, _, loops) = item
+        if loops < self.__loop_limit:
+            work.ingress.append((
+                original,
+                self.__loop_port_meta(port_in_meta, V1ModelInstanceType.RESUBMIT),
+                preserved,
+                loops + 1,
+            ))
+
+    def __replication(self, bus: Bus) -> List[Bus]:
+        standard_metadata = bus.metadata["standard_metadata"]
+        mcast_grp = standard_metadata["mcast_grp"].val
+        if mcast_grp != 0:
+            return self.__pre.replicate(bus, mcast_grp)
+        if standard_metadata["egress_spec"].is_max_val():
+            return []
+        return [bus]
+
+    def __egress_init(self, bus: Bus, timestamp: Optional[int]) -> None:
+        bus.metadata["standard_metadata"]["egress_port"].val = (
+            bus.metadata["standard_metadata"]["egress_spec"].val)
+        bus.metadata["standard_metadata"]["egress_global_timestamp"].val = self.__time(timestamp)
+
+    def __egress_end(self, work: _V1ModelWork, item: EgressItem, deparser: Deparser) -> None:
+        (bus, _, loops) = item
+        clone = bus.requests.get("clone")
+        recirculate = bus.requests.get("recirculate")
+        bus.requests.clear()
+
+        if (clone is not None) and (loops < self.__loop_limit):
+            self.__egress_clone(work, item, clone)
+
+        if bus.metadata["standard_metadata"]["egress_spec"].is_max_val():
+            bus.packet.clear()
+            return
+
+        self.__update_checksums(work, bus)
+        packet_out = deparser.process(bus.packet)
+        if recirculate is not None:
+            self.__recirculate(work, item, packet_out, recirculate)
+            return
+
+        work.outputs.append((bus, packet_out))
+
+    def __egress_clone(self, work: _V1ModelWork, item: EgressItem, clone: Tuple[int, int]) -> None:
+        (bus, port_in_meta, loops) = item
+        (session, field_list_id) = clone
+        preserved = self.__preserve(bus, field_list_id)
+        for port, rid in self.__pre.mirror_replicas(session):
+            clone_bus = bus.clone()
+            work.buses.append(clone_bus)
+            for struct in clone_bus.metadata.created.values():
+                struct.reset()
+                struct.set_valid()
+            self.__initialise_metadata(clone_bus, port_in_meta)
+            self.__clone_metadata(
+                clone_bus, preserved, V1ModelInstanceType.EGRESS_CLONE, port, rid,
+            )
+            work.egress.append((clone_bus, port_in_meta, loops + 1))
+
+    def __update_checksums(self, work: _V1ModelWork, bus: Bus) -> None:
+        baselines = work.checksums.get(id(bus), {})
+        for checksum in self._process.checksums:
+            checksum.update(bus, baselines)
+
+    def __recirculate(
+            self,
+            work: _V1ModelWork,
+            item: EgressItem,
+            packet_out: Union[BinaryPacket, HeaderStack],
+            field_list_id: int,
+    ) -> None:
+        (bus, port_in_meta, loops) = item
+        if loops < self.__loop_limit:
+            work.ingress.append((
+                packet_out,
+                self.__loop_port_meta(port_in_meta, V1ModelInstanceType.RECIRC),
+                self.__preserve(bus, field_list_id),
+                loops + 1,
+            ))
+
+    def __drain(
+            self,
+            work: _V1ModelWork,
+            stages: Tuple[Parser, Block, Block, Deparser],
+            timestamp: Optional[int],
+    ) -> None:
+        (parser, ingress, egress, deparser) = stages
+        # Buses already in egress go first to keep the packets of a loop in order.
+        while work.egress or work.ingress:
+            if work.egress:
+                item = work.egress.popleft()
+                self.__egress_init(item[0], timestamp)
+                egress.process(item[0])
+                self.__egress_end(work, item, deparser)
+            else:
+                item = work.ingress.popleft()
+                (bus, original) = self.__ingress_start(work, item, parser)
+                self.__ingress_process(bus, ingress, timestamp)
+                self.__ingress_end(work, bus, original, item, parser)
+
+    def __finish(self, work: _V1ModelWork) -> List[PortPacket]:
+        port_packet_out = self.__emit(work.outputs)
+
+        # Deparsed header stacks carry the headers of the bus so only binary packets free the bus.
+        if self._process.packet_io == PacketIO.BINARY:
+            for bus in work.buses:
+                self._process.release(bus)
 
-            if bus.metadata["standard_metadata"]["egress_spec"].is_max_val():
-                bus.packet.clear()
+        return port_packet_out
 
     @staticmethod
     def __emit(
             bus_packet_out_list: List[Tuple[Bus, Union[BinaryPacket, HeaderStack]]],
-    ) -> List[Tuple['V1ModelPortMeta', Union[BinaryPacket, HeaderStack]]]:
+    ) -> List[PortPacket]:
         port_packet_out = []
         for bus, packet_out in bus_packet_out_list:
             if packet_out:
@@ -105,9 +435,9 @@ class V1ModelProcessor(Processor):
 
     def input(
             self,
-            port_in_meta: 'V1ModelPortMeta',
+            port_in_meta: V1ModelPortMeta,
             packet_in: Union[BinaryPacket, HeaderStack],
-    ) -> List[Tuple['V1ModelPortMeta', Union[BinaryPacket, HeaderStack]]]:
+    ) -> List[PortPacket]:
         """Process an incoming packet.
 
         The input packet is consumed and the output packets are brand new object.
@@ -125,62 +455,121 @@ class V1ModelProcessor(Processor):
             One tuple of the output port metadata and the packet for each output packet
 
         """
-        bus = self._process.bus()
-
-        # ------------------------------------------------------------------------------------------
-        # Initialise metadata.
-        # ------------------------------------------------------------------------------------------
+        return self.__input(port_in_meta, packet_in, self.__stages(), None)
 
-        self.__initialise_metadata(bus, port_in_meta)
-
-        # ------------------------------------------------------------------------------------------
-        # Parser
-        # ------------------------------------------------------------------------------------------
+    def input_batch(
+            self,
+            packets_in: Iterable[PortPacket],
+            batch_timestamp: bool = False,
+            stage_major: bool = False,
+    ) -> List[List[PortPacket]]:
+        """Process a batch of incoming packets.
 
-        self.__parser.process(bus, packet_in)
+        The packets are processed one after the other exactly as by :py:meth:`input`, but the
+        pipeline stages are looked up once for the whole batch and the buses of binary packets are
+        reused from one packet to the next.
 
-        # ------------------------------------------------------------------------------------------
-        # Ingress
-        # ------------------------------------------------------------------------------------------
+        Parameters
+        ----------
+        packets_in
+            The input port metadata and the input packet of each packet. This may be a stream.
+        batch_timestamp : optional
+            If True, the runtime time is read once for the whole batch and used as the ingress and
+            egress timestamp of all its packets. Otherwise it is read for each packet and stage.
+        stage_major : optional
+            If True, each stage of the pipeline processes the whole batch before the next stage
+            starts and the ingress and egress blocks apply each table to the whole batch at once,
+            see `pyp4.block.Block.process_batch`. The packets are fed to the pipeline as a whole,
+            so a stream is consumed before processing starts. Only the first pass through ingress
+            and egress is batched, clones and looping packets are then processed packet by packet.
 
-        self.__ingress_process(bus)
+        Returns
+        -------
+        :
+            For each input packet in order, the list of its output packets as returned by
+            :py:meth:`input`. The outputs of the input packet at index i are at index i.
 
-        # ------------------------------------------------------------------------------------------
-        # Replication
-        # ------------------------------------------------------------------------------------------
+        """
+        stages = self.__stages()
+        timestamp = int(self._runtime.time()) if batch_timestamp else None
+        if stage_major:
+            return self.__input_stage_major(list(packets_in), stages, timestamp)
+        return [
+            self.__input(port_in_meta, packet_in, stages, timestamp)
+            for port_in_meta, packet_in in packets_in
+        ]
+
+    def __input_stage_major(
+            self,
+            packets_in: List[PortPacket],
+            stages: Tuple[Parser, Block, Block, Deparser],
+            timestamp: Optional[int],
+    ) -> List[List[PortPacket]]:
+        (_, _, egress, deparser) = stages
+        works = [_V1ModelWork() for _ in packets_in]
 
-        bus_list = self.__replication(bus)
+        # Parse, ingress, clones, resubmit and replication
+        self.__ingress_batch(works, packets_in, stages, timestamp)
 
-        # ------------------------------------------------------------------------------------------
         # Egress
-        # ------------------------------------------------------------------------------------------
+        egress_items = self.__egress_batch(works)
+        for _, (bus, _, _) in egress_items:
+            self.__egress_init(bus, timestamp)
+        egress.process_batch([bus for _, (bus, _, _) in egress_items])
 
-        self.__egress_process(bus_list)
+        # Clones, drop, deparser and recirculate
+        for work, item in egress_items:
+            self.__egress_end(work, item, deparser)
 
-        # ------------------------------------------------------------------------------------------
-        # Deparser
-        # ------------------------------------------------------------------------------------------
+        # Loops and emit
+        for work in works:
+            self.__drain(work, stages, timestamp)
+        return [self.__finish(work) for work in works]
 
-        bus_packet_out_list = [(bus, self.__deparser.process(bus.packet)) for bus in bus_list]
-
-        # ------------------------------------------------------------------------------------------
-        # Emit
-        # ------------------------------------------------------------------------------------------
-
-        return self.__emit(bus_packet_out_list)
-
-
-@dataclass
-class V1ModelPortMeta:
-    """V1Model port metadata.
-
-    Parameters
-    ----------
-    standard_metadata
-        The V1Model standard metadata as a dictionary.
+    def __ingress_batch(
+            self,
+            works: List[_V1ModelWork],
+            packets_in: List[PortPacket],
+            stages: Tuple[Parser, Block, Block, Deparser],
+            timestamp: Optional[int],
+    ) -> None:
+        (parser, ingress, _, _) = stages
+
+        # Initialise metadata and parse.
+        items = [(packet_in, port_in_meta, (), 0) for port_in_meta, packet_in in packets_in]
+        starts = [
+            self.__ingress_start(work, item, parser) for work, item in zip(works, items)
+        ]
+
+        buses = [bus for bus, _ in starts]
+        for bus in buses:
+            bus.metadata["standard_metadata"]["ingress_global_timestamp"].val = self.__time(
+                timestamp)
+        ingress.process_batch(buses)
+
+        for work, (bus, original), item in zip(works, starts, items):
+            self.__ingress_end(work, bus, original, item, parser)
 
-    """
-    standard_metadata: dict
+    @staticmethod
+    def __egress_batch(works: List[_V1ModelWork]) -> List[Tuple[_V1ModelWork, EgressItem]]:
+        # The egress items of all the packets in order, each with the work it belongs to.
+        egress_items = []
+        for work in works:
+            egress_items.extend((work, item) for item in work.egress)
+            work.egress.clear()
+        return egress_items
+
+    def __input(
+            self,
+            port_in_meta: V1ModelPortMeta,
+            packet_in: Union[BinaryPacket, HeaderStack],
+            stages: Tuple[Parser, Block, Block, Deparser],
+            timestamp: Optional[int],
+    ) -> List[PortPacket]:
+        work = _V1ModelWork()
+        work.ingress.append((packet_in, port_in_meta, (), 0))
+        self.__drain(work, stages, timestamp)
+        return self.__finish(work)
 
 
 class V1ModelRuntimeAbc(ABC):
@@ -200,141 +589,86 @@ class V1ModelRuntimeAbc(ABC):
         raise NotImplementedError
 
 
-class V1ModelExtern:
-    """The V1Model extern functionality class.
+class V1ModelProcess(Process):
+    """The V1Model process.
 
     Parameters
     ----------
+    name
+        The process name.
     program
-        The program in BM JSON format.
+        The program to execute in the BM format.
+    packet_io
+        External packet representation type.
+    deparse_mode
+        Deparse mode for binary packets.
 
     """
 
-    def __init__(self, program: Dict):
-        self.__registers = {reg["name"]: Register(reg) for reg in program["register_arrays"]}
+    # The processor initialises and reads the standard metadata of every packet.
+    ARCHITECTURE_METADATA = ("standard_metadata",)
 
-    @staticmethod
-    def extern_assert(val: FixedInt) -> None:
-        """Execute the assert extern.
-
-        Parameters
-        ----------
-        val
-            The value to be asserted.
-
-        """
-        assert bool(val)
-
-    @staticmethod
-    def assume(val: FixedInt) -> None:
-        """Execute the assume extern.
+    # The primitives that need the input packet as it was before it was parsed.
+    __ORIGINAL_PACKET_OPS = frozenset(["clone_ingress_pkt_to_egress", "resubmit"])
 
-        Outside of formal verification tools, assume is equivalent to and assert.
-
-        Parameters
-        ----------
-        val
-            The value to be assumed.
-
-        """
-        assert bool(val)
-
-    @staticmethod
-    def log_msg(msg: str, data: Any) -> None:
-        """Execute the log_msg extern.
-
-        Parameters
-        ----------
-        msg
-            The message to log.
-        data
-            Arguments to print in the string.
-
-        """
-        print(msg.format(*data))
+    def __init__(
+            self,
+            name: str,
+            program: Dict,
+            packet_io: PacketIO = PacketIO.BINARY,
+            deparse_mode: DeparseMode = DeparseMode.COPY,
+    ):
+        extern = V1ModelExtern(program)
+        super().__init__(name, program, packet_io, extern, deparse_mode)
+        self.__extern = extern
+
+        self.__field_lists = {
+            field_list["id"]: tuple(
+                tuple(element["value"])
+                for element in field_list["elements"] if element["type"] == "field"
+            )
+            for field_list in program.get("field_lists", [])
+        }
+        self.__checksums = tuple(
+            Checksum(checksum, extern.calculations[checksum["calculation"]])
+            for checksum in program.get("checksums", [])
+        )
+        self.__needs_original_packet = any(
+            prim["op"] in self.__ORIGINAL_PACKET_OPS
+            for action in program["actions"] for prim in action["primitives"]
+        )
 
-    @staticmethod
-    def mark_to_drop(standard_metadata: Header) -> None:
-        """Execute the mark_to_drop extern.
+    @property
+    def extern(self) -> V1ModelExtern:
+        """The extern object which holds the state of the externs."""
+        return self.__extern
 
-        Parameters
-        ----------
-        standard_metadata
-            The standard metadata.
+    @property
+    def checksums(self) -> Tuple[Checksum, ...]:
+        """The checksums verified after parsing and updated before deparsing, in order."""
+        return self.__checksums
 
-        """
-        standard_metadata["egress_spec"].set_max_val()
+    @property
+    def needs_original_packet(self) -> bool:
+        """Whether the program can clone or resubmit the input packet at the end of ingress."""
+        return self.__needs_original_packet
 
-    def register_read(self, lval: FixedInt, register_name: str, index: FixedInt) -> None:
-        """Execute the register read extern.
+    def field_list(self, field_list_id: int) -> Tuple[Tuple[str, str], ...]:
+        """Get the fields of a field list.
 
         Parameters
         ----------
-        lval
-            The value in which the read value is to be stored.
-        register_name
-            The name of the register.
-        index
-            The index of the register from which to read.
-
-        """
-        lval.val = self.__registers[register_name][int(index)].val
+        field_list_id
+            The ID of the field list.
 
-    def register_write(self, register_name: str, index: FixedInt, rval: FixedInt) -> None:
-        """Execute the register write extern.
-
-        Parameters
-        ----------
-        register_name
-            The name of the register.
-        index
-            The index of the register into which to write to.
-        rval
-            The value that is to be written into the register.
+        Returns
+        -------
+        :
+            The (header name, field name) of each field. The unused ID 0 and unknown IDs have no
+            fields.
 
         """
-        self.__registers[register_name][int(index)].val = int(rval)
-
-
-class Register:
-    """A P4 register.
-
-    Parameters
-    ----------
-    bm_register
-        Register definition in BM JSON format.
-
-    """
-
-    def __init__(self, bm_register: Dict):
-        self.__bm_register = bm_register
-
-        self.__entries = []
-        for _ in range(self.__bm_register["size"]):
-            self.__entries.append(FixedInt(0, self.__bm_register["bitwidth"]))
-
-    def __getitem__(self, index: int) -> int:
-        """Return a register entry."""
-        return self.__entries[index]
-
-
-class V1ModelProcess(Process):
-    """The V1Model process.
-
-    Parameters
-    ----------
-    name
-        The process name.
-    program
-        The program to execute in the BM format.
-    packet_io
-        External packet representation type.
-
-    """
-
-    def __init__(self, name: str, program: Dict, packet_io: PacketIO = PacketIO.BINARY):
-        extern = V1ModelExtern(program)
-        super().__init__(name, program, packet_io, extern)
+        return self.__field_lists.get(field_list_id, ())
 
     @staticmethod
     def _validate_program(program):
@@ -0,0 +1,774 @@
+"""V1Model externs and their registers, counters and meters."""
+
+from array import array
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from pyp4.action import bus_extern
+from pyp4.bus import Bus
+from pyp4.calculation import Calculation
+from pyp4.layout import FixedInt
+from pyp4.packet import Header
+from pyp4.processors.v1model_types import V1ModelMeterColor
+
+
+class V1ModelExtern:
+    """The V1Model extern functionality class.
+
+    Parameters
+    ----------
+    program
+        The program in BM JSON format.
+
+    """
+
+    def __init__(self, program: Dict):
+        self.__registers = {reg["name"]: Register(reg) for reg in program["register_arrays"]}
+        self.__counters = {
+            counter["name"]: Counter(counter) for counter in program.get("counter_arrays", [])
+        }
+        self.__meters = {meter["name"]: Meter(meter) for meter in program.get("meter_arrays", [])}
+
+        # The direct counter, the direct meter and its result field of each table that has any.
+        self.__direct = {}
+        for counter in self.__counters.values():
+            if counter.binding is not None:
+                self.__direct[counter.binding] = (counter, None, None)
+        for bm_meter in program.get("meter_arrays", []):
+            meter = self.__meters[bm_meter["name"]]
+            if meter.binding is not None:
+                (counter, _, _) = self.__direct.get(meter.binding, (None, None, None))
+                self.__direct[meter.binding] = (counter, meter, tuple(bm_meter["result_target"]))
+
+        # The calculations read the field bitwidths from the header types of the program.
+        header_types = {
+            header_type["name"]: {field[0]: field[1] for field in header_type["fields"]}
+            for header_type in program["header_types"]
+        }
+        header_type_names = {hdr["name"]: hdr["header_type"] for hdr in program["headers"]}
+
+        def field_bitwidth(header_name: str, field_name: str) -> Optional[int]:
+            width = header_types[header_type_names[header_name]][field_name]
+            return None if width == "*" else width
+
+        self.__calculations = {
+            calculation["name"]: Calculation(calculation, field_bitwidth)
+            for calculation in program.get("calculations", [])
+        }
+
+    @property
+    def registers(self) -> Dict[str, 'Register']:
+        """The registers keyed on their names."""
+        return self.__registers
+
+    @property
+    def counters(self) -> Dict[str, 'Counter']:
+        """The counters, including the direct counters, keyed on their names."""
+        return self.__counters
+
+    @property
+    def meters(self) -> Dict[str, 'Meter']:
+        """The meters, including the direct meters, keyed on their names."""
+        return self.__meters
+
+    @property
+    def calculations(self) -> Dict[str, Calculation]:
+        """The hash calculations keyed on their names."""
+        return self.__calculations
+
+    @staticmethod
+    def __packet_time(bus: Bus) -> int:
+        # The egress timestamp is only set in egress and it is never earlier than the ingress one.
+        standard_metadata = bus.metadata["standard_metadata"]
+        return max(
+            standard_metadata["ingress_global_timestamp"].val,
+            standard_metadata["egress_global_timestamp"].val,
+        )
+
+    def table_hit(self, table_name: str, entry_handle: int, bus: Bus) -> None:
+        """Update the direct counter and execute the direct meter of a table entry that was hit.
+
+        Parameters
+        ----------
+        table_name
+            The name of the table.
+        entry_handle
+            The handle of the entry.
+        bus
+            The metadata + headers bus.
+
+        """
+        direct = self.__direct.get(table_name)
+        if direct is None:
+            return
+        (counter, meter, result_target) = direct
+        packet_length = bus.metadata["standard_metadata"]["packet_length"].val
+        if counter is not None:
+            counter.count(entry_handle, packet_length)
+        if meter is not None:
+            (header_name, field_name) = result_target
+            bus.get_hdr(header_name)[field_name].val = meter.execute(
+                entry_handle, packet_length, self.__packet_time(bus),
+            )
+
+    def table_reset(self, table_name: str, entry_handle: Optional[int] = None) -> None:
+        """Reset the direct counter and meter cells of a newly inserted entry or of a reset table.
+
+        As for BMv2, the counts of an inserted entry start at zero and its meter rates are unset.
+
+        Parameters
+        ----------
+        table_name
+            The name of the table.
+        entry_handle
+            The handle of the inserted entry or None to reset the cells of all entries.
+
+        """
+        direct = self.__direct.get(table_name)
+        if direct is None:
+            return
+        (counter, meter, _) = direct
+        if entry_handle is None:
+            if counter is not None:
+                counter.reset()
+            if meter is not None:
+                meter.reset_rates()
+        else:
+            if counter is not None:
+                counter.reset_cell(entry_handle)
+            if meter is not None:
+                meter.reset_cell(entry_handle)
+
+    @staticmethod
+    def extern_assert(val: FixedInt) -> None:
+        """Execute the assert extern.
+
+        Parameters
+        ----------
+        val
+            The value to be asserted.
+
+        """
+        assert bool(val)
+
+    @staticmethod
+    def assume(val: FixedInt) -> None:
+        """Execute the assume extern.
+
+        Outside of formal verification tools, assume is equivalent to and assert.
+
+        Parameters
+        ----------
+        val
+            The value to be assumed.
+
+        """
+        assert bool(val)
+
+    @staticmethod
+    def log_msg(msg: str, data: Any) -> None:
+        """Execute the log_msg extern.
+
+        Parameters
+        ----------
+        msg
+            The message to log.
+        data
+            Arguments to print in the string.
+
+        """
+        print(msg.format(*data))
+
+    @staticmethod
+    def mark_to_drop(standard_metadata: Header) -> None:
+        """Execute the mark_to_drop extern.
+
+        As in BMv2, this also cancels multicast by clearing ``mcast_grp``.
+
+        Parameters
+        ----------
+        standard_metadata
+            The standard metadata.
+
+        """
+        standard_metadata["egress_spec"].set_max_val()
+        standard_metadata["mcast_grp"].val = 0
+
+    @staticmethod
+    @bus_extern
+    def clone_ingress_pkt_to_egress(bus: Bus, session: int, field_list: int = 0) -> None:
+        """Execute the clone extern in ingress.
+
+        This implements ``clone`` and ``clone_preserving_field_list`` with ``CloneType.I2E``. The
+        input packet is cloned at the end of ingress for each clone of the session.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        session
+            The clone session ID.
+        field_list : optional
+            The ID of the field list whose fields the clones preserve. 0 preserves no fields.
+
+        """
+        bus.requests["clone"] = (int(session), int(field_list))
+
+    @staticmethod
+    @bus_extern
+    def clone_egress_pkt_to_egress(bus: Bus, session: int, field_list: int = 0) -> None:
+        """Execute the clone extern in egress.
+
+        This implements ``clone`` and ``clone_preserving_field_list`` with ``CloneType.E2E``. The
+        packet is cloned at the end of egress for each clone of the session.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        session
+            The clone session ID.
+        field_list : optional
+            The ID of the field list whose fields the clones preserve. 0 preserves no fields.
+
+        """
+        bus.requests["clone"] = (int(session), int(field_list))
+
+    @staticmethod
+    @bus_extern
+    def resubmit(bus: Bus, field_list: int = 0) -> None:
+        """Execute the resubmit extern.
+
+        This implements ``resubmit_preserving_field_list``. The input packet re-enters ingress at
+        the end of ingress instead of being forwarded.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        field_list : optional
+            The ID of the field list whose fields the resubmitted packet preserves.
+
+        """
+        bus.requests["resubmit"] = int(field_list)
+
+    @staticmethod
+    @bus_extern
+    def recirculate(bus: Bus, field_list: int = 0) -> None:
+        """Execute the recirculate extern.
+
+        This implements ``recirculate_preserving_field_list``. The deparsed packet re-enters
+        ingress at the end of egress instead of being emitted.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        field_list : optional
+            The ID of the field list whose fields the recirculated packet preserves.
+
+        """
+        bus.requests["recirculate"] = int(field_list)
+
+    @bus_extern
+    def count(self, bus: Bus, counter_name: str, index: FixedInt) -> None:
+        """Execute the counter count extern.
+
+        The byte count of the packet is its ``packet_length``.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        counter_name
+            The name of the counter.
+        index
+            The index of the counter cell to count the packet in.
+
+        """
+        self.__counters[counter_name].count(
+            int(index), bus.metadata["standard_metadata"]["packet_length"].val,
+        )
+
+    @bus_extern
+    def execute_meter(
+            self, bus: Bus, meter_name: str, index: FixedInt, lval: FixedInt,
+    ) -> None:
+        """Execute the meter execute extern.
+
+        The meter runs at the global timestamp of the packet in the current stage and meters the
+        ``packet_length`` of the packet for a bytes meter.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        meter_name
+            The name of the meter.
+        index
+            The index of the meter cell to execute.
+        lval
+            The value in which the color, see
+            `~pyp4.processors.v1model_types.V1ModelMeterColor`, is to be stored.
+
+        """
+        lval.val = self.__meters[meter_name].execute(
+            int(index),
+            bus.metadata["standard_metadata"]["packet_length"].val,
+            self.__packet_time(bus),
+        )
+
+    @bus_extern
+    def modify_field_with_hash_based_offset(
+            self, bus: Bus, lval: FixedInt, base: FixedInt, calculation_name: str, size: FixedInt,
+    ) -> None:
+        """Execute the hash extern.
+
+        As in BMv2, the result is ``base + (hash % size)`` truncated to the bitwidth of ``lval``.
+
+        Parameters
+        ----------
+        bus
+            The metadata + headers bus.
+        lval
+            The value in which the result is to be stored.
+        base
+            The minimum result.
+        calculation_name
+            The name of the calculation that hashes the input fields.
+        size
+            The number of possible results.
+
+        """
+        value = int(base) + (self.__calculations[calculation_name].compute(bus) % int(size))
+        lval.val = value & ((1 << lval.bitwidth) - 1)
+
+    def register_read(self, lval: FixedInt, register_name: str, index: FixedInt) -> None:
+        """Execute the register read extern.
+
+        Parameters
+        ----------
+        lval
+            The value in which the read value is to be stored.
+        register_name
+            The name of the register.
+        index
+            The index of the register from which to read.
+
+        """
+        lval.val = self.__registers[register_name][int(index)]
+
+    def register_write(self, register_name: str, index: FixedInt, rval: FixedInt) -> None:
+        """Execute the register write extern.
+
+        Parameters
+        ----------
+        register_name
+            The name of the register.
+        index
+            The index of the register into which to write to.
+        rval
+            The value that is to be written into the register.
+
+        """
+        self.__registers[register_name][int(index)] = int(rval)
+
+
+class Register:
+    """A P4 register.
+
+    Cells of up to 64 bits are stored in an `array` of the smallest unsigned integer type that fits
+    them and wider cells in a dictionary holding only the non-zero cells. The storage is allocated
+    on the first write. Values are truncated to the bitwidth of the register when written.
+
+    A register is indexed like a list. Slices read and write several cells at once and a slice
+    assignment must provide one value per cell.
+
+    Parameters
+    ----------
+    bm_register
+        Register definition in BM JSON format.
+
+    """
+
+    def __init__(self, bm_register: Dict):
+        self.__bm_register = bm_register
+        self.__size = bm_register["size"]
+        self.__bitwidth = bm_register["bitwidth"]
+        self.__mask = (1 << self.__bitwidth) - 1
+        self.__bytewidth = (self.__bitwidth + 7) // 8
+        self.__cells = None
+
+    @property
+    def name(self) -> str:
+        """The name of the register."""
+        return self.__bm_register["name"]
+
+    @property
+    def bitwidth(self) -> int:
+        """The bitwidth of each cell."""
+        return self.__bitwidth
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __allocate(self) -> Union[array, Dict[int, int]]:
+        if self.__bitwidth <= 64:
+            typecode = next(code for code in "BHILQ" if array(code).itemsize >= self.__bytewidth)
+            self.__cells = array(typecode, bytes(array(typecode).itemsize * self.__size))
+        else:
+            self.__cells = {}
+        return self.__cells
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, List[int]]:
+        """Read a cell or a slice of cells."""
+        cells = self.__cells
+        if isinstance(index, slice):
+            if isinstance(cells, array):
+                return cells[index].tolist()
+            indices = range(self.__size)[index]
+            return [0] * len(indices) if cells is None else [cells.get(i, 0) for i in indices]
+        if isinstance(cells, array):
+            return cells[index]
+        # Check the index against the size of the register.
+        index = range(self.__size)[index]
+        return 0 if cells is None else cells.get(index, 0)
+
+    def __setitem__(self, index: Union[int, slice], value: Union[int, Iterable[int]]) -> None:
+        """Write a cell or a slice of cells."""
+        cells = self.__allocate() if self.__cells is None else self.__cells
+        mask = self.__mask
+        if isinstance(index, slice):
+            indices = range(self.__size)[index]
+            values = [cell_value & mask for cell_value in value]
+            if len(values) != len(indices):
+                raise ValueError(
+                    f"Cannot write {len(values)} values to {len(indices)} cells of register "
+                    f"{self.name}"
+                )
+            if isinstance(cells, array):
+                cells[index] = array(cells.typecode, values)
+            else:
+                for cell_index, cell_value in zip(indices, values):
+                    self.__store(cells, cell_index, cell_value)
+        elif isinstance(cells, array):
+            cells[index] = value & mask
+        else:
+            self.__store(cells, range(self.__size)[index], value & mask)
+
+    @staticmethod
+    def __store(cells: Dict[int, int], index: int, value: int) -> None:
+        if value:
+            cells[index] = value
+        else:
+            cells.pop(index, None)
+
+    def reset(self) -> None:
+        """Reset all cells to zero and free the storage."""
+        self.__cells = None
+
+    def to_bytes(self) -> bytes:
+        """Export all cells as one buffer.
+
+        Returns
+        -------
+        :
+            The cells in order, each one as a big-endian unsigned integer of the bitwidth of the
+            register rounded up to whole bytes.
+
+        """
+        cells = self.__cells
+        bytewidth = self.__bytewidth
+        if cells is None:
+            return bytes(bytewidth * self.__size)
+        if isinstance(cells, dict):
+            binary = bytearray(bytewidth * self.__size)
+            for index, value in cells.items():
+                binary[index * bytewidth:(index + 1) * bytewidth] = value.to_bytes(bytewidth, "big")
+            return bytes(binary)
+
+        cells = array(cells.typecode, cells)
+        if sys.byteorder == "little":
+            cells.byteswap()
+        if cells.itemsize == bytewidth:
+            return cells.tobytes()
+        # Drop the leading zero bytes of each big-endian item.
+        items = cells.tobytes()
+        binary = bytearray(bytewidth * self.__size)
+        padding = cells.itemsize - bytewidth
+        for offset in range(bytewidth):
+            binary[offset::bytewidth] = items[padding + offset::cells.itemsize]
+        return bytes(binary)
+
+
+class Counter:
+    """A P4 counter array which counts packets and bytes.
+
+    The packet and byte counts are stored in two flat arrays of unsigned 64-bit integers. A direct
+    counter is indexed by the handles of the entries of its table and grows with them.
+
+    Parameters
+    ----------
+    bm_counter
+        Counter definition in BM JSON format.
+
+    """
+
+    def __init__(self, bm_counter: Dict):
+        self.__bm_counter = bm_counter
+        self.__direct = bool(bm_counter.get("is_direct"))
+        self.__size = bm_counter.get("size", 0)
+        self.__packets = array("Q", bytes(8 * self.__size))
+        self.__bytes = array("Q", bytes(8 * self.__size))
+
+    @property
+    def name(self) -> str:
+        """The name of the counter."""
+        return self.__bm_counter["name"]
+
+    @property
+    def binding(self) -> Optional[str]:
+        """The name of the table of a direct counter."""
+        return self.__bm_counter["binding"] if self.__direct else None
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __grow(self, size: int) -> None:
+        # Direct counters grow by at least doubling so that new entry handles rarely reallocate.
+        size = max(size, 2 * self.__size)
+        zeros = bytes(8 * (size - self.__size))
+        self.__packets.frombytes(zeros)
+        self.__bytes.frombytes(zeros)
+        self.__size = size
+
+    def count(self, index: int, byte_count: int) -> None:
+        """Count a packet.
+
+        Parameters
+        ----------
+        index
+            The index of the counter cell.
+        byte_count
+            The number of bytes of the packet.
+
+        """
+        if (index >= self.__size) and self.__direct:
+            self.__grow(index + 1)
+        self.__packets[index] += 1
+        self.__bytes[index] += byte_count
+
+    def __getitem__(
+            self, index: Union[int, slice],
+    ) -> Union[Tuple[int, int], List[Tuple[int, int]]]:
+        """Read the (packets, bytes) of a cell or a slice of cells."""
+        if isinstance(index, slice):
+            return list(zip(self.__packets[index], self.__bytes[index]))
+        if (index >= self.__size) and self.__direct:
+            return (0, 0)
+        return (self.__packets[index], self.__bytes[index])
+
+    @property
+    def packet_counts(self) -> array:
+        """A copy of the packet counts of all cells."""
+        return array("Q", self.__packets)
+
+    @property
+    def byte_counts(self) -> array:
+        """A copy of the byte counts of all cells."""
+        return array("Q", self.__bytes)
+
+    def reset_cell(self, index: int) -> None:
+        """Reset the counts of a cell to zero.
+
+        Parameters
+        ----------
+        index
+            The index of the counter cell.
+
+        """
+        if index < self.__size:
+            self.__packets[index] = 0
+            self.__bytes[index] = 0
+
+    def reset(self) -> None:
+        """Reset the counts of all cells to zero."""
+        zeros = bytes(8 * self.__size)
+        self.__packets = array("Q", zeros)
+        self.__bytes = array("Q", zeros)
+
+
+class Meter:
+    """A P4 meter array of two-rate three-color markers (RFC 2698).
+
+    Each cell has a committed and a peak token bucket. The buckets are refilled lazily when the
+    cell is executed from the time elapsed since the previous execution. A cell whose rates were
+    not set marks all packets green. The rates, burst sizes and tokens of all cells are stored in
+    flat arrays. A direct meter is indexed by the handles of the entries of its table and grows
+    with them.
+
+    Parameters
+    ----------
+    bm_meter
+        Meter definition in BM JSON format.
+
+    """
+    # pylint: disable=too-many-instance-attributes
+    # Reason: the state of all cells is kept in one flat array per quantity.
+
+    def __init__(self, bm_meter: Dict):
+        self.__bm_meter = bm_meter
+        self.__direct = bool(bm_meter.get("is_direct"))
+        self.__packets = bm_meter["type"] == "packets"
+        self.__size = 0
+        # Two values per cell: committed then peak.
+        self.__rates = array("d")
+        self.__bursts = array("d")
+        self.__tokens = array("d")
+        # The time of the previous execution of each cell, or -1 if it has not been executed.
+        self.__last = array("q")
+        self.__configured = bytearray()
+        self.__grow(bm_meter.get("size", 0))
+
+    @property
+    def name(self) -> str:
+        """The name of the meter."""
+        return self.__bm_meter["name"]
+
+    @property
+    def binding(self) -> Optional[str]:
+        """The name of the table of a direct meter."""
+        return self.__bm_meter["binding"] if self.__direct else None
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __grow(self, size: int) -> None:
+        size = max(size, 2 * self.__size)
+        added = size - self.__size
+        for values in (self.__rates, self.__bursts, self.__tokens):
+            values.frombytes(bytes(16 * added))
+        self.__last.extend([-1] * added)
+        self.__configured.extend(bytes(added))
+        self.__size = size
+
+    def __check(self, index: int) -> None:
+        if index >= self.__size:
+            if not self.__direct:
+                raise IndexError(f"Index {index} is out of range for meter {self.name}")
+            self.__grow(index + 1)
+
+    def set_rates(self, index: int, rates: Iterable[Tuple[float, int]]) -> None:
+        """Set the rates of a cell.
+
+        The buckets of the cell start full.
+
+        Parameters
+        ----------
+        index
+            The index of the meter cell.
+        rates
+            The (rate, burst size) of the committed and then of the peak bucket as for BMv2's
+            ``meter_set_rates``. Rates are in packets or bytes per microsecond and burst sizes in
+            packets or bytes.
+
+        """
+        rates = list(rates)
+        if (len(rates) != 2) or (rates[0][0] > rates[1][0]):
+            raise ValueError(
+                f"Meter {self.name} needs a committed rate and a peak rate that is not lower"
+            )
+        self.__check(index)
+        for offset, (rate, burst_size) in enumerate(rates):
+            self.__rates[2 * index + offset] = rate
+            self.__bursts[2 * index + offset] = burst_size
+            self.__tokens[2 * index + offset] = burst_size
+        self.__last[index] = -1
+        self.__configured[index] = 1
+
+    def set_all_rates(self, rates: Iterable[Tuple[float, int]]) -> None:
+        """Set the same rates for all cells, see :py:meth:`set_rates`."""
+        rates = list(rates)
+        for index in range(self.__size):
+            self.set_rates(index, rates)
+
+    def get_rates(self, index: int) -> Optional[List[Tuple[float, int]]]:
+        """Get the rates of a cell.
+
+        Parameters
+        ----------
+        index
+            The index of the meter cell.
+
+        Returns
+        -------
+        :
+            The (rate, burst size) of the committed and then of the peak bucket or None if the
+            rates of the cell are not set.
+
+        """
+        if (index >= self.__size) or not self.__configured[index]:
+            return None
+        return [
+            (self.__rates[2 * index + offset], int(self.__bursts[2 * index + offset]))
+            for offset in (0, 1)
+        ]
+
+    def reset_cell(self, index: int) -> None:
+        """Clear the rates of a cell so that it marks all packets green.
+
+        Parameters
+        ----------
+        index
+            The index of the meter cell.
+
+        """
+        if index < self.__size:
+            self.__configured[index] = 0
+
+    def reset_rates(self) -> None:
+        """Clear the rates of all cells so that they mark all packets green."""
+        self.__configured = bytearray(self.__size)
+
+    def execute(self, index: int, byte_count: int, now: int) -> int:
+        """Meter a packet.
+
+        Parameters
+        ----------
+        index
+            The index of the meter cell.
+        byte_count
+            The number of bytes of the packet.
+        now
+            The current time in microseconds.
+
+        Returns
+        -------
+        :
+            The color of the packet, see `~pyp4.processors.v1model_types.V1ModelMeterColor`.
+
+        """
+        self.__check(index)
+        if not self.__configured[index]:
+            return V1ModelMeterColor.GREEN.value
+
+        tokens = self.__tokens
+        (committed, peak) = (2 * index, 2 * index + 1)
+        last = self.__last[index]
+        if now > last:
+            if last >= 0:
+                elapsed = now - last
+                for bucket in (committed, peak):
+                    tokens[bucket] = min(
+                        self.__bursts[bucket], tokens[bucket] + elapsed * self.__rates[bucket],
+                    )
+            self.__last[index] = now
+
+        size = 1 if self.__packets else byte_count
+        if tokens[peak] < size:
+            return V1ModelMeterColor.RED.value
+        tokens[peak] -= size
+        if tokens[committed] < size:
+            return V1ModelMeterColor.YELLOW.value
+        tokens[committed] -= size
+        return V1ModelMeterColor.GREEN.value
@@ -0,0 +1,278 @@
+"""V1Model packet replication engine."""
+
+from typing import Iterable, List, Tuple
+
+from pyp4.bus import Bus
+from pyp4.processors.v1model_types import V1ModelInstanceType
+
+
+class V1ModelPre:
+    """The packet replication engine (PRE) of the V1Model.
+
+    A multicast group holds nodes and each node has a replication ID (rid) and a set of ports. A
+    packet whose ``mcast_grp`` is set at the end of ingress is replicated once for each port of
+    each node of its group. The control API follows the one of BMv2's simple_pre.
+
+    A clone session sends the clones made for it to either a port or a multicast group. The control
+    API follows the mirroring API of BMv2's simple_switch.
+
+    """
+
+    def __init__(self):
+        self.__sessions = {}
+        self.__groups = {}
+        self.__nodes = {}
+        self.__next_node_handle = 0
+        # The (port, rid) of the replicas of each multicast group.
+        self.__replicas = {}
+
+    def mc_mgrp_create(self, mgrp: int) -> int:
+        """Create a multicast group.
+
+        Parameters
+        ----------
+        mgrp
+            The multicast group ID which packets set in ``mcast_grp``. 0 means no multicast.
+
+        Returns
+        -------
+        :
+            The handle of the multicast group.
+
+        """
+        if not 0 < mgrp < (1 << 16):
+            raise ValueError(f"Invalid multicast group {mgrp}")
+        if mgrp in self.__groups:
+            raise ValueError(f"Multicast group {mgrp} already exists")
+        self.__groups[mgrp] = []
+        self.__replicas.clear()
+        return mgrp
+
+    def mc_mgrp_destroy(self, mgrp_handle: int) -> None:
+        """Destroy a multicast group.
+
+        Parameters
+        ----------
+        mgrp_handle
+            The handle of the multicast group.
+
+        """
+        self.__group(mgrp_handle)
+        del self.__groups[mgrp_handle]
+        self.__replicas.clear()
+
+    def mc_node_create(self, rid: int, ports: Iterable[int]) -> int:
+        """Create a node.
+
+        Parameters
+        ----------
+        rid
+            The replication ID of the node which replicas carry in ``egress_rid``.
+        ports
+            The ports to replicate to.
+
+        Returns
+        -------
+        :
+            The handle of the node.
+
+        """
+        node_handle = self.__next_node_handle
+        self.__next_node_handle += 1
+        self.__nodes[node_handle] = (rid, tuple(sorted(set(ports))))
+        return node_handle
+
+    def mc_node_update(self, node_handle: int, ports: Iterable[int]) -> None:
+        """Change the ports of a node.
+
+        Parameters
+        ----------
+        node_handle
+            The handle of the node.
+        ports
+            The ports to replicate to.
+
+        """
+        (rid, _) = self.__node(node_handle)
+        self.__nodes[node_handle] = (rid, tuple(sorted(set(ports))))
+        self.__replicas.clear()
+
+    def mc_node_destroy(self, node_handle: int) -> None:
+        """Destroy a node and remove it from its multicast groups.
+
+        Parameters
+        ----------
+        node_handle
+            The handle of the node.
+
+        """
+        self.__node(node_handle)
+        del self.__nodes[node_handle]
+        for nodes in self.__groups.values():
+            if node_handle in nodes:
+                nodes.remove(node_handle)
+        self.__replicas.clear()
+
+    def mc_node_associate(self, mgrp_handle: int, node_handle: int) -> None:
+        """Add a node to a multicast group.
+
+        Parameters
+        ----------
+        mgrp_handle
+            The handle of the multicast group.
+        node_handle
+            The handle of the node.
+
+        """
+        nodes = self.__group(mgrp_handle)
+        self.__node(node_handle)
+        if node_handle in nodes:
+            raise ValueError(f"Node {node_handle} is already in multicast group {mgrp_handle}")
+        nodes.append(node_handle)
+        self.__replicas.clear()
+
+    def mc_node_dissociate(self, mgrp_handle: int, node_handle: int) -> None:
+        """Remove a node from a multicast group.
+
+        Parameters
+        ----------
+        mgrp_handle
+            The handle of the multicast group.
+        node_handle
+            The handle of the node.
+
+        """
+        nodes = self.__group(mgrp_handle)
+        if node_handle not in nodes:
+            raise ValueError(f"Node {node_handle} is not in multicast group {mgrp_handle}")
+        nodes.remove(node_handle)
+        self.__replicas.clear()
+
+    def __group(self, mgrp_handle: int) -> List[int]:
+        if mgrp_handle not in self.__groups:
+            raise ValueError(f"Invalid multicast group handle {mgrp_handle}")
+        return self.__groups[mgrp_handle]
+
+    def __node(self, node_handle: int) -> Tuple[int, Tuple[int, ...]]:
+        if node_handle not in self.__nodes:
+            raise ValueError(f"Invalid node handle {node_handle}")
+        return self.__nodes[node_handle]
+
+    def replicas(self, mgrp: int) -> Tuple[Tuple[int, int], ...]:
+        """Get the replicas of a multicast group.
+
+        Parameters
+        ----------
+        mgrp
+            The multicast group ID.
+
+        Returns
+        -------
+        :
+            The (port, rid) of each replica in the order of the nodes in the group. An unknown
+            group has no replicas.
+
+        """
+        replicas = self.__replicas.get(mgrp)
+        if replicas is None:
+            replicas = tuple(
+                (port, rid)
+                for rid, ports in (self.__nodes[node] for node in self.__groups.get(mgrp, ()))
+                for port in ports
+            )
+            self.__replicas[mgrp] = replicas
+        return replicas
+
+    def mirroring_add(self, mirror_id: int, egress_port: int) -> None:
+        """Configure a clone session to send clones to a port.
+
+        Parameters
+        ----------
+        mirror_id
+            The clone session ID which the clone externs are called with.
+        egress_port
+            The port to send the clones to.
+
+        """
+        self.__sessions[mirror_id] = (egress_port, None)
+
+    def mirroring_add_mc(self, mirror_id: int, mgrp: int) -> None:
+        """Configure a clone session to send clones to a multicast group.
+
+        Parameters
+        ----------
+        mirror_id
+            The clone session ID which the clone externs are called with.
+        mgrp
+            The multicast group ID to replicate the clones to.
+
+        """
+        self.__sessions[mirror_id] = (None, mgrp)
+
+    def mirroring_delete(self, mirror_id: int) -> None:
+        """Delete a clone session.
+
+        Parameters
+        ----------
+        mirror_id
+            The clone session ID.
+
+        """
+        if mirror_id not in self.__sessions:
+            raise ValueError(f"Invalid clone session {mirror_id}")
+        del self.__sessions[mirror_id]
+
+    def mirror_replicas(self, mirror_id: int) -> Tuple[Tuple[int, int], ...]:
+        """Get the clones of a clone session.
+
+        Parameters
+        ----------
+        mirror_id
+            The clone session ID.
+
+        Returns
+        -------
+        :
+            The (port, rid) of each clone. A session with a port makes one clone with rid 0 and
+            an unknown session makes no clones.
+
+        """
+        (egress_port, mgrp) = self.__sessions.get(mirror_id, (None, None))
+        if mgrp is not None:
+            return self.replicas(mgrp)
+        if egress_port is not None:
+            return ((egress_port, 0),)
+        return ()
+
+    def replicate(self, bus: Bus, mgrp: int) -> List[Bus]:
+        """Replicate a packet to a multicast group.
+
+        The replicas are clones of the bus, see `pyp4.bus.Bus.clone`, except for the last one
+        which is the bus itself. The ``egress_spec`` of each replica is set to its port, so that
+        it becomes its ``egress_port``, and ``egress_rid`` and ``instance_type`` are set too.
+
+        Parameters
+        ----------
+        bus
+            The bus at the end of ingress.
+        mgrp
+            The multicast group ID.
+
+        Returns
+        -------
+        :
+            One bus for each replica.
+
+        """
+        replicas = self.replicas(mgrp)
+        if not replicas:
+            return []
+
+        buses = [bus.clone() for _ in replicas[1:]]
+        buses.append(bus)
+        for replica, (port, rid) in zip(buses, replicas):
+            standard_metadata = replica.metadata["standard_metadata"]
+            standard_metadata["egress_spec"].val = port
+            standard_metadata["egress_rid"].val = rid
+            standard_metadata["instance_type"].val = V1ModelInstanceType.REPLICATION.value
+        return buses
@@ -0,0 +1,82 @@
+"""V1Model types shared by the processor, its externs and its packet replication engine."""
+
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Deque, Dict, List, Tuple, Union
+
+from pyp4.binary import BinaryPacket
+from pyp4.bus import Bus
+from pyp4.packet import HeaderStack
+
+
+class V1ModelInstanceType(IntEnum):
+    """The values of ``standard_metadata.instance_type`` as used by BMv2's simple_switch."""
+    NORMAL = 0
+    """A packet received on a port."""
+    INGRESS_CLONE = 1
+    """A clone created at the end of ingress."""
+    EGRESS_CLONE = 2
+    """A clone created at the end of egress."""
+    COALESCED = 3
+    """A packet coalesced from several packets."""
+    RECIRC = 4
+    """A recirculated packet."""
+    REPLICATION = 5
+    """A multicast replica."""
+    RESUBMIT = 6
+    """A resubmitted packet."""
+
+
+class V1ModelMeterColor(IntEnum):
+    """The colors a meter marks packets with as used by BMv2."""
+    GREEN = 0
+    """The packet conforms to the committed rate."""
+    YELLOW = 1
+    """The packet exceeds the committed rate but conforms to the peak rate."""
+    RED = 2
+    """The packet exceeds the peak rate."""
+
+
+@dataclass
+class V1ModelPortMeta:
+    """V1Model port metadata.
+
+    Parameters
+    ----------
+    standard_metadata
+        The V1Model standard metadata as a dictionary.
+
+    """
+    standard_metadata: dict
+
+
+PortPacket = Tuple[V1ModelPortMeta, Union[BinaryPacket, HeaderStack]]
+
+# The fields preserved by a field list as (header name, field name, value).
+Preserved = Tuple[Tuple[str, str, int], ...]
+
+# A packet entering ingress with its port metadata, preserved fields and number of loops.
+IngressItem = Tuple[Union[BinaryPacket, HeaderStack], V1ModelPortMeta, Preserved, int]
+
+# A bus entering egress with the port metadata of its packet and its number of loops.
+EgressItem = Tuple[Bus, V1ModelPortMeta, int]
+
+
+@dataclass
+class _V1ModelWork:
+    """The pending work of one input packet.
+
+    Resubmitted and recirculated packets re-enter ingress and egress clones re-enter egress, so one
+    input packet can make several passes through the pipeline.
+
+    """
+    ingress: Deque[IngressItem] = field(default_factory=deque)
+    egress: Deque[EgressItem] = field(default_factory=deque)
+    # All the buses used, to be released at the end.
+    buses: List[Bus] = field(default_factory=list)
+    # The buses and the deparsed packets to emit.
+    outputs: List[Tuple[Bus, Union[BinaryPacket, HeaderStack]]] = field(default_factory=list)
+    # The state of the checksums of each bus verified after parsing, keyed on the bus ID. The
+    # buses are kept alive in buses.
+    checksums: Dict[int, Dict] = field(default_factory=dict)
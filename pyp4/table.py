@@ -1,11 +1,14 @@
 """P4 match+action tables."""
 
+from array import array
+from bisect import bisect_right
 import copy
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple, Union
+import heapq
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 from pyp4 import expr
-from pyp4.packet import Bus
+from pyp4.bus import Bus
 from pyp4.trace import get_logger, Trace
 
 logger = get_logger(__name__)
@@ -42,6 +45,16 @@ class Conditional:
         """Name of the process running the P4 program this conditional belongs to."""
         return self.__process_name
 
+    @property
+    def true_next(self) -> Optional[str]:
+        """The name of the next table if the condition is true."""
+        return self.__bm_conditional["true_next"]
+
+    @property
+    def false_next(self) -> Optional[str]:
+        """The name of the next table if the condition is false."""
+        return self.__bm_conditional["false_next"]
+
     @Trace(logger)
     def apply(self, bus: Bus) -> Optional[str]:
         """Evaluate the conditional on the given bus.
@@ -83,13 +96,336 @@ class _ApplyResult:
     """Result of table.apply."""
     hit: bool
     action_run: _ActionRun
+    entry_handle: Optional[int] = None
+
+
+@dataclass
+class _BatchApplyResult:
+    """Result of table.apply_batch.
+
+    The action data index of a packet refers to the entry in `action_runs` of the action that it
+    runs and in `entry_handles` of the entry that it hits. Packets that miss refer to the default
+    action, which is the last action run and has no entry handle.
+    """
+    hits: bytearray
+    action_ids: array
+    action_data_indices: array
+    action_runs: List[_ActionRun]
+    entry_handles: List[Optional[int]]
+
+    def apply_results(self) -> List[_ApplyResult]:
+        """The apply result of each packet as returned by table.apply."""
+        default = len(self.action_runs) - 1
+        # Only the entries that the packets hit get an apply result.
+        results = {}
+        for index in self.action_data_indices:
+            if index not in results:
+                results[index] = _ApplyResult(
+                    hit=(index != default),
+                    action_run=self.action_runs[index],
+                    entry_handle=self.entry_handles[index],
+                )
+        return [results[index] for index in self.action_data_indices]
+
+
+class _MatchIndex:
+    """The entries of a table indexed for batched lookups.
+
+    The entries are ranked in the order in which table.apply picks the best match: by priority,
+    then in table order. A lookup maps the values of a key to the rank of the best matching entry,
+    or to the number of entries if none matches. How the entries are indexed depends on the key:
+
+    * With ``exact`` or ``lpm`` elements, the values of the ``exact`` elements and the prefix of
+      the first ``lpm`` element are looked up in a hash table, one per prefix length, of the ranks
+      of the entries with these values. The other elements are only checked for these
+      candidates, so the cost does not depend on the size of the table.
+    * A single ``range`` element is looked up by bisection in the sorted bounds of the intervals
+      that the ranges split the key space into, each with the best entry that covers it.
+    * Otherwise, the ``ternary`` elements map the key to the bitmap of the ranks of the entries
+      they match, through one pair of bitmaps per key bit, and the set bits are checked from the
+      lowest rank up. Without ``ternary`` elements the entries are checked in rank order. As in
+      BMv2, the cost of these lookups grows with the size of the table.
+
+    Parameters
+    ----------
+    entries
+        The table entries in table order keyed on their handles.
+    key_types
+        The match type of each key element.
+    key_bitwidths
+        The bitwidth of each key element.
+    action_runs
+        The action run of each entry, keyed on its handle, and of the default action, keyed on
+        None.
+
+    """
+
+    def __init__(
+            self,
+            entries: Dict[int, Dict],
+            key_types: Sequence[str],
+            key_bitwidths: Sequence[int],
+            action_runs: Dict[Optional[int], _ActionRun],
+    ):
+        for match_type in key_types:
+            if match_type not in ("exact", "lpm", "range", "ternary"):
+                raise NotImplementedError(f"Unsupported match type: {match_type}")
+
+        ranked = sorted(entries.items(), key=lambda item: item[1]["priority"])
+        self.__handles = [handle for handle, _ in ranked] + [None]
+        self.__action_runs = [action_runs[handle] for handle in self.__handles]
+        self.__action_ids = [action_run.action_id for action_run in self.__action_runs]
+        match_keys = self.__with_masks([entry["match_key"] for _, entry in ranked], key_bitwidths)
+        self.__size = len(ranked)
+
+        if ("exact" in key_types) or ("lpm" in key_types):
+            self.__lookup = self.__hash_lookup(match_keys, key_types)
+        elif list(key_types) == ["range"]:
+            self.__lookup = self.__range_lookup(match_keys)
+        else:
+            self.__lookup = self.__scan_lookup(match_keys, key_types, key_bitwidths)
+
+    @property
+    def size(self) -> int:
+        """The number of entries. It is also the rank of a miss."""
+        return self.__size
+
+    @property
+    def handles(self) -> List[Optional[int]]:
+        """The handles of the entries in rank order followed by None for a miss."""
+        return self.__handles
+
+    @property
+    def action_runs(self) -> List[_ActionRun]:
+        """The action runs of the entries in rank order followed by the default action run."""
+        return self.__action_runs
+
+    @property
+    def action_ids(self) -> List[int]:
+        """The action IDs of `action_runs`."""
+        return self.__action_ids
+
+    @property
+    def lookup(self) -> Callable[[Tuple[int, ...]], int]:
+        """The lookup from the values of a key to the rank of the best matching entry."""
+        return self.__lookup
+
+    @staticmethod
+    def __checks(
+            match_keys: List[List[Dict]], positions: Sequence[int],
+    ) -> List[Tuple[Tuple[int, bool, int, int], ...]]:
+        """For each entry, the checks of the key elements at the given positions.
+
+        A check is (position, masked, first, second). A masked check matches the values whose bits
+        in the mask ``first`` equal ``second``, other checks the values from ``first`` to
+        ``second``.
+        """
+        checks = []
+        for match_key in match_keys:
+            entry_checks = []
+            for position in positions:
+                match_elem = match_key[position]
+                match_type = match_elem["match_type"]
+                if match_type == "range":
+                    entry_checks.append(
+                        (position, False, int(match_elem["start"], 16), int(match_elem["end"], 16))
+                    )
+                elif match_type == "lpm":
+                    entry_checks.append(
+                        (position, True, match_elem["mask"], int(match_elem["key"], 16))
+                    )
+                else:
+                    mask = match_elem["mask"]
+                    entry_checks.append((position, True, mask, int(match_elem["key"], 16) & mask))
+            checks.append(tuple(entry_checks))
+        return checks
+
+    @staticmethod
+    def __matches(checks: Tuple[Tuple[int, bool, int, int], ...], key: Tuple[int, ...]) -> bool:
+        for position, masked, first, second in checks:
+            value = key[position]
+            if masked:
+                if (value & first) != second:
+                    return False
+            elif not first <= value <= second:
+                return False
+        return True
+
+    @staticmethod
+    def __with_masks(
+            match_keys: List[List[Dict]], key_bitwidths: Sequence[Optional[int]],
+    ) -> List[List[Dict]]:
+        """The match keys with the mask of each LPM and ternary element as an integer."""
+        masked_keys = []
+        for match_key in match_keys:
+            masked_key = []
+            for match_elem, bitwidth in zip(match_key, key_bitwidths):
+                if match_elem["match_type"] == "lpm":
+                    prefix_length = match_elem["prefix_length"]
+                    match_elem = dict(
+                        match_elem, mask=((1 << prefix_length) - 1) << (bitwidth - prefix_length),
+                    )
+                elif match_elem["match_type"] == "ternary":
+                    match_elem = dict(match_elem, mask=int(match_elem["mask"], 16))
+                masked_key.append(match_elem)
+            masked_keys.append(masked_key)
+        return masked_keys
+
+    def __residual_checks(
+            self, match_keys: List[List[Dict]], excluded: Sequence[int],
+    ) -> Optional[List[Tuple[Tuple[int, bool, int, int], ...]]]:
+        """The checks of the key elements that are not looked up, or None if there are none."""
+        checks = self.__checks(match_keys, [
+            position for position in range(len(match_keys[0]) if match_keys else 0)
+            if position not in excluded
+        ])
+        return checks if any(checks) else None
+
+    def __hash_lookup(
+            self, match_keys: List[List[Dict]], key_types: Sequence[str],
+    ) -> Callable[[Tuple[int, ...]], int]:
+        exact_positions = [
+            position for position, match_type in enumerate(key_types) if match_type == "exact"
+        ]
+        lpm_position = key_types.index("lpm") if "lpm" in key_types else None
+
+        # One hash table per prefix length, of the ranks of the entries keyed on the values of the
+        # exact elements and the prefix of the LPM element.
+        tables = {}
+        for rank, match_key in enumerate(match_keys):
+            values = tuple(int(match_key[position]["key"], 16) for position in exact_positions)
+            mask = -1
+            if lpm_position is not None:
+                mask = match_key[lpm_position]["mask"]
+                values += (int(match_key[lpm_position]["key"], 16),)
+            tables.setdefault(mask, {}).setdefault(values, []).append(rank)
+        tables = tuple(tables.items())
+        checks = self.__residual_checks(match_keys, exact_positions + [lpm_position])
+        matches = self.__matches
+        miss = self.__size
+
+        def lookup(key):
+            values = tuple(key[position] for position in exact_positions)
+            best = miss
+            for mask, candidates in tables:
+                if lpm_position is not None:
+                    candidates = candidates.get(values + (key[lpm_position] & mask,), ())
+                else:
+                    candidates = candidates.get(values, ())
+                for rank in candidates:
+                    if rank >= best:
+                        break
+                    if (checks is None) or matches(checks[rank], key):
+                        best = rank
+                        break
+            return best
+        return lookup
+
+    def __range_lookup(self, match_keys: List[List[Dict]]) -> Callable[[Tuple[int, ...]], int]:
+        ranges = sorted(
+            (int(match_key[0]["start"], 16), int(match_key[0]["end"], 16), rank)
+            for rank, match_key in enumerate(match_keys)
+        )
+        # The range bounds split the key space into intervals. Sweep the bounds in order, keeping
+        # the ranges that cover the current interval in a heap of ranks, to find the best entry of
+        # each interval. Ranges that ended are only removed when they reach the top.
+        bounds = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+        best = array("l")
+        covering = []
+        next_range = 0
+        for bound in bounds:
+            while (next_range < len(ranges)) and (ranges[next_range][0] == bound):
+                (_, end, rank) = ranges[next_range]
+                heapq.heappush(covering, (rank, end))
+                next_range += 1
+            while covering and (covering[0][1] < bound):
+                heapq.heappop(covering)
+            best.append(covering[0][0] if covering else self.__size)
+        miss = self.__size
+
+        def lookup(key):
+            index = bisect_right(bounds, key[0]) - 1
+            return best[index] if index >= 0 else miss
+        return lookup
+
+    def __scan_lookup(
+            self,
+            match_keys: List[List[Dict]],
+            key_types: Sequence[str],
+            key_bitwidths: Sequence[Optional[int]],
+    ) -> Callable[[Tuple[int, ...]], int]:
+        ternaries = [position for position, match_type in enumerate(key_types)
+                     if match_type == "ternary"]
+        checks = self.__checks(
+            match_keys,
+            [position for position in range(len(key_types)) if position not in ternaries],
+        )
+        matches = self.__matches
+        miss = self.__size
+
+        if not ternaries:
+            def scan(key):
+                for rank, entry_checks in enumerate(checks):
+                    if matches(entry_checks, key):
+                        return rank
+                return miss
+            return scan
+
+        all_entries = (1 << self.__size) - 1
+        bit_bitmaps = self.__bit_bitmaps(match_keys, ternaries, key_bitwidths, all_entries)
+
+        def lookup(key):
+            bitmap = all_entries
+            for position, bit, bitmaps in bit_bitmaps:
+                bitmap &= bitmaps[(key[position] >> bit) & 1]
+                if not bitmap:
+                    return miss
+            # The lowest set bit is the best entry that matches the ternary elements.
+            while bitmap:
+                lowest = bitmap & -bitmap
+                rank = lowest.bit_length() - 1
+                if matches(checks[rank], key):
+                    return rank
+                bitmap ^= lowest
+            return miss
+        return lookup
+
+    @staticmethod
+    def __bit_bitmaps(
+            match_keys: List[List[Dict]],
+            ternaries: Sequence[int],
+            key_bitwidths: Sequence[Optional[int]],
+            all_entries: int,
+    ) -> List[Tuple[int, int, Tuple[int, int]]]:
+        """For each bit of each ternary element, the bitmaps of the entries that match a 0 and a 1
+        in that bit. Bits which no entry masks in are skipped.
+        """
+        bit_bitmaps = []
+        for position in ternaries:
+            for bit in range(key_bitwidths[position]):
+                bitmaps = [0, 0]
+                for rank, match_key in enumerate(match_keys):
+                    match_elem = match_key[position]
+                    if not (match_elem["mask"] >> bit) & 1:
+                        bitmaps[0] |= 1 << rank
+                        bitmaps[1] |= 1 << rank
+                    else:
+                        bitmaps[(int(match_elem["key"], 16) >> bit) & 1] |= 1 << rank
+                if bitmaps != [all_entries, all_entries]:
+                    bit_bitmaps.append((position, bit, tuple(bitmaps)))
+        return bit_bitmaps
 
 
 class Table:
     """A P4 match+action table."""
+    # pylint: disable=too-many-instance-attributes
+    # Reason: the entries are kept with their batched lookup index and the keys they are unique on.
 
     @Trace(logger)
-    def __init__(self, process_name: str, bm_table: Dict, action_id_to_name, action_name_to_id):
+    def __init__(
+            self, process_name: str, bm_table: Dict, action_id_to_name, action_name_to_id,
+            field_bitwidth=None, entry_reset=None,
+    ):
         """
         Parameters
         ----------
@@ -101,14 +437,31 @@ class Table:
             Map of action IDs to their names.
         action_name_to_id : dict of {`str` -> `int`}
             Map of action names to their IDs.
+        field_bitwidth : Callable[[`str`, `str`], `int`], optional
+            Get the bitwidth of a field from its header and field names. Batched lookups of
+            ``lpm`` and ``ternary`` keys need the bitwidths of the key fields.
+        entry_reset : Callable[[Optional[`int`]], None], optional
+            Called with the handle of each inserted entry and with None when the table is reset so
+            that any state kept per entry handle, such as direct counters, starts afresh.
 
         """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # Reason: the field bitwidths and the entry reset hook are optional and set by the block.
         self.__process_name = process_name
         self.__bm_table = bm_table
         self.__entries = {}
+        self.__match_keys = set()
         self.__next_handle = 0
+        # The handles of removed entries, lowest first, so that handles stay dense.
+        self.__free_handles = []
+        self.__entry_reset = entry_reset
         self.__action_id_to_name = action_id_to_name
         self.__action_name_to_id = action_name_to_id
+        self.__key_bitwidths = (
+            None if field_bitwidth is None else
+            tuple(field_bitwidth(*key_elem["target"]) for key_elem in self.__bm_table["key"])
+        )
+        self.__match_index = None
         self.logger = None
 
         self.__insert_const_entries()
@@ -123,6 +476,11 @@ class Table:
         """Name of the process running the P4 program this table belongs to."""
         return self.__process_name
 
+    @property
+    def next_tables(self) -> Tuple[Optional[str], ...]:
+        """The names of all the tables that may follow this table."""
+        return tuple(self.__bm_table["next_tables"].values())
+
     def reset(self) -> None:
         """Reset the table contents to their original state. Const entries will not be removed.
 
@@ -130,7 +488,12 @@ class Table:
         self.logger.debug(f"{self.logger.name}.reset")
 
         self.__entries.clear()
+        self.__match_keys.clear()
         self.__next_handle = 0
+        self.__free_handles.clear()
+        self.__match_index = None
+        if self.__entry_reset is not None:
+            self.__entry_reset(None)
 
         self.__insert_const_entries()
 
@@ -141,8 +504,13 @@ class Table:
         for entry in self.__bm_table["entries"]:
             self.__entries[self.__next_handle] = copy.deepcopy(entry)
             self.__entries[self.__next_handle]["const"] = True
+            self.__match_keys.add(self.__hashable_match_key(entry["match_key"]))
             self.__next_handle += 1
 
+    @staticmethod
+    def __hashable_match_key(match_key: List[Dict]) -> Tuple:
+        return tuple(tuple(sorted(match_elem.items())) for match_elem in match_key)
+
     @Trace(logger)
     def apply(self, bus: Bus) -> _ApplyResult:
         """Get the action for the provided packet.
@@ -171,6 +539,101 @@ class Table:
         )
         return apply_result
 
+    def key_columns(self, buses: List[Bus]) -> List[List[int]]:
+        """Extract the key values of a batch of packets.
+
+        Parameters
+        ----------
+        buses
+            The metadata+headers buses.
+
+        Returns
+        -------
+        :
+            One column of the values of each key element in the packets, in the format expected
+            by :py:meth:`apply_batch`.
+
+        """
+        targets = [key_elem["target"] for key_elem in self.__bm_table["key"]]
+        return [
+            [bus.get_hdr(header_name)[field_name].val for bus in buses]
+            for header_name, field_name in targets
+        ]
+
+    @Trace(logger)
+    def apply_batch(
+            self, key_columns: Sequence[Sequence[int]], size: Optional[int] = None,
+    ) -> _BatchApplyResult:
+        """Get the actions for a batch of key values.
+
+        The entries are indexed on their exact and LPM key elements, in hash tables, or on a single
+        range key element, in a sorted array of interval bounds, so that each packet only checks the
+        entries that share its key value. Other tables are indexed in per-bit bitmaps of their
+        ternary key elements or scanned. The index and the action runs of the entries are built on
+        the first call and kept until the entries change. The result is the same as calling
+        :py:meth:`apply` on each packet.
+
+        Parameters
+        ----------
+        key_columns
+            One column of values for each key element, e.g. the columns of a
+            `pyp4.batch.PacketBatch` or the output of :py:meth:`key_columns`.
+        size : optional
+            The number of packets. It is only needed when the table has no key.
+
+        Returns
+        -------
+        :
+            The hit flag, action ID and action data index of each packet and the action runs the
+            action data indices refer to.
+
+        """
+        if len(key_columns) != len(self.__bm_table["key"]):
+            raise ValueError(
+                f"Expected {len(self.__bm_table['key'])} key columns, got {len(key_columns)}"
+            )
+        if self.__match_index is None:
+            self.__match_index = self.__build_match_index()
+        index = self.__match_index
+
+        if key_columns:
+            action_data_indices = array("l", map(index.lookup, zip(*key_columns)))
+        else:
+            action_data_indices = array("l", [index.size]) * size
+
+        miss = index.size
+        action_ids = index.action_ids
+        result = _BatchApplyResult(
+            hits=bytearray(rank != miss for rank in action_data_indices),
+            action_ids=array("l", [action_ids[rank] for rank in action_data_indices]),
+            action_data_indices=action_data_indices,
+            action_runs=index.action_runs,
+            entry_handles=index.handles,
+        )
+        self.logger.debug(f"{self.name}-batch={size}; hits={sum(result.hits)}")
+        return result
+
+    def __build_match_index(self) -> _MatchIndex:
+        key_types = [key_elem["match_type"] for key_elem in self.__bm_table["key"]]
+        key_bitwidths = self.__key_bitwidths
+        if key_bitwidths is None:
+            if any(match_type in ("lpm", "ternary") for match_type in key_types):
+                raise ValueError(f"The key bitwidths of table {self.name} are not known")
+            key_bitwidths = [None] * len(key_types)
+        action_runs = {
+            handle: self.__action_run(entry["action_entry"])
+            for handle, entry in self.__entries.items()
+        }
+        action_runs[None] = self.__action_run(self.__bm_table["default_entry"])
+        return _MatchIndex(self.__entries, key_types, key_bitwidths, action_runs)
+
+    def __action_run(self, action_entry: Dict) -> _ActionRun:
+        return _ActionRun(
+            action_id=action_entry["action_id"],
+            action_name=self.__action_id_to_name[action_entry["action_id"]],
+            action_data=action_entry["action_data"],
+        )
+
     def insert_entry(
             self,
             key: Union[int, Tuple[int, int], List[Union[int, Tuple[int, int]]]],
@@ -194,7 +657,8 @@ class Table:
         Returns
         -------
         :
-            The handle to the entry which can be used to refer to this entry later.
+            The handle to the entry which can be used to refer to this entry later. The handles of
+            removed entries are reused.
 
         """
         self.logger.debug(
@@ -233,8 +697,15 @@ class Table:
                     "start": hex(entry_key[0]),
                     "end": hex(entry_key[1]),
                 })
+            elif table_key["match_type"] == "ternary":
+                if not (isinstance(entry_key, tuple) and len(entry_key) == 2):
+                    raise ValueError
+                match_key.append({
+                    "match_type": "ternary",
+                    "key": hex(entry_key[0]),
+                    "mask": hex(entry_key[1]),
+                })
             else:
-                # assert table_key["match_type"] == "ternary"
                 raise NotImplementedError
 
         assert match_key
@@ -248,17 +719,26 @@ class Table:
             "const": False,
         }
 
-        for tab_entry in self.__entries.values():
-            assert new_entry["match_key"] != tab_entry["match_key"]
-
-        entry_handle = self.__next_handle
-        self.__next_handle += 1
+        hashable_match_key = self.__hashable_match_key(match_key)
+        assert hashable_match_key not in self.__match_keys
+        self.__match_keys.add(hashable_match_key)
 
+        entry_handle = self.__allocate_handle()
         self.__entries[entry_handle] = new_entry
+        self.__match_index = None
+        if self.__entry_reset is not None:
+            self.__entry_reset(entry_handle)
 
         self.logger.debug(f"{self.logger.name}.insert_entry-entry_handle={entry_handle}")
         return entry_handle
 
+    def __allocate_handle(self) -> int:
+        if self.__free_handles:
+            return heapq.heappop(self.__free_handles)
+        entry_handle = self.__next_handle
+        self.__next_handle += 1
+        return entry_handle
+
     def remove_entry(self, entry_handle: int) -> None:
         """Remove an entry from the table.
 
@@ -276,6 +756,10 @@ class Table:
             # actually belongs to any entry. Therefore, we reinsert the entry and return without
             # removing anything like we would normally do for an invalid handle.
             self.__entries[entry_handle] = entry
+        elif entry is not None:
+            self.__match_keys.remove(self.__hashable_match_key(entry["match_key"]))
+            heapq.heappush(self.__free_handles, entry_handle)
+        self.__match_index = None
 
     def __extract_key_value_from_bus(self, bus: Bus) -> List[Dict]:
         key_value = []
@@ -294,10 +778,12 @@ class Table:
         # represented the table in a more optimized way, e.g. a Patricia tree for LPM tables.
         # pylint:disable=unsubscriptable-object
         best_entry = None
-        for entry in self.__entries.values():
+        best_handle = None
+        for handle, entry in self.__entries.items():
             if Table.__key_value_matches_entry(key_value, entry):
                 if ((best_entry is None) or (entry["priority"] < best_entry["priority"])):
                     best_entry = entry
+                    best_handle = handle
 
         if best_entry:
             action_id = best_entry["action_entry"]["action_id"]
@@ -312,7 +798,8 @@ class Table:
                                 action_id=action_id,
                                 action_name=self.__action_id_to_name[action_id],
                                 action_data=action_data,
-                            ))
+                            ),
+                            entry_handle=best_handle)
 
     @staticmethod
     def __key_value_matches_entry(key_value: List[Dict], entry: Dict) -> bool:
@@ -333,6 +820,8 @@ class Table:
             return Table.__lpm_key_elem_matches_entry(key_value_elem, match_elem)
         if match_type == "range":
             return Table.__range_key_elem_matches_entry(key_value_elem, match_elem)
+        if match_type == "ternary":
+            return Table.__ternary_key_elem_matches_entry(key_value_elem, match_elem)
         raise NotImplementedError
 
     @staticmethod
@@ -358,6 +847,13 @@ class Table:
         end_value = int(match_elem["end"], 16)
         return start_value <= field_value <= end_value
 
+    @staticmethod
+    def __ternary_key_elem_matches_entry(key_elem: Dict, match_elem: Dict) -> bool:
+        field_value = key_elem["value"].val
+        mask = int(match_elem["mask"], 16)
+        match_value = int(match_elem["key"], 16)
+        return (field_value & mask) == (match_value & mask)
+
     @staticmethod
     def __prefix_to_mask(field_len: int, prefix_len: int) -> int:
         """Convert a prefix length into a mask (which requires knowing the field length).
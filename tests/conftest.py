@@ -1,17 +1,18 @@
 """Special pytest file for shared fixtures."""
 
+import copy
 import json
 import pytest
 
 from pyp4.action import Action
-from pyp4 import PacketIO
+from pyp4 import DeparseMode, PacketIO
 from pyp4.process import Process
 from pyp4.processors.v1model import V1ModelExtern
 
 
 class MockProcessCls(Process):
-    def __init__(self, name, program, packet_io=PacketIO.BINARY):
-        super().__init__(name, program, packet_io, None)
+    def __init__(self, name, program, packet_io=PacketIO.BINARY, deparse_mode=DeparseMode.COPY):
+        super().__init__(name, program, packet_io, None, deparse_mode)
 
     @staticmethod
     def _validate_program(program):
@@ -29,6 +30,26 @@ def program(program_file_name):
         yield json.load(program_file)
 
 
+@pytest.fixture(scope="module")
+def varbit_program(program):
+    # The program with an additional header "opts" that has a variable-size field "options".
+    varbit_program = copy.deepcopy(program)
+    varbit_program["header_types"].append({
+        "name": "opts_t",
+        "id": len(program["header_types"]),
+        "fields": [["length", 8, False], ["options", "*"]],
+        "max_length": 9,
+    })
+    varbit_program["headers"].append({
+        "name": "opts",
+        "id": len(program["headers"]),
+        "header_type": "opts_t",
+        "metadata": False,
+        "pi_omit": True,
+    })
+    return varbit_program
+
+
 @pytest.fixture(scope="module")
 def process(program):
     return MockProcessCls(__name__, program, PacketIO.STACK)
@@ -2,6 +2,9 @@
 
 import pytest
 
+from pyp4.action import Action
+from pyp4.processors.v1model import V1ModelExtern
+
 
 @pytest.fixture(scope="module")
 def program_file_name():
@@ -29,8 +32,10 @@ def test_assign(actions, bus):
 
 def test_extern(v1model_actions, bus):
     bus.metadata["standard_metadata"]["egress_spec"].val = 0x01
+    bus.metadata["standard_metadata"]["mcast_grp"].val = 0x02
     v1model_actions["MyIngress.act_extern"].process(bus, [])
     assert bus.metadata["standard_metadata"]["egress_spec"].is_max_val()
+    assert bus.metadata["standard_metadata"]["mcast_grp"].val == 0
 
 
 def test_extern_keyword(v1model_actions, bus):
@@ -42,3 +47,31 @@ def test_extern_keyword(v1model_actions, bus):
     bus.packet["test"]["value"].val = 0xaa
     v1model_actions["MyIngress.act_extern_keyword"].process(bus, [])
     assert int(bus.packet["test"]["value"]) == 0xbb
+
+
+def test_bus_extern(program, bus):
+    # Externs marked as bus externs are passed the bus before their parameters.
+    action = Action(__name__, {
+        "name": "act_resubmit",
+        "id": 0,
+        "runtime_data": [{"name": "field_list", "bitwidth": 8}],
+        "primitives": [{"op": "resubmit", "parameters": [{"type": "runtime_data", "value": 0}]}],
+    }, V1ModelExtern(program))
+    action.process(bus, ["02"])
+    assert bus.requests == {"resubmit": 2}
+
+
+def test_process_batch(actions, v1model_actions, process):
+    buses = [process.bus() for _ in range(3)]
+    actions["MyIngress.act_add_header"].process_batch(buses, [])
+    assert all(bus.packet["test"].valid for bus in buses)
+
+    actions["MyIngress.act_assign"].process_batch(buses[:2], [])
+    assert [int(bus.packet["test"]["value"]) for bus in buses] == [0xaa, 0xaa, 0x00]
+
+    # Actions that call externs run packet by packet.
+    v1model_actions["MyIngress.act_extern_keyword"].process_batch(buses[:2], [])
+    assert [int(bus.packet["test"]["value"]) for bus in buses] == [0xbb, 0xbb, 0x00]
+
+    actions["MyIngress.act_remove_header"].process_batch(buses[1:], [])
+    assert [bus.packet["test"].valid for bus in buses] == [True, False, False]
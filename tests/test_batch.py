@@ -0,0 +1,103 @@
+"""Unit test columnar packet batches."""
+
+import copy
+
+import pytest
+
+from pyp4 import PacketIO
+from pyp4.batch import PacketBatch
+from pyp4.packet import BinaryPacket
+
+
+@pytest.fixture(scope="module")
+def program_file_name():
+    return "tests/p4/complex.json"
+
+
+@pytest.fixture(scope="module")
+def binary_process(MockProcess, program):
+    return MockProcess(__name__, program, packet_io=PacketIO.BINARY)
+
+
+def _packets():
+    ipv4 = bytes.fromhex("0123456789ab" "0800" "0a000001" "40") + b"payload"
+    other = bytes.fromhex("ba9876543210" "86dd") + b"other"
+    return [ipv4, other, ipv4[:6] + bytes([0x08, 0x00, 0xff, 0xff, 0xff, 0xff, 0x01])]
+
+
+def test_from_packets(MockProcess, program, binary_process):
+    batch = PacketBatch.from_packets(binary_process, (BinaryPacket(p) for p in _packets()))
+    assert len(batch) == 3
+    assert batch.process is binary_process
+
+    assert batch.validity["ethernet"] == bytearray([1, 1, 1])
+    assert batch.validity["ipv4"] == bytearray([1, 0, 1])
+
+    ethernet = batch.columns["ethernet"]
+    assert ethernet["dst_addr"].itemsize == 8
+    assert list(ethernet["dst_addr"]) == [0x0123456789ab, 0xba9876543210, 0x0123456789ab]
+    assert ethernet["ethertype"].itemsize == 2
+    assert list(ethernet["ethertype"]) == [0x0800, 0x86dd, 0x0800]
+
+    # An invalid header has zero values.
+    ipv4 = batch.columns["ipv4"]
+    assert list(ipv4["dst_addr"]) == [0x0a000001, 0, 0xffffffff]
+    assert list(ipv4["ttl"]) == [0x40, 0, 0x01]
+
+    assert list(batch.parser_errors) == [0, 0, 0]
+    assert bytes(batch.unparsed[0].get_remaining()) == b"payload"
+    assert bytes(batch.unparsed[1].get_remaining()) == b"other"
+    assert set(batch.columns) >= {"ethernet", "ipv4", "standard_metadata"}
+
+    with pytest.raises(ValueError):
+        PacketBatch.from_packets(MockProcess(__name__, program, packet_io=PacketIO.STACK), [])
+
+
+def test_round_trip(binary_process):
+    deparser = binary_process.deparsers["deparser"]
+    batch = PacketBatch.from_packets(binary_process, map(BinaryPacket, _packets()))
+
+    # Columns are modified in place and the buses reflect them.
+    batch.columns["ipv4"]["ttl"][0] -= 1
+    buses = list(batch.buses())
+    assert [bus.packet.is_valid("ipv4") for bus in buses] == [True, False, True]
+    assert buses[0].packet["ipv4"]["ttl"].val == 0x3f
+
+    expected = _packets()
+    expected[0] = expected[0][:12] + bytes([0x3f]) + expected[0][13:]
+    assert [bytes(deparser.process(bus.packet)) for bus in buses] == expected
+
+
+def test_varbit(MockProcess, varbit_program):
+    program = copy.deepcopy(varbit_program)
+    # Extract the options after the Ethernet header of every packet. The options are preceded by
+    # their length in bytes.
+    start = program["parsers"][0]["parse_states"][0]
+    start["parser_ops"] += [
+        {"op": "set", "parameters": [
+            {"type": "field", "value": ["standard_metadata", "mcast_grp"]},
+            {"type": "lookahead", "value": [0, 8]},
+        ]},
+        {"op": "extract_VL", "parameters": [
+            {"type": "regular", "value": "opts"},
+            {"type": "expression", "value": {
+                "op": "<<",
+                "left": {"type": "field", "value": ["standard_metadata", "mcast_grp"]},
+                "right": {"type": "hexstr", "value": "0x3"},
+            }},
+        ]},
+    ]
+    program["deparsers"][0]["order"].append("opts")
+    process = MockProcess(__name__, program, packet_io=PacketIO.BINARY)
+
+    packets = [
+        bytes.fromhex("0123456789ab" "86dd" "02" "aabb"),
+        bytes.fromhex("0123456789ab" "86dd" "00"),
+    ]
+    batch = PacketBatch.from_packets(process, map(BinaryPacket, packets))
+    assert list(batch.columns["standard_metadata"]["mcast_grp"]) == [2, 0]
+    assert list(batch.columns["opts"]["length"]) == [2, 0]
+    assert batch.columns["opts"]["options"] == [b"\xaa\xbb", b""]
+
+    deparser = process.deparsers["deparser"]
+    assert [bytes(deparser.process(bus.packet)) for bus in batch.buses()] == packets
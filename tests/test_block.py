@@ -37,3 +37,30 @@ def test_ingress(blocks, bus):
 def test_false_next(blocks, bus):
     blocks["ingress"].process(bus)
     assert "act" not in bus.packet or not bus.packet["act"].valid
+
+
+def test_process_batch(blocks, process):
+    def buses():
+        for action_id in (None, 0, 1, 2, 0, None):
+            bus = process.bus()
+            if action_id is not None:
+                bus.packet.add_header("act")
+                bus.packet["act"]["action_id"].val = action_id
+            bus.metadata["standard_metadata"]["ingress_port"].val = 7
+            yield bus
+
+    expected = list(buses())
+    for bus in expected:
+        blocks["ingress"].process(bus)
+
+    batch = list(buses())
+    blocks["ingress"].process_batch(batch)
+    assert [repr(bus) for bus in batch] == [repr(bus) for bus in expected]
+    assert [bus.metadata["standard_metadata"]["egress_spec"].val for bus in batch] == [
+        0, 7, 7, 7, 7, 0,
+    ]
+
+    # No bus reaches the table.
+    bus = process.bus()
+    blocks["ingress"].process_batch([bus])
+    assert not bus.packet.is_valid("test")
@@ -0,0 +1,286 @@
+"""Unit test PyP4 hash calculations."""
+
+import zlib
+
+import pytest
+
+from pyp4 import PacketIO
+from pyp4.calculation import (
+    algorithm,
+    Calculation,
+    Checksum,
+    Crc,
+    csum16,
+    identity,
+    register_algorithm,
+    xor16,
+)
+from pyp4.processors.v1model import V1ModelProcess
+
+CHECK = b"123456789"
+
+
+@pytest.fixture(scope="module")
+def program_file_name():
+    return "tests/p4/complex.json"
+
+
+@pytest.mark.parametrize("name,check", [
+    ("crc16", 0xbb3d),
+    ("crc16_custom", 0xbb3d),
+    ("crc32", 0xcbf43926),
+    ("crc32_custom", 0xcbf43926),
+    ("crcCCITT", 0x29b1),
+    ("identity", 0x3132333435363738),
+    ("csum16", 0xf62a),
+    ("xor16", 0x3908),
+])
+def test_algorithms(name, check):
+    assert algorithm(name)(CHECK) == check
+    with pytest.raises(NotImplementedError):
+        algorithm("crc64")
+
+
+@pytest.mark.parametrize("parameters,check", [
+    ((8, 0x07), 0xf4),
+    ((16, 0x1021), 0x31c3),
+    ((32, 0x04c11db7, 0xffffffff, 0xffffffff), 0xfc891918),
+    ((32, 0x1edc6f41, 0xffffffff, 0xffffffff, True, True), 0xe3069283),
+    ((64, 0x42f0e1eba9ea3693, 2 ** 64 - 1, 2 ** 64 - 1, True, True), 0x995dc9bbdf1939fa),
+    ((16, 0x8005, 0, 0, True, False), 0xbcdd),
+])
+def test_crc(parameters, check):
+    crc = Crc(*parameters)
+    assert crc(CHECK) == check
+    (_, _, initial, final_xor) = (parameters + (0, 0))[:4]
+    assert crc(b"") == initial ^ final_xor
+    assert crc.parameters[:len(parameters)] == parameters
+
+    with pytest.raises(ValueError):
+        Crc(12, 0x80f)
+    with pytest.raises(ValueError):
+        Crc(8, 0x107)
+
+
+def test_crc_zlib():
+    data = bytes(range(256)) * 4
+    assert Crc(32, 0x04c11db7, 0xffffffff, 0xffffffff, True, True)(data) == zlib.crc32(data)
+    # The same CRC without zlib.
+    assert Crc(32, 0x04c11db7, 0xffffffff, 0xfffffffe, True, True)(data) == zlib.crc32(data) ^ 1
+
+
+def test_checksums():
+    # The IPv4 header example of RFC 1071 implementations.
+    header = bytes.fromhex("450000730000400040110000c0a80001c0a800c7")
+    assert csum16(header) == 0xb861
+    assert csum16(b"") == 0xffff
+    assert csum16(b"\x01") == 0xfeff
+    assert xor16(b"\x12\x34\x56") == 0x4434
+    assert xor16(b"") == 0
+    assert identity(b"\x01\x02") == 0x0102
+
+
+def test_calculation(process):
+    # The fields are packed bit by bit with zero bits in front.
+    calculation = Calculation(
+        {
+            "name": "calc",
+            "algo": "identity",
+            "input": [
+                {"type": "field", "value": ["standard_metadata", "priority"]},
+                {"type": "field", "value": ["ipv4", "ttl"]},
+                {"type": "hexstr", "value": "0x5", "bitwidth": 4},
+            ],
+        },
+        lambda _header_name, field_name: {"priority": 3, "ttl": 8}[field_name],
+    )
+    assert calculation.name == "calc"
+
+    bus = process.bus()
+    bus.metadata["standard_metadata"]["priority"].val = 0b101
+    assert calculation.serialise(bus) == bytes([0b101 << 4, 0x05])
+
+    bus.packet.add_header("ipv4")
+    bus.get_hdr("ipv4")["ttl"].val = 0xab
+    assert calculation.serialise(bus) == bytes([0b101 << 4 | 0xa, 0xb5])
+    assert calculation.compute(bus) == 0x5ab5
+
+    calculation.algorithm = Crc(16, 0x1021)
+    assert calculation.compute(bus) == Crc(16, 0x1021)(bytes([0x5a, 0xb5]))
+
+    with pytest.raises(NotImplementedError):
+        Calculation({"name": "calc", "algo": "crc16", "input": [{"type": "expression"}]}, None)
+
+
+def test_calculation_varbit(varbit_program):
+    process = V1ModelProcess("calculation", varbit_program, PacketIO.STACK)
+    calculation = Calculation(
+        {
+            "name": "calc",
+            "algo": "identity",
+            "input": [{"type": "field", "value": ["opts", "options"]}],
+        },
+        lambda _header_name, _field_name: None,
+    )
+    bus = process.bus()
+    bus.packet.add_header("opts")
+    options = bus.get_hdr("opts")["options"]
+    options.bitwidth = 24
+    options.val = 0x123456
+    assert calculation.serialise(bus) == bytes([0x12, 0x34, 0x56])
+
+
+def test_register_algorithm(program):
+    register_algorithm("first_byte", lambda: lambda data: data[0])
+    assert algorithm("first_byte")(b"\x07\x08") == 7
+
+    program = dict(program, calculations=[{
+        "name": "calc",
+        "algo": "first_byte",
+        "input": [{"type": "field", "value": ["ipv4", "dst_addr"]}],
+    }])
+    process = V1ModelProcess("calculation", program, PacketIO.BINARY)
+    bus = process.bus()
+    bus.packet.add_header("ipv4")
+    bus.get_hdr("ipv4")["dst_addr"].val = 0x0a010203
+    assert process.extern.calculations["calc"].compute(bus) == 0x0a
+
+
+def _checksum(algo="csum16", **bm_checksum):
+    calculation = Calculation(
+        {
+            "name": "calc",
+            "algo": algo,
+            "input": [
+                {"type": "field", "value": ["ipv4", "dst_addr"]},
+                {"type": "field", "value": ["ipv4", "ttl"]},
+                {"type": "hexstr", "value": "0x0", "bitwidth": 8},
+            ],
+        },
+        lambda _header_name, field_name: {"dst_addr": 32, "ttl": 8}[field_name],
+    )
+    return Checksum(
+        dict({"name": "cksum", "target": ["scalars", "goto_ipv4_0"], "type": "generic"},
+             **bm_checksum),
+        calculation,
+    )
+
+
+@pytest.mark.parametrize("dst_addr", [0, 0xffffffff])
+@pytest.mark.parametrize("ttl", [0, 1, 64])
+def test_checksum(process, dst_addr, ttl):
+    # The checksum is written into a 1-bit field to keep to the fields of the program.
+    checksum = _checksum()
+    assert checksum.name == "cksum"
+    assert checksum.target == ("scalars", "goto_ipv4_0")
+    assert checksum.calculation.name == "calc"
+
+    bus = process.bus()
+    bus.packet.add_header("ipv4")
+    ipv4 = bus.get_hdr("ipv4")
+    ipv4["dst_addr"].val = dst_addr
+    ipv4["ttl"].val = ttl
+    target = bus.get_hdr("scalars")["goto_ipv4_0"]
+
+    def full():
+        return csum16(dst_addr.to_bytes(4, "big") + bytes([ipv4["ttl"].val, 0])) & 1
+
+    baselines = {}
+    target.val = full()
+    assert checksum.verify(bus, baselines)
+    target.val ^= 1
+    assert not checksum.verify(bus, baselines)
+
+    # Incremental updates give the full checksum, including those to a sum of 0 or 0xffff.
+    for _ in range(3):
+        ipv4["ttl"].val = max(ipv4["ttl"].val - 1, 0)
+        checksum.update(bus, baselines)
+        assert target.val == full()
+
+
+def test_checksum_incremental(process):
+    checksum = _checksum(target=["ipv4", "ttl"])
+    bus = process.bus()
+    bus.packet.add_header("ipv4")
+    ipv4 = bus.get_hdr("ipv4")
+    ipv4["dst_addr"].val = 0x0a010203
+
+    def full():
+        return csum16(ipv4["dst_addr"].val.to_bytes(4, "big") + bytes([ipv4["ttl"].val, 0])) & 0xff
+
+    baselines = {}
+    checksum.verify(bus, baselines)
+    for dst_addr in (0x0a010204, 0xffffffff, 0):
+        # The address is most of the input so it is summed again. The checksum is written into
+        # the TTL so it is part of the next input.
+        ipv4["dst_addr"].val = dst_addr
+        expected = full()
+        checksum.update(bus, baselines)
+        assert ipv4["ttl"].val == expected
+
+
+def test_checksum_disabled(process):
+    bus = process.bus()
+    bus.packet.add_header("ipv4")
+    target = bus.get_hdr("scalars")["goto_ipv4_0"]
+    target.val = 1
+    is_valid = {
+        "type": "expression",
+        "value": {"op": "d2b", "left": None, "right": {
+            "type": "field", "value": ["ipv4", "$valid$"],
+        }},
+    }
+
+    # A checksum that is not enabled is neither verified nor updated.
+    bus.get_hdr("ipv4").set_invalid()
+    checksum = _checksum(if_cond=is_valid)
+    assert checksum.verify(bus, {})
+    checksum.update(bus, {})
+    assert target.val == 1
+
+    # The checksum of all zeros is 0xffff.
+    bus.get_hdr("ipv4").set_valid()
+    assert checksum.verify(bus, {})
+    target.val = 0
+    assert not checksum.verify(bus, {})
+    assert _checksum(verify=False).verify(bus, {})
+    _checksum(update=False).update(bus, {})
+    assert target.val == 0
+    checksum.update(bus, {})
+    assert target.val == 1
+
+    # Other algorithms are always computed in full.
+    checksum = _checksum("xor16")
+    baselines = {}
+    assert not checksum.verify(bus, baselines)
+    assert not baselines
+    checksum.update(bus, baselines)
+    assert target.val == 0
+
+    with pytest.raises(NotImplementedError):
+        _checksum(type="ipv4")
+
+
+def test_checksum_wire(process):
+    checksum = _checksum()
+    bus = process.bus()
+    bus.packet.add_header("ipv4")
+    ipv4 = bus.get_hdr("ipv4")
+    ipv4.from_bytes(bytes([10, 1, 2, 3, 64]), lazy=True)
+    target = bus.get_hdr("scalars")["goto_ipv4_0"]
+
+    def full():
+        return csum16(ipv4["dst_addr"].val.to_bytes(4, "big") + bytes([ipv4["ttl"].val, 0])) & 1
+
+    baselines = {}
+    checksum.verify(bus, baselines)
+    # Only the fields written since the header was decoded are read.
+    checksum.update(bus, baselines)
+    assert target.val == full()
+    ipv4["ttl"].val = 63
+    checksum.update(bus, baselines)
+    assert target.val == full()
+    # A header that lost its wire bytes is read in full.
+    ipv4.reset()
+    checksum.update(bus, baselines)
+    assert target.val == full()
@@ -1,8 +1,11 @@
 """Unit test P4 deparsers."""
 
+import json
+
 import pytest
 
-from pyp4 import PacketIO
+from pyp4 import DeparseMode, PacketIO
+from pyp4.deparser import Deparser, EmitPlan, StackEmitter
 from pyp4.packet import BinaryPacket, FixedInt, HeaderStack
 
 
@@ -38,6 +41,24 @@ def test_valid(deparser, bus):
     assert len(header_stack) == 0
 
 
+def test_stack_emitter(bus):
+    bus.packet.add_header("act")
+    header = bus.packet["act"]
+
+    emitter = StackEmitter()
+    emitter.reset(bus.packet)
+    assert emitter.emit("act")
+    assert not emitter.emit("test")
+
+    # The emitted header is moved from the packet to the header stack.
+    header_stack = emitter.finalise()
+    assert len(header_stack) == 1
+    assert header_stack.pop() is header
+    assert header.owner is None
+    assert "act" not in bus.packet
+    assert not bus.packet.is_valid("act")
+
+
 def test_invalid(deparser, bus):
     bus.packet.add_header("act")
     bus.packet.add_header("test")
@@ -103,8 +124,8 @@ def test_binary_deparser(MockProcess, program):
     bus.packet.add_header("act")
     bus.packet.add_header("test")
 
-    payload_packet = BinaryPacket()
-    payload_packet.extend(bytes([0x0a, 0x1b, 0x2c, 0x4d, 0x5e, 0x6f]))
+    payload = bytes([0x0a, 0x1b, 0x2c, 0x4d, 0x5e, 0x6f])
+    payload_packet = BinaryPacket(payload)
     _ = payload_packet.get_next(2)
     bus.packet.unparsed = payload_packet
 
@@ -120,3 +141,187 @@ def test_binary_deparser(MockProcess, program):
     assert binary_packet[
         (bus.packet["act"].bytelen + bus.packet["test"].bytelen):
     ] == bytes([0x2c, 0x4d, 0x5e, 0x6f])
+
+    assert binary_packet == (
+        bus.packet["act"].to_bytes() + bus.packet["test"].to_bytes() +
+        bytes([0x2c, 0x4d, 0x5e, 0x6f])
+    )
+
+    # The payload is not copied.
+    assert isinstance(binary_packet, BinaryPacket)
+    assert len(binary_packet) == (
+        bus.packet["act"].bytelen + bus.packet["test"].bytelen + 4
+    )
+    assert binary_packet.remaining_segments()[-1].obj is payload
+
+
+@pytest.mark.parametrize("deparse_mode", [DeparseMode.COPY, DeparseMode.HEADROOM])
+def test_incremental_deparser(MockProcess, program, deparse_mode):
+    process = MockProcess(
+        __name__, program, packet_io=PacketIO.BINARY, deparse_mode=deparse_mode,
+    )
+    parser = process.parsers["parser"]
+    deparser = process.deparsers["deparser"]
+
+    act = process.header("act")
+    act["action_id"].val = 1
+    test = process.header("test")
+    test["value"].val = 0xaa
+    payload = bytes([0x2c, 0x4d])
+
+    # Nothing changed: the input packet is passed through, even if it is read-only.
+    binary = act.to_bytes() + test.to_bytes() + payload
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(bytes(binary)))
+    assert not bus.packet["act"].dirty
+    assert not bus.packet["test"].dirty
+
+    binary_packet = deparser.process(bus.packet)
+    (segment,) = binary_packet.remaining_segments()
+    assert segment.obj is bus.packet["act"].wire.obj
+    assert bytes(binary_packet) == binary
+
+    # Writing a field re-encodes only that header, the clean header is copied from its wire bytes.
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(bytes(binary)))
+    bus.packet["test"]["value"].val = 0xbb
+    assert not bus.packet["act"].dirty
+    assert bus.packet["test"].dirty
+
+    binary_packet = deparser.process(bus.packet)
+    assert bytes(binary_packet) == act.to_bytes() + bytes([0xbb]) + payload
+
+    # Headers that are no longer contiguous with the payload cannot be passed through.
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(bytes(binary)))
+    bus.packet["test"].set_invalid()
+
+    binary_packet = deparser.process(bus.packet)
+    assert bytes(binary_packet) == act.to_bytes() + payload
+
+
+def test_headroom_deparser(MockProcess, program):
+    process = MockProcess(
+        __name__, program, packet_io=PacketIO.BINARY, deparse_mode=DeparseMode.HEADROOM,
+    )
+    parser = process.parsers["parser"]
+    deparser = process.deparsers["deparser"]
+
+    act = process.header("act")
+    act["action_id"].val = 1
+    test = process.header("test")
+    test["value"].val = 0xaa
+    payload = bytes([0x2c, 0x4d])
+
+    # Same layout: the headers are rewritten in place.
+    buffer = bytearray(act.to_bytes() + test.to_bytes() + payload)
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(buffer))
+    bus.packet["test"]["value"].val = 0xbb
+
+    binary_packet = deparser.process(bus.packet)
+    (segment,) = binary_packet.remaining_segments()
+    assert segment.obj is buffer
+    assert bytes(binary_packet) == act.to_bytes() + bytes([0xbb]) + payload
+
+    # Shrunk layout: the packet starts later in the same buffer.
+    buffer = bytearray(act.to_bytes() + test.to_bytes() + payload)
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(buffer))
+    bus.packet["test"].set_invalid()
+
+    binary_packet = deparser.process(bus.packet)
+    (segment,) = binary_packet.remaining_segments()
+    assert segment.obj is buffer
+    assert bytes(binary_packet) == act.to_bytes() + payload
+
+    # Grown layout: without headroom the deparser has to copy the headers.
+    act["action_id"].val = 0
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(bytearray(act.to_bytes() + payload)))
+    bus.packet.add_header("test")
+    bus.packet["test"]["value"].val = 0xaa
+
+    binary_packet = deparser.process(bus.packet)
+    assert len(binary_packet.remaining_segments()) == 2
+    assert bytes(binary_packet) == act.to_bytes() + test.to_bytes() + payload
+
+    # Grown layout: with headroom the headers are prepended in place.
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(act.to_bytes() + payload, headroom=16))
+    bus.packet.add_header("test")
+    bus.packet["test"]["value"].val = 0xaa
+
+    binary_packet = deparser.process(bus.packet)
+    assert len(binary_packet.remaining_segments()) == 1
+    assert bytes(binary_packet) == act.to_bytes() + test.to_bytes() + payload
+    assert binary_packet.headroom == 16 - test.bytelen
+
+
+def test_varbit_deparser(MockProcess, varbit_program):
+    process = MockProcess(__name__, varbit_program, packet_io=PacketIO.BINARY)
+    deparser = Deparser(__name__, {"name": "deparser", "order": ["opts"]}, PacketIO.BINARY)
+    bus = process.bus()
+
+    binary = bytes([0x03, 0x01, 0x02, 0x03, 0x04])
+    bus.packet.add_header("opts")
+    bus.packet["opts"].set_varbit_bitwidth(24)
+    bus.packet["opts"].from_bytes(binary, lazy=True)
+    bus.packet["opts"]["length"].val = 0x02
+    bus.packet.unparsed = BinaryPacket(binary[4:])
+
+    # The options are emitted from their view of the input binary.
+    binary_packet = deparser.process(bus.packet)
+    assert bytes(binary_packet) == bytes([0x02, 0x01, 0x02, 0x03, 0x04])
+
+
+def test_emit_plan(MockProcess):
+    with open("tests/p4/complex.json") as program_file:
+        program_complex = json.load(program_file)
+    process = MockProcess(__name__, program_complex, packet_io=PacketIO.BINARY)
+    parser = process.parsers["parser"]
+    deparser = process.deparsers["deparser"]
+
+    ethernet = process.header("ethernet")
+    ethernet["dst_addr"].val = 0x0123456789ab
+    ethernet["ethertype"].val = 0x0800
+    ipv4 = process.header("ipv4")
+    ipv4["dst_addr"].val = 0x0a000001
+    ipv4["ttl"].val = 64
+
+    packet = process.packet()
+    packet.add_header("ethernet")
+    packet.add_header("ipv4")
+    plan = EmitPlan(("ethernet", "ipv4"), packet)
+    assert plan.bytelen == 13
+    assert plan.format == ">IHHIB"
+
+    # All headers modified: a single pack.
+    packet = process.packet()
+    packet["ethernet"] = ethernet
+    packet["ipv4"] = ipv4
+    packet.unparsed = BinaryPacket(bytes([0xff]))
+    assert bytes(deparser.process(packet)) == (
+        ethernet.to_bytes() + ipv4.to_bytes() + bytes([0xff])
+    )
+
+    # Only some headers modified: the others are copied from their wire bytes.
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(ethernet.to_bytes() + ipv4.to_bytes()))
+    bus.packet["ipv4"]["ttl"].val = 63
+    assert bytes(deparser.process(bus.packet)) == (
+        ethernet.to_bytes() + ipv4.to_bytes()[:4] + bytes([63])
+    )
+
+    # The plan follows the validity bitmap.
+    validity = bus.packet.validity
+    bus.packet["ipv4"].set_invalid()
+    assert bus.packet.validity != validity
+    bus.packet["ethernet"]["ethertype"].val = 0x86dd
+    assert bytes(deparser.process(bus.packet)) == ethernet.to_bytes()[:6] + bytes([0x86, 0xdd])
+
+    # An action adding a header back selects the plan of the parsed headers again.
+    bus.packet.add_header("ipv4")
+    assert bus.packet.validity == validity
+    bus.packet["ipv4"]["ttl"].val = 62
+    assert bytes(deparser.process(bus.packet))[-1] == 62
@@ -1,8 +1,23 @@
 """Unit test PyP4 packet representations."""
 
+import mmap
+from array import array
+from copy import deepcopy
+
 import pytest
 
-from pyp4.packet import BinaryPacket, Bus, FixedInt, Header, Packet, HeaderStack
+from pyp4.bus import Bus, Metadata
+from pyp4.packet import (
+    BinaryPacket,
+    FixedInt,
+    FixedWidth,
+    Header,
+    HeaderField,
+    HeaderType,
+    Packet,
+    HeaderStack,
+    VarBit,
+)
 
 
 @pytest.fixture(scope="module")
@@ -34,6 +49,68 @@ def test_fixed_int():
     assert fixed_int.val == 0xae00fe
 
 
+def test_fixed_int_dirty():
+    fixed_int = FixedInt(0xae, 32)
+    assert not fixed_int.dirty
+    fixed_int.val = 0xbf
+    assert fixed_int.dirty
+    fixed_int.from_bytes(bytes([0x00, 0xae, 0x00, 0xfe]))
+    assert not fixed_int.dirty
+    fixed_int.set_max_val()
+    assert fixed_int.dirty
+
+
+def test_fixed_int_width():
+    fixed_int = FixedInt(0x7, 12)
+    assert not hasattr(fixed_int, "__dict__")
+    assert fixed_int.width is FixedWidth.get(12)
+    assert fixed_int.width is FixedInt(0, 12).width
+    assert fixed_int.bytewidth == 2
+    assert not fixed_int.byteint
+    assert repr(fixed_int.width) == "FixedWidth(12)"
+    assert deepcopy(fixed_int.width) is fixed_int.width
+
+    copy = deepcopy(fixed_int)
+    assert copy == fixed_int
+    assert copy.width is fixed_int.width
+    assert not copy.dirty
+
+    fixed_int.set_unchecked(0xfff)
+    assert fixed_int.is_max_val()
+    assert fixed_int.dirty
+
+    with pytest.raises(AssertionError):
+        FixedInt(0x1000, 12)
+    with pytest.raises(AssertionError):
+        fixed_int.val = 0x1000
+
+
+def test_varbit():
+    varbit = VarBit(32)
+    assert varbit.max_bitwidth == 32
+    assert varbit.bitwidth == 0
+    assert varbit.val == 0
+    assert not varbit.dirty
+
+    varbit.bitwidth = 16
+    assert varbit.bytewidth == 2
+    assert varbit.dirty
+    varbit.val = 0xabcd
+    assert int(varbit) == 0xabcd
+    assert bytes(varbit.to_bytes()) == bytes([0xab, 0xcd])
+
+    binary = bytearray([0x01, 0x02, 0x03])
+    varbit.from_bytes(binary)
+    assert not varbit.dirty
+    assert varbit.val == 0x0102
+    assert varbit.to_bytes().obj is binary
+    assert varbit == deepcopy(varbit)
+    assert repr(varbit) == "0x102/16"
+
+    with pytest.raises(AssertionError):
+        varbit.bitwidth = 40
+
+
 def test_header():
     header = Header([["field_1", 32, False], ["field_2", 64, False], ["field_3", 32, False]])
     assert header.valid
@@ -81,6 +158,168 @@ def test_header():
     assert header["field_3"].bitwidth == 32
 
 
+def test_header_wire():
+    header = Header([["field_1", 8, False], ["field_2", 16, False]])
+    assert header.dirty
+    assert header.wire is None
+    assert header.wire_offset is None
+
+    binary = bytes([0xff, 0x01, 0x02, 0x03, 0xff])
+    header.from_bytes(memoryview(binary)[1:], 1)
+    assert not header.dirty
+    assert header.wire.obj is binary
+    assert header.wire.nbytes == 3
+    assert header.wire_offset == 1
+    assert header.to_bytes() == bytes([0x01, 0x02, 0x03])
+
+    # Deep copies share the wire bytes.
+    header_copy = deepcopy(header)
+    assert not header_copy.dirty
+    assert header_copy.wire.obj is binary
+
+    assert header.written == 0
+    header["field_2"].val = 0xaabb
+    assert header.dirty
+    assert header.written == 0b10
+    assert header.to_bytes() == bytes([0x01, 0xaa, 0xbb])
+    assert not header_copy.dirty
+
+    header.from_bytes(bytearray([0x04, 0x05, 0x06]))
+    assert not header.dirty
+    assert header.written == 0
+    assert header.wire_offset is None
+
+
+def test_header_lazy():
+    header = Header([["field_1", 8, False], ["field_2", 16, False]])
+    header["field_2"].val = 0xffff
+
+    binary = bytearray([0x01, 0x02, 0x03])
+    header.from_bytes(binary, lazy=True)
+    assert not header.dirty
+
+    # Fields are only decoded on first access, so a later change to the buffer shows through.
+    binary[0] = 0x04
+    assert header["field_1"].val == 0x04
+    binary[0] = 0x05
+    assert header["field_1"].val == 0x04
+    assert header.as_dict() == {"field_1": 0x04, "field_2": 0x0203}
+    assert not header.dirty
+
+    header.from_bytes(bytes([0x01, 0x02, 0x03]), lazy=True)
+    header["field_1"].val = 0xaa
+    assert header.dirty
+    assert header.to_bytes() == bytes([0xaa, 0x02, 0x03])
+
+
+def test_header_varbit():
+    header = Header([["length", 8, False], ["options", "*"], ["end", 8, False]], max_length=6)
+    assert header.varbit is header["options"]
+    assert header.varbit.max_bitwidth == 32
+    assert header.bytelen == 2
+
+    header.set_varbit_bitwidth(24)
+    assert header.bytelen == 5
+
+    binary = bytes([0x03, 0xaa, 0xbb, 0xcc, 0xff, 0xee])
+    header.from_bytes(binary, lazy=True)
+    assert header["end"].val == 0xff
+    assert header["options"].val == 0xaabbcc
+    assert header["options"].to_bytes().obj is binary
+    assert header.to_bytes() == binary[:5]
+
+    header["length"].val = 0x04
+    assert header.to_bytes() == bytes([0x04, 0xaa, 0xbb, 0xcc, 0xff])
+
+    # A copy has its own variable-size field.
+    header.from_bytes(binary, lazy=True)
+    copy = deepcopy(header)
+    assert copy.varbit is not header.varbit
+    assert copy["options"].val == 0xaabbcc
+    header["length"].val = 0x04
+    assert header["options"].val == 0xaabbcc
+    copy = deepcopy(header)
+    assert copy.varbit is copy["options"]
+    assert copy.to_bytes() == bytes([0x04, 0xaa, 0xbb, 0xcc, 0xff])
+
+
+def test_header_type():
+    header_type = HeaderType.from_bm({
+        "name": "opts_t",
+        "fields": [["length", 8, False], ["flags", 4, False], ["options", "*"], ["end", 12, False]],
+        "max_length": 8,
+    })
+    assert header_type.name == "opts_t"
+    assert header_type.max_length == 8
+    assert repr(header_type) == "HeaderType('opts_t', ('length', 'flags', 'options', 'end'))"
+    assert header_type.names == ("length", "flags", "options", "end")
+    assert header_type.index("end") == 3
+    assert header_type.widths == (FixedWidth.get(8), FixedWidth.get(4), None, FixedWidth.get(12))
+    assert header_type.masks == (0xff, 0xf, None, 0xfff)
+    assert header_type.offsets == (0, 8, 12, 12)
+    assert header_type.bitlen == 24
+    assert header_type.varbit == 2
+    assert header_type.max_varbit_bitwidth == 40
+    assert not header_type.byteints
+    assert deepcopy(header_type) is header_type
+    assert header_type == HeaderType.from_bm({
+        "name": "other_t",
+        "fields": [["length", 8, False], ["flags", 4, False], ["options", "*"], ["end", 12, False]],
+        "max_length": 8,
+    })
+    assert len({header_type, deepcopy(header_type)}) == 1
+
+    header_type = HeaderType([("field_1", 8, False), ("field_2", 16, False)])
+    assert header_type != [("field_1", 8, False), ("field_2", 16, False)]
+    assert header_type.name is None
+    assert header_type.varbit is None
+    assert header_type.spans() == ((0, 1), (1, 3))
+
+    # Headers of the same type share it.
+    header = Header(header_type)
+    assert header.header_type is header_type
+    assert deepcopy(header).header_type is header_type
+
+
+def test_header_field():
+    header = Header([("field_1", 8, False), ("field_2", 16, False)])
+    field = header["field_2"]
+    assert isinstance(field, HeaderField)
+    assert field is header["field_2"]
+    assert field.width is FixedWidth.get(16)
+    assert (field.bytewidth, field.byteint) == (2, True)
+    assert list(header) == ["field_1", "field_2"]
+    assert field == FixedInt(0, 16)
+    assert FixedInt(0, 16) == field
+    assert not field.dirty
+
+    # The field is a view of the value stored in the header.
+    field.val = 0xabcd
+    assert field.dirty
+    assert header.as_dict() == {"field_1": 0, "field_2": 0xabcd}
+    assert int(field) == 0xabcd
+    assert repr(field) == "0xABCD"
+    field.set_unchecked(0x1234)
+    assert header.to_bytes() == bytes([0x00, 0x12, 0x34])
+    field.set_max_val()
+    assert field.is_max_val()
+    with pytest.raises(AssertionError):
+        field.val = 0x10000
+
+    field.from_bytes(bytes([0x56, 0x78]))
+    assert not field.dirty
+    assert field.to_bytes() == bytes([0x56, 0x78])
+
+    # A field copied on its own is detached from the header.
+    copy = deepcopy(field)
+    assert isinstance(copy, FixedInt)
+    assert copy == field
+    assert not copy.dirty
+    field.val = 0x9abc
+    assert deepcopy(field).dirty
+    assert copy.val == 0x5678
+
+
 def test_header_stack():
     header = Header([("field", 128, False)])
     header["field"].val = 0xae
@@ -102,6 +341,11 @@ def test_header_stack():
 
     assert header_stack.payload == b"payload"
 
+    header_stack.push(header)
+    header_copy = header_stack.copy().pop()
+    assert header_copy is not header
+    assert header_copy["field"].val == 0xae
+
 
 def test_binary_packet():
     binary_packet = BinaryPacket()
@@ -143,6 +387,204 @@ def test_binary_packet():
     assert header_1["field_2"].val == 0xea
 
 
+def test_binary_packet_zero_copy():
+    buffer = bytearray([0x0a, 0x1b, 0x2c, 0x3d])
+    binary_packet = BinaryPacket(buffer)
+    assert len(binary_packet) == 4
+
+    # The views returned by the packet refer to the original buffer.
+    view = binary_packet.get_next(2)
+    assert view.obj is buffer
+    buffer[0] = 0xff
+    assert view == bytes([0xff, 0x1b])
+
+    assert binary_packet.remaining_segments()[0].obj is buffer
+    assert binary_packet.get_remaining() == bytes([0x2c, 0x3d])
+    assert not binary_packet.remaining_segments()
+
+    for source in [bytes([0x0a, 0x1b]), memoryview(bytes([0x0a, 0x1b]))]:
+        assert BinaryPacket(source).get_next(2) == bytes([0x0a, 0x1b])
+
+    with mmap.mmap(-1, 2) as mapped:
+        mapped.write(bytes([0x0a, 0x1b]))
+        binary_packet = BinaryPacket(mapped)
+        assert binary_packet.get_next(2) == bytes([0x0a, 0x1b])
+        binary_packet.get_remaining().release()
+        del binary_packet
+
+
+def test_binary_packet_segments():
+    binary_packet = BinaryPacket()
+    assert len(binary_packet) == 0
+    assert binary_packet.get_remaining() == b""
+    assert not binary_packet.remaining_segments()
+
+    payload = bytes([0x3d, 0x4e, 0x5f])
+    binary_packet.extend(bytes([0x0a, 0x1b]))
+    binary_packet.extend(b"")
+    binary_packet.extend(bytes([0x2c]))
+    binary_packet.extend(payload)
+    assert len(binary_packet) == 6
+    assert bytes(binary_packet) == bytes([0x0a, 0x1b, 0x2c, 0x3d, 0x4e, 0x5f])
+    assert binary_packet[1:5] == bytes([0x1b, 0x2c, 0x3d, 0x4e])
+    assert isinstance(repr(binary_packet), str)
+
+    # Indexing finds the segment and slices within a segment are views of it.
+    assert [binary_packet[index] for index in range(6)] == list(bytes(binary_packet))
+    assert binary_packet[-1] == 0x5f
+    assert binary_packet[4:].obj is payload
+    assert binary_packet[::2] == bytes([0x0a, 0x2c, 0x4e])
+    assert binary_packet[4:2] == b""
+    with pytest.raises(IndexError):
+        _ = binary_packet[6]
+
+    # Packets compare equal to their bytes.
+    assert binary_packet == bytes([0x0a, 0x1b, 0x2c, 0x3d, 0x4e, 0x5f])
+    assert binary_packet == bytearray([0x0a, 0x1b, 0x2c, 0x3d, 0x4e, 0x5f])
+    assert binary_packet == BinaryPacket(bytes(binary_packet))
+    assert binary_packet != bytes([0x0a, 0x1b, 0x2c])
+    assert binary_packet != BinaryPacket()
+    assert binary_packet != "payload"
+
+    # Bytes spanning segments are joined.
+    assert binary_packet.get_next(3) == bytes([0x0a, 0x1b, 0x2c])
+
+    # Whole segments are not.
+    (segment,) = binary_packet.remaining_segments()
+    assert segment.obj is payload
+
+    assert binary_packet.get_next(1) == bytes([0x3d])
+    assert binary_packet.remaining_segments() == [bytes([0x4e, 0x5f])]
+
+    binary_packet.reset()
+    assert binary_packet.get_next(1) == bytes([0x0a])
+    assert [bytes(seg) for seg in binary_packet.remaining_segments()] == [
+        bytes([0x1b]), bytes([0x2c]), payload,
+    ]
+
+    single = BinaryPacket(payload)
+    assert single[0] == 0x3d
+    assert single[1:] == bytes([0x4e, 0x5f])
+
+
+def test_binary_packet_non_bytes():
+    # Non-byte buffers are viewed as bytes.
+    words = array("H", [0x1234, 0x5678])
+    binary_packet = BinaryPacket(words)
+    assert len(binary_packet) == 4
+    assert bytes(binary_packet) == words.tobytes()
+
+
+def test_binary_packet_from_position():
+    first = bytearray([0x01, 0x02, 0x03])
+    second = bytes([0x04, 0x05])
+    binary_packet = BinaryPacket(first)
+    binary_packet.extend(second)
+    _ = binary_packet.get_next(4)
+    assert binary_packet.position == 4
+
+    packet = binary_packet.from_position(1)
+    assert bytes(packet) == bytes([0x02, 0x03, 0x04, 0x05])
+    assert packet.position == 0
+    assert [segment.obj for segment in packet.remaining_segments()] == [first, second]
+    first[1] = 0xff
+    assert bytes(packet) == bytes([0xff, 0x03, 0x04, 0x05])
+
+    packet = binary_packet.from_position(3)
+    assert bytes(packet) == second
+    assert packet.remaining_segments()[0].obj is second
+
+    assert len(binary_packet.from_position(len(binary_packet))) == 0
+    assert binary_packet.position == 4
+
+    binary_packet = deepcopy(binary_packet)
+    assert bytes(binary_packet) == bytes([0x01, 0xff, 0x03, 0x04, 0x05])
+    assert binary_packet.position == 4
+
+
+def test_binary_packet_peek():
+    binary_packet = BinaryPacket(bytes([0x12, 0x34]))
+    binary_packet.extend(bytes([0x56]))
+    _ = binary_packet.get_next(1)
+
+    assert binary_packet.peek(0, 8) == 0x34
+    assert binary_packet.peek(4, 8) == 0x45
+    assert binary_packet.peek(3, 2) == 0x2
+    assert binary_packet.peek(0, 16) == 0x3456
+    assert binary_packet.position == 1
+
+    with pytest.raises(ValueError):
+        binary_packet.peek(8, 9)
+
+    with pytest.raises(NotImplementedError):
+        HeaderStack().peek(0, 8)
+
+
+def test_binary_packet_copy():
+    buffer = bytearray([0x0a, 0x1b, 0x2c, 0x3d])
+    binary_packet = BinaryPacket(buffer)
+    binary_packet.get_next(2)
+    assert binary_packet.headroom == 2
+
+    # The copy shares the buffer, so neither packet may write into it.
+    packet_copy = binary_packet.copy()
+    assert packet_copy.position == 2
+    assert bytes(packet_copy) == bytes(buffer)
+    assert packet_copy.remaining_segments()[0].obj is buffer
+    assert packet_copy.headroom == 0
+    assert binary_packet.headroom == 0
+
+    packet_copy.get_next(1)
+    assert binary_packet.position == 2
+
+
+def test_binary_packet_headroom():
+    # Read-only buffers have no headroom.
+    binary_packet = BinaryPacket(bytes([0x0a, 0x1b, 0x2c]))
+    binary_packet.get_next(2)
+    assert binary_packet.headroom == 0
+    with pytest.raises(ValueError):
+        binary_packet.claim_headroom(1)
+
+    # Parsed bytes of a writable buffer can be reused.
+    buffer = bytearray([0x0a, 0x1b, 0x2c, 0x3d])
+    binary_packet = BinaryPacket(buffer)
+    assert binary_packet.headroom == 0
+    binary_packet.get_next(2)
+    assert binary_packet.headroom == 2
+
+    region, packet_out = binary_packet.claim_headroom(1)
+    region[:] = bytes([0xff])
+    assert region.obj is buffer
+    assert bytes(packet_out) == bytes([0xff, 0x2c, 0x3d])
+    assert buffer == bytearray([0x0a, 0xff, 0x2c, 0x3d])
+
+    # The headroom can only be claimed once.
+    assert binary_packet.headroom == 0
+
+    # Reserved headroom is preserved by the claimed packet.
+    binary_packet = BinaryPacket(bytes([0x2c, 0x3d]), headroom=4)
+    assert len(binary_packet) == 2
+    assert binary_packet.headroom == 4
+    region, packet_out = binary_packet.claim_headroom(3)
+    region[:] = bytes([0x0a, 0x1b, 0x1c])
+    assert bytes(packet_out) == bytes([0x0a, 0x1b, 0x1c, 0x2c, 0x3d])
+    assert packet_out.headroom == 1
+
+    # Headroom is only available for the segment at the pointer.
+    binary_packet = BinaryPacket(bytearray([0x0a]))
+    binary_packet.extend(bytearray([0x1b, 0x2c]))
+    binary_packet.get_next(2)
+    assert binary_packet.headroom == 1
+    region, packet_out = binary_packet.claim_headroom(1)
+    region[:] = bytes([0xff])
+    assert bytes(packet_out) == bytes([0xff, 0x2c])
+
+    binary_packet = BinaryPacket(headroom=2)
+    assert len(binary_packet) == 0
+    assert binary_packet.headroom == 2
+
+
 def test_packet(header_types, header_defs):
     packet = Packet(header_types, header_defs, b"payload")
 
@@ -162,9 +604,17 @@ def test_packet(header_types, header_defs):
     packet.add_header("act")
     assert packet.is_valid("act")
 
-    packet["test"] = Header(header_types[header_defs["test"]["header_type"]]["fields"])
+    # A user-built header is copied.
+    header = Header(header_types[header_defs["test"]["header_type"]]["fields"])
+    header["value"].val = 0xaa
+    packet["test"] = header
     assert "test" in packet
     assert packet.is_valid("test")
+    assert packet["test"] is not header
+    assert packet["test"]["value"].val == 0xaa
+    header["value"].val = 0xbb
+    assert packet["test"]["value"].val == 0xaa
+    assert header.owner is None
 
     assert isinstance(repr(packet), str)
 
@@ -178,6 +628,126 @@ def test_packet(header_types, header_defs):
     assert not packet.is_valid("test")
 
 
+def test_packet_validity(header_types, header_defs):
+    packet = Packet(header_types, header_defs)
+    act_bit = 1 << list(header_defs).index("act")
+    test_bit = 1 << list(header_defs).index("test")
+    assert packet.validity == 0
+
+    packet.add_header("act")
+    assert packet.validity == act_bit
+    assert packet["act"].owner is packet
+
+    old_test = packet["test"]
+    packet["test"] = Header(header_types[header_defs["test"]["header_type"]]["fields"])
+    assert packet.validity == act_bit | test_bit
+    assert old_test.owner is None
+    old_test.set_invalid()
+    assert packet.validity == act_bit | test_bit
+
+    packet["act"].set_invalid()
+    assert packet.validity == test_bit
+
+    packet_copy = deepcopy(packet)
+    assert packet_copy["test"].owner is packet_copy
+    packet_copy["test"].set_invalid()
+    assert packet_copy.validity == 0
+    assert packet.validity == test_bit
+
+    test = packet["test"]
+    packet.clear()
+    assert packet.validity == 0
+    assert test.owner is None
+
+
+def test_packet_reset(header_types, header_defs):
+    packet = Packet(header_types, header_defs, BinaryPacket(b"payload"))
+    packet.add_header("act")
+    action_id = packet["act"]["action_id"]
+    action_id.val = 0xab
+    packet["act"].from_bytes(bytes([0x00, 0x00, 0x00, 0x02]), lazy=True)
+
+    packet.reset()
+    assert packet.validity == 0
+    assert packet.unparsed is None
+    assert not packet.is_valid("act")
+    assert packet["act"]["action_id"] is action_id
+    assert action_id.val == 0
+    assert packet["act"].wire is None
+
+    # Cleared headers are created again.
+    packet.clear()
+    packet.reset()
+    assert set(header_defs) == {name for name in header_defs if name in packet}
+    assert packet["act"].owner is packet
+    packet.add_header("act")
+    assert packet.validity == 1 << list(header_defs).index("act")
+
+
+def test_header_reset():
+    header = Header([["length", 8, False], ["options", "*"]], max_length=4)
+    header.set_varbit_bitwidth(16)
+    header.from_bytes(bytes([0x02, 0xaa, 0xbb]))
+    header.set_invalid()
+
+    header.reset()
+    assert not header.valid
+    assert header.as_dict() == {"length": 0, "options": 0}
+    assert header.varbit.bitwidth == 0
+    assert header.bytelen == 1
+    assert header.dirty
+
+
+def test_packet_adopt(header_types, header_defs):
+    packet = Packet(header_types, header_defs)
+    fields = header_types[header_defs["act"]["header_type"]]["fields"]
+
+    # A header of the expected type is adopted.
+    header = Header(fields)
+    header.set_invalid()
+    packet.adopt("act", header)
+    assert packet["act"] is header
+    assert header.owner is packet
+    assert packet.is_valid("act")
+
+    # A header that belongs to another packet is copied.
+    other = Packet(header_types, header_defs)
+    other.adopt("act", packet["act"])
+    assert other["act"] is not header
+    assert header.owner is packet
+
+    # A released header is moved.
+    assert packet.release("act") is header
+    assert "act" not in packet
+    assert not packet.is_valid("act")
+    assert header.owner is None
+    other.adopt("act", header)
+    assert other["act"] is header
+    packet.add_header("act")
+    assert packet["act"] is not header
+
+    # A header of another type is validated and copied.
+    foreign = Header(fields, max_length=16)
+    foreign[fields[0][0]].val = 2
+    assert foreign.header_type != packet["act"].header_type
+    packet.adopt("act", foreign)
+    assert packet["act"] is not foreign
+    assert packet["act"][fields[0][0]].val == 2
+
+
+def test_packet_adopt_varbit(MockProcess, varbit_program):
+    packet = MockProcess(__name__, varbit_program).packet()
+
+    # The fields are in a different order.
+    foreign = Header([["options", "*"], ["length", 8, False]], max_length=9)
+    foreign.set_varbit_bitwidth(16)
+    foreign["options"].val = 0xabcd
+    foreign["length"].val = 2
+    packet["opts"] = foreign
+    assert packet["opts"].header_type.names == ("length", "options")
+    assert packet["opts"].to_bytes() == bytes([0x02, 0xab, 0xcd])
+
+
 def test_bus(process, header_types, header_defs):
     packet = Packet(header_types, header_defs)
     packet.add_header("act")
@@ -196,3 +766,70 @@ def test_bus(process, header_types, header_defs):
     bus_clone.packet["act"]["action_id"].val = 0xbf
 
     assert bus.get_hdr("act")["action_id"].val == 0xab
+
+
+def test_bus_clone(process, header_types, header_defs):
+    bus = process.bus()
+    bus.metadata["standard_metadata"]["ingress_port"].val = 3
+    bus.packet.add_header("act")
+    bus.packet["act"].from_bytes(bytes([0x00, 0x00, 0x00, 0x02]), lazy=True)
+    bus.packet.unparsed = BinaryPacket(b"payload")
+    bus.requests["resubmit"] = 0
+
+    clone = bus.clone()
+    assert clone.metadata["standard_metadata"]["ingress_port"].val == 3
+    assert not clone.requests
+    assert clone.packet.validity == bus.packet.validity
+    assert clone.packet["act"].header_type is bus.packet["act"].header_type
+    assert clone.packet["act"].wire is bus.packet["act"].wire
+    assert not clone.packet["act"].dirty
+    assert clone.packet["act"]["action_id"].val == 2
+    assert bytes(clone.packet.unparsed) == b"payload"
+
+    # The clone is independent of the original.
+    clone.metadata["standard_metadata"]["ingress_port"].val = 4
+    clone.packet["act"].set_invalid()
+    assert clone.packet.validity == 0
+    assert bus.metadata["standard_metadata"]["ingress_port"].val == 3
+    assert bus.packet.validity != 0
+
+    # Other unparsed parts are deep copied.
+    bus.packet.unparsed = [b"payload"]
+    clone = bus.clone()
+    assert clone.packet.unparsed == [b"payload"]
+    assert clone.packet.unparsed is not bus.packet.unparsed
+
+    bus.reset()
+    assert not bus.requests
+
+
+def test_metadata(process):
+    created = []
+
+    def factory(name):
+        created.append(name)
+        return process.header(name, metadata=True)
+
+    metadata = Metadata(["scalars", "standard_metadata"], factory)
+    assert len(metadata) == 2
+    assert list(metadata) == ["scalars", "standard_metadata"]
+    assert "scalars" in metadata
+    assert metadata.get("act") is None
+    with pytest.raises(KeyError):
+        metadata["act"]
+    assert not created
+    assert repr(metadata) == "{}"
+
+    # A struct is created on first access only.
+    standard_metadata = metadata["standard_metadata"]
+    assert metadata.get("standard_metadata") is standard_metadata
+    assert created == ["standard_metadata"]
+    assert list(metadata.created) == ["standard_metadata"]
+
+    standard_metadata["ingress_port"].val = 3
+    metadata_copy = metadata.copy()
+    assert list(metadata_copy.created) == ["standard_metadata"]
+    assert metadata_copy["standard_metadata"] is not standard_metadata
+    assert metadata_copy["standard_metadata"]["ingress_port"].val == 3
+    assert metadata_copy["scalars"].valid
+    assert created == ["standard_metadata", "scalars"]
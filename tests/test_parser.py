@@ -5,6 +5,7 @@ import pytest
 
 from pyp4 import PacketIO
 from pyp4.packet import BinaryPacket, HeaderStack
+from pyp4.parser import CORE_ERRORS, Parser
 
 
 @pytest.fixture(scope="module")
@@ -113,3 +114,372 @@ def test_binary_parser(MockProcess, program):
 
     assert ("act" in bus.packet) and bus.packet["act"].valid
     assert ("test" in bus.packet) and (int(bus.packet["test"]["value"]) == 0xae)
+
+
+def _field(header_name, field_name):
+    return {"type": "field", "value": [header_name, field_name]}
+
+
+def _hexstr(value):
+    return {"type": "hexstr", "value": hex(value)}
+
+
+def _state(name, parser_ops, transitions=None, transition_key=None):
+    return {
+        "name": name,
+        "parser_ops": parser_ops,
+        "transitions": transitions or [{"type": "default", "value": None, "next_state": None}],
+        "transition_key": transition_key or [],
+    }
+
+
+def _extract(header_name):
+    return {"op": "extract", "parameters": [{"type": "regular", "value": header_name}]}
+
+
+def _bm_parser(*parse_states):
+    return {"name": "parser", "init_state": "start", "parse_states": list(parse_states)}
+
+
+@pytest.fixture()
+def binary_process(MockProcess, program):
+    return MockProcess(__name__, program, packet_io=PacketIO.BINARY)
+
+
+def test_parser_ops(binary_process):
+    bm_parser = _bm_parser(
+        _state(
+            "start",
+            [
+                _extract("act"),
+                {"op": "set", "parameters": [
+                    _field("standard_metadata", "mcast_grp"),
+                    {"type": "lookahead", "value": [4, 12]},
+                ]},
+                {"op": "advance", "parameters": [_hexstr(16)]},
+                {"op": "primitive", "parameters": [{"op": "assign", "parameters": [
+                    _field("standard_metadata", "egress_rid"),
+                    {"type": "expression", "value": {
+                        "op": "+", "left": _field("act", "action_id"), "right": _hexstr(1),
+                    }},
+                ]}]},
+            ],
+            transitions=[
+                {"type": "hexstr", "value": "0xae", "next_state": "parse_test"},
+                {"type": "default", "value": None, "next_state": None},
+            ],
+            transition_key=[{"type": "lookahead", "value": [0, 8]}],
+        ),
+        _state("parse_test", [
+            _extract("test"),
+            {"op": "verify", "parameters": [
+                {"type": "expression", "value": {
+                    "op": "==", "left": _field("test", "value"), "right": _hexstr(0xae),
+                }},
+                _hexstr(CORE_ERRORS["ParserInvalidArgument"]),
+            ]},
+        ]),
+    )
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+
+    binary = bytes([0x00, 0x00, 0x00, 0x07, 0x12, 0x34, 0xae, 0x5e])
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(binary)) == CORE_ERRORS["NoError"]
+
+    assert bus.packet["act"]["action_id"].val == 7
+    assert bus.metadata["standard_metadata"]["mcast_grp"].val == 0x234
+    assert bus.metadata["standard_metadata"]["egress_rid"].val == 8
+    assert bus.packet["test"].valid and (bus.packet["test"]["value"].val == 0xae)
+    assert bytes(bus.packet.unparsed.get_remaining()) == bytes([0x5e])
+
+    # A failed verify rejects the packet with the provided error.
+    bm_parser["parse_states"][1]["parser_ops"][1]["parameters"][0]["value"]["right"] = _hexstr(0)
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    bus = binary_process.bus()
+    error = parser.process(bus, BinaryPacket(binary))
+    assert error == CORE_ERRORS["ParserInvalidArgument"]
+    assert bus.packet["test"].valid
+
+
+def test_parser_reject(binary_process):
+    bm_parser = _bm_parser(
+        _state(
+            "start",
+            [
+                _extract("act"),
+                {"op": "verify", "parameters": [
+                    {"type": "bool", "value": False}, _hexstr(CORE_ERRORS["HeaderTooShort"]),
+                ]},
+                _extract("test"),
+            ],
+        ),
+    )
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+
+    # The operations after a failed verify are skipped.
+    bus = binary_process.bus()
+    error = parser.process(bus, BinaryPacket(bytes([0x00, 0x00, 0x00, 0x01, 0xae])))
+    assert error == CORE_ERRORS["HeaderTooShort"]
+    assert bus.packet["act"].valid
+    assert not bus.packet.is_valid("test")
+    assert bytes(bus.packet.unparsed.get_remaining()) == bytes([0xae])
+
+    # A packet that is too short for a header is rejected without consuming any bytes.
+    bus = binary_process.bus()
+    error = parser.process(bus, BinaryPacket(bytes([0x00, 0x01])))
+    assert error == CORE_ERRORS["PacketTooShort"]
+    assert not bus.packet.is_valid("act")
+    assert bytes(bus.packet.unparsed.get_remaining()) == bytes([0x00, 0x01])
+
+    bm_parser = _bm_parser(_state("start", [{"op": "advance", "parameters": [_hexstr(24)]}]))
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(bytes([0x00, 0x01]))) == CORE_ERRORS["PacketTooShort"]
+
+    # No matching transition.
+    bm_parser = _bm_parser(
+        _state(
+            "start",
+            [_extract("act")],
+            transitions=[{"type": "hexstr", "value": "0x01", "next_state": None}],
+            transition_key=[_field("act", "action_id")],
+        ),
+    )
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(bytes(4))) == CORE_ERRORS["NoMatch"]
+
+
+def test_unsupported_parser_ops(process, bus, packet):
+    with pytest.raises(NotImplementedError):
+        Parser(__name__, _bm_parser(_state("start", [{"op": "unknown", "parameters": []}])))
+
+    packet.push(process.header("act"))
+
+    # Header stack packets cannot lookahead or advance.
+    bm_parser = _bm_parser(_state("start", [{"op": "advance", "parameters": [_hexstr(8)]}]))
+    with pytest.raises(NotImplementedError):
+        Parser(__name__, bm_parser, PacketIO.STACK).process(bus, packet)
+
+    bm_parser = _bm_parser(_state("start", [{"op": "set", "parameters": [
+        _field("standard_metadata", "mcast_grp"), {"type": "lookahead", "value": [0, 8]},
+    ]}]))
+    with pytest.raises(NotImplementedError):
+        Parser(__name__, bm_parser, PacketIO.STACK).process(bus, packet)
+
+
+def test_extract_vl(MockProcess, varbit_program):
+    process = MockProcess(__name__, varbit_program, packet_io=PacketIO.BINARY)
+    bm_parser = _bm_parser(_state("start", [
+        {"op": "set", "parameters": [
+            _field("standard_metadata", "mcast_grp"), {"type": "lookahead", "value": [0, 8]},
+        ]},
+        {"op": "extract_VL", "parameters": [
+            {"type": "regular", "value": "opts"},
+            {"type": "expression", "value": {
+                "op": "<<", "left": _field("standard_metadata", "mcast_grp"), "right": _hexstr(3),
+            }},
+        ]},
+    ]))
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+
+    binary = bytes([0x03, 0x01, 0x02, 0x03, 0x04, 0x05])
+    bus = process.bus()
+    assert parser.process(bus, BinaryPacket(binary)) == CORE_ERRORS["NoError"]
+    assert bus.packet["opts"].valid
+    assert bus.packet["opts"]["length"].val == 0x03
+    assert bus.packet["opts"]["options"].bitwidth == 24
+    assert bus.packet["opts"]["options"].val == 0x010203
+    assert bus.packet["opts"]["options"].to_bytes().obj is binary
+    assert bytes(bus.packet.unparsed.get_remaining()) == bytes([0x04, 0x05])
+
+    # The options are longer than the maximum length of the header.
+    bus = process.bus()
+    error = parser.process(bus, BinaryPacket(bytes([0x09]) + bytes(9)))
+    assert error == CORE_ERRORS["HeaderTooShort"]
+    assert not bus.packet.is_valid("opts")
+
+    # The options are longer than the packet.
+    bus = process.bus()
+    error = parser.process(bus, BinaryPacket(bytes([0x03, 0x01])))
+    assert error == CORE_ERRORS["PacketTooShort"]
+
+    # The options must be whole bytes.
+    bm_parser["parse_states"][0]["parser_ops"][1]["parameters"][1] = _hexstr(4)
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    bus = process.bus()
+    error = parser.process(bus, BinaryPacket(binary))
+    assert error == CORE_ERRORS["ParserInvalidArgument"]
+
+    # Header stack packets carry the variable-size field in the header.
+    process = MockProcess(__name__, varbit_program, packet_io=PacketIO.STACK)
+    bm_parser["parse_states"][0]["parser_ops"] = [
+        bm_parser["parse_states"][0]["parser_ops"][1],
+    ]
+    bm_parser["parse_states"][0]["parser_ops"][0]["parameters"][1] = _hexstr(16)
+    parser = Parser(__name__, bm_parser, PacketIO.STACK)
+    opts = process.header("opts")
+    opts.set_varbit_bitwidth(16)
+    opts["options"].val = 0xabcd
+    packet = HeaderStack()
+    packet.push(opts)
+    bus = process.bus()
+    assert parser.process(bus, packet) == CORE_ERRORS["NoError"]
+    assert bus.packet["opts"]["options"].val == 0xabcd
+    assert bus.packet["opts"]["options"].bitwidth == 16
+
+
+def test_parser_optimiser(MockProcess):
+    with open("tests/p4/complex.json") as program_file:
+        program_complex = json.load(program_file)
+    process = MockProcess(__name__, program_complex, packet_io=PacketIO.BINARY)
+    parser = process.parsers["parser"]
+
+    root = parser.optimiser.root
+    assert list(root.targets) == [0x0800]
+    assert root.targets[0x0800].state is None
+    assert root.default is None
+
+    ethernet = process.header("ethernet")
+    ethernet["ethertype"].val = 0x0800
+    ipv4 = process.header("ipv4")
+
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(ethernet.to_bytes() + ipv4.to_bytes()))
+    assert bus.packet.is_valid("ethernet")
+    assert bus.packet.is_valid("ipv4")
+
+    ethernet["ethertype"].val = 0x86dd
+    bus = process.bus()
+    parser.process(bus, BinaryPacket(ethernet.to_bytes()))
+    assert bus.packet.is_valid("ethernet")
+    assert not bus.packet.is_valid("ipv4")
+
+
+def test_parser_optimiser_loop(binary_process):
+    # A state that loops on itself is only specialised for a bounded number of visits.
+    bm_parser = _bm_parser(
+        _state(
+            "start",
+            [_extract("act")],
+            transitions=[
+                {"type": "hexstr", "value": "0x01", "next_state": "start"},
+                {"type": "default", "value": None, "next_state": None},
+            ],
+            transition_key=[_field("act", "action_id")],
+        ),
+    )
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    assert parser.optimiser.root.targets[1].default is None
+    assert parser.optimiser.root.targets[1].targets[1].fallback == "start"
+
+    bus = binary_process.bus()
+    parser.process(bus, BinaryPacket(bytes([0, 0, 0, 1, 0, 0, 0, 0])))
+    assert bus.packet["act"]["action_id"].val == 0
+
+    bus = binary_process.bus()
+    parser.process(bus, BinaryPacket(bytes([0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 2])))
+    assert bus.packet["act"]["action_id"].val == 2
+
+
+def _dense_bm_parser(count):
+    # Every state extracts a header and transitions to any state on its value.
+    names = ["start"] + [f"state_{index}" for index in range(1, count)]
+    return _bm_parser(*[
+        _state(
+            name,
+            [_extract("act")],
+            transitions=[
+                {"type": "hexstr", "value": hex(index + 1), "next_state": next_state}
+                for index, next_state in enumerate(names)
+            ] + [{"type": "default", "value": None, "next_state": None}],
+            transition_key=[_field("act", "action_id")],
+        )
+        for name in names
+    ])
+
+
+@pytest.mark.parametrize("count", [3, 5, 12])
+def test_parser_optimiser_dense(binary_process, count):
+    # Paths that visited the same states equally often share their node, which bounds the trie
+    # of a densely looping parse graph, and the node count is capped.
+    parser = Parser(__name__, _dense_bm_parser(count), PacketIO.BINARY)
+    assert parser.optimiser.size <= min(count * 3 ** count, 4096)
+    if count == 12:
+        assert parser.optimiser.size == 4096
+
+    # A path that loops beyond the bounds falls back to the states.
+    action_ids = [(index % count) + 1 for index in range(3 * count)] + [0]
+    bus = binary_process.bus()
+    binary = b"".join(action_id.to_bytes(4, "big") for action_id in action_ids)
+    assert parser.process(bus, BinaryPacket(binary)) == CORE_ERRORS["NoError"]
+    assert bus.packet["act"]["action_id"].val == 0
+
+
+def test_parser_optimiser_chain(binary_process):
+    # Both transitions lead to the same chain of unconditional states which is merged and shared.
+    bm_parser = _bm_parser(
+        _state(
+            "start",
+            [_extract("act")],
+            transitions=[
+                {"type": "hexstr", "value": "0x01", "next_state": "middle"},
+                {"type": "hexstr", "value": "0x02", "next_state": "middle"},
+                {"type": "default", "value": None, "next_state": None},
+            ],
+            transition_key=[_field("act", "action_id")],
+        ),
+        _state("middle", [], transitions=[
+            {"type": "default", "value": None, "next_state": "parse_test"},
+        ]),
+        _state("parse_test", [_extract("test")]),
+    )
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    root = parser.optimiser.root
+    assert root.targets[1] is root.targets[2]
+    assert len(root.targets[1].ops) == 1
+    assert root.targets[1].state is None
+
+    bus = binary_process.bus()
+    parser.process(bus, BinaryPacket(bytes([0, 0, 0, 2, 0xae])))
+    assert bus.packet["test"]["value"].val == 0xae
+
+
+def test_parser_fallback(binary_process):
+    # Masked transitions are not specialised and are processed state by state.
+    bm_parser = _bm_parser(
+        _state(
+            "start",
+            [_extract("act")],
+            transitions=[
+                {"type": "hexstr", "value": "0x01", "mask": "0xff", "next_state": "parse_test"},
+                {"type": "hexstr", "value": "0x02", "mask": "0xff", "next_state": "empty"},
+            ],
+            transition_key=[_field("act", "action_id")],
+        ),
+        _state("parse_test", [_extract("test")]),
+        _state("empty", []),
+    )
+    bm_parser["parse_states"][2]["transitions"] = []
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    assert parser.optimiser.root.fallback == "start"
+    assert not parser.optimiser.root.ops
+
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(bytes([0, 0, 0, 1, 0xae]))) == CORE_ERRORS["NoError"]
+    assert bus.packet["test"]["value"].val == 0xae
+
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(bytes([0, 0, 0, 1]))) == CORE_ERRORS["PacketTooShort"]
+
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(bytes([0, 0, 0, 3]))) == CORE_ERRORS["NoMatch"]
+
+    # A state without any transitions never matches.
+    bus = binary_process.bus()
+    assert parser.process(bus, BinaryPacket(bytes([0, 0, 0, 2]))) == CORE_ERRORS["NoMatch"]
+
+    bm_parser = _bm_parser(_state("start", [_extract("act")]))
+    bm_parser["parse_states"][0]["transitions"] = []
+    parser = Parser(__name__, bm_parser, PacketIO.BINARY)
+    assert parser.optimiser.root.fallback == "start"
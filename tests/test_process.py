@@ -3,6 +3,7 @@
 import copy
 import pytest
 
+from pyp4 import PacketIO
 from pyp4.process import Process
 
 
@@ -35,3 +36,52 @@ def test_incorrect_name(program):
 def test_enums(process):
     # Currently, there are no test programs with enums.
     assert process.enums == {}
+
+
+def test_bus_pool(process):
+    assert process.packet_io == PacketIO.STACK
+
+    bus = process.bus()
+    bus.metadata["standard_metadata"]["ingress_port"].val = 3
+    bus.packet.add_header("act")
+    bus.packet["act"]["action_id"].val = 2
+
+    process.release(bus)
+    assert process.bus() is bus
+    assert bus.metadata["standard_metadata"]["ingress_port"].val == 0
+    assert bus.metadata["standard_metadata"].valid
+    assert bus.packet["act"]["action_id"].val == 0
+    assert bus.packet.validity == 0
+    assert process.bus() is not bus
+
+    # The pool is bounded.
+    buses = [process.bus() for _ in range(Process.BUS_POOL_SIZE + 1)]
+    for pooled in buses:
+        process.release(pooled)
+    reused = {id(process.bus()) for _ in range(Process.BUS_POOL_SIZE)}
+    assert reused == {id(pooled) for pooled in buses[1:]}
+
+
+def test_used_metadata(MockProcess, program):
+    program = copy.deepcopy(program)
+    program["headers"].append({
+        "name": "unused_meta",
+        "id": len(program["headers"]),
+        "header_type": "standard_metadata",
+        "metadata": True,
+        "pi_omit": True,
+    })
+
+    process = MockProcess(__name__, program)
+    assert process.used_metadata == ("scalars", "standard_metadata")
+    bus = process.bus()
+    assert "unused_meta" not in bus.metadata
+    assert not bus.metadata.created
+    assert bus.get_hdr("standard_metadata") is bus.metadata.created["standard_metadata"]
+
+    # The architecture may access metadata that the program does not use.
+    class ArchitectureProcess(MockProcess):
+        ARCHITECTURE_METADATA = ("unused_meta",)
+
+    process = ArchitectureProcess(__name__, program)
+    assert process.used_metadata == ("scalars", "standard_metadata", "unused_meta")
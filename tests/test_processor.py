@@ -7,7 +7,7 @@ from pyp4.processor import Processor
 
 class MockProcessor(Processor):
     def input(self, port_in_meta, packet_in):
-        pass
+        return [(port_in_meta, packet_in)] * port_in_meta
 
 
 @pytest.fixture(scope="module")
@@ -31,3 +31,9 @@ def test_process_load(processor, process):
     with pytest.raises(RuntimeError):
         assert processor.table("ingress", "MyIngress.operations")
     assert process.blocks["ingress"].tables["MyIngress.operations"]
+
+
+def test_input_batch(processor):
+    assert processor.input_batch([(1, "a"), (0, "b"), (2, "c")]) == [
+        [(1, "a")], [], [(2, "c"), (2, "c")],
+    ]
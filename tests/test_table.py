@@ -1,8 +1,11 @@
 """Unit tests for P4 tables."""
 
+import copy
+import random
+
 import pytest
 
-from pyp4.table import Conditional, _ApplyResult, _ActionRun
+from pyp4.table import Conditional, Table, _ApplyResult, _ActionRun
 from pyp4.processor import Processor
 
 
@@ -117,6 +120,185 @@ def test_next_table(ethernet_fib, ipv4_fib):
     ) == "tbl_process_ingress_ipv4_act_miss"
 
 
+def test_apply_batch(ethernet_fib, process):
+    ethernet_fib.insert_entry(
+        key=0x554433221100,
+        action_name="ProcessIngress.act_hit",
+        action_data=[0xae],
+    )
+
+    buses = []
+    for dst_addr in (0x554433221100, 0x001122334455, 0x554433221100):
+        bus = process.bus()
+        bus.packet.add_header("ethernet")
+        bus.packet["ethernet"]["dst_addr"].val = dst_addr
+        buses.append(bus)
+
+    key_columns = ethernet_fib.key_columns(buses)
+    assert key_columns == [[0x554433221100, 0x001122334455, 0x554433221100]]
+    result = ethernet_fib.apply_batch(key_columns)
+    assert result.hits == bytearray([1, 0, 1])
+    assert list(result.action_ids) == [
+        result.action_runs[index].action_id for index in result.action_data_indices
+    ]
+    assert result.action_runs[result.action_data_indices[0]].action_data == ["0xae"]
+    assert result.action_runs[-1].action_name == "ProcessIngress.act_miss"
+    assert result.apply_results() == [ethernet_fib.apply(bus) for bus in buses]
+
+    with pytest.raises(ValueError):
+        ethernet_fib.apply_batch([])
+
+
+def _random_buses(process, rng, count):
+    buses = []
+    for _ in range(count):
+        bus = process.bus()
+        bus.packet.add_header("ethernet")
+        bus.packet["ethernet"]["dst_addr"].val = rng.choice([0x001122334455, 0x665544332211])
+        bus.packet.add_header("ipv4")
+        bus.packet["ipv4"]["dst_addr"].val = rng.getrandbits(32) & 0x0f0f0f0f
+        bus.packet["ipv4"]["ttl"].val = rng.randrange(256)
+        buses.append(bus)
+    return buses
+
+
+def test_apply_batch_kernels(process, tables):
+    rng = random.Random(0)
+    ethernet_ipv4_fib = tables["ProcessIngress.process_ingress_ipv4.ethernet_ipv4_fib"]
+    ttl_tbl = tables["ProcessIngress.process_ingress_ipv4.ttl_tbl"]
+    for prefix_length in (0, 4, 8, 12, 16, 24, 32):
+        for dst_addr in (0x001122334455, 0x665544332211):
+            ethernet_ipv4_fib.insert_entry(
+                key=[dst_addr, (rng.getrandbits(32) & 0x0f0f0f0f & (
+                    ((1 << prefix_length) - 1) << (32 - prefix_length)), prefix_length)],
+                action_name="ProcessIngress.process_ingress_ipv4.act_hit",
+                action_data=[rng.randrange(512)],
+            )
+    for start in (0, 10, 20, 100, 200):
+        ttl_tbl.insert_entry(
+            key=(start, start + rng.randrange(80)),
+            action_name="ProcessIngress.process_ingress_ipv4.act_miss",
+            action_data=[],
+        )
+
+    buses = _random_buses(process, rng, 500)
+    for table in tables.values():
+        result = table.apply_batch(table.key_columns(buses), len(buses))
+        assert result.apply_results() == [table.apply(bus) for bus in buses]
+        if table in (ethernet_ipv4_fib, ttl_tbl):
+            assert any(result.hits)
+
+    # The index follows the entries.
+    handle = ttl_tbl.insert_entry(
+        key=(0, 255),
+        action_name="ProcessIngress.process_ingress_ipv4.act_miss",
+        action_data=[],
+    )
+    assert all(ttl_tbl.apply_batch(ttl_tbl.key_columns(buses)).hits)
+    ttl_tbl.remove_entry(handle)
+    assert not all(ttl_tbl.apply_batch(ttl_tbl.key_columns(buses)).hits)
+
+
+def test_ternary(program, process):
+    # The TTL table with a ternary key instead.
+    bm_table = copy.deepcopy(
+        next(tab for tab in program["pipelines"][0]["tables"] if tab["name"].endswith("ttl_tbl"))
+    )
+    bm_table["key"][0]["match_type"] = "ternary"
+    del bm_table["entries"]
+    action_id_to_name = {act["id"]: act["name"] for act in program["actions"]}
+    action_name_to_id = {act["name"]: act["id"] for act in program["actions"]}
+
+    table = Table(__name__, bm_table, action_id_to_name, action_name_to_id)
+    table.insert_entry(
+        key=(0x40, 0xf0),
+        action_name="ProcessIngress.process_ingress_ipv4.act_miss",
+        action_data=[],
+    )
+    with pytest.raises(ValueError):
+        table.insert_entry(
+            key=0x40,
+            action_name="ProcessIngress.process_ingress_ipv4.act_miss",
+            action_data=[],
+        )
+    # The bitwidth of the key is needed to index it, unlike for exact and range keys.
+    with pytest.raises(ValueError):
+        table.apply_batch([[0x40]])
+    bm_range_table = copy.deepcopy(bm_table)
+    bm_range_table["key"][0]["match_type"] = "range"
+    range_table = Table(__name__, bm_range_table, action_id_to_name, action_name_to_id)
+    assert range_table.apply_batch([[0x40]]).hits == bytearray([0])
+
+    table = Table(
+        __name__, bm_table, action_id_to_name, action_name_to_id, lambda header, field: 8,
+    )
+    for key in [(0x40, 0xf0), (0x01, 0x01), (0x80, 0x80)]:
+        table.insert_entry(
+            key=key,
+            action_name="ProcessIngress.process_ingress_ipv4.act_miss",
+            action_data=[],
+        )
+    buses = _random_buses(process, random.Random(1), 200)
+    result = table.apply_batch(table.key_columns(buses))
+    assert result.apply_results() == [table.apply(bus) for bus in buses]
+    assert set(result.action_data_indices) == {0, 1, 2, 3}
+
+
+@pytest.mark.parametrize("match_types", [
+    ("range", "range"), ("range", "lpm"), ("ternary", "range"), ("ternary", "ternary"),
+    ("exact", "ternary"), ("range", "exact"), ("exact", "exact"),
+    ("lpm", "lpm"),
+])
+def test_apply_batch_indices(program, process, match_types):
+    # A TTL and IPv4 destination table with each way of indexing the entries.
+    bm_table = copy.deepcopy(
+        next(tab for tab in program["pipelines"][0]["tables"] if tab["name"].endswith("ttl_tbl"))
+    )
+    bm_table["key"] = [
+        dict(bm_table["key"][0], match_type=match_type, target=target)
+        for match_type, target in zip(match_types, [["ipv4", "ttl"], ["ipv4", "dst_addr"]])
+    ]
+    del bm_table["entries"]
+    table = Table(
+        __name__,
+        bm_table,
+        {act["id"]: act["name"] for act in program["actions"]},
+        {act["name"]: act["id"] for act in program["actions"]},
+        lambda header, field: 8 if field == "ttl" else 32,
+    )
+
+    rng = random.Random(2)
+    buses = _random_buses(process, rng, 300)
+    # The entries are built around the keys of some of the packets so that exact keys hit.
+    keys = []
+    for bus in rng.sample(buses, 40):
+        key = []
+        for match_type, bitwidth, field in zip(match_types, (8, 32), ("ttl", "dst_addr")):
+            value = bus.packet["ipv4"][field].val
+            if match_type == "exact":
+                key.append(value)
+            elif match_type == "range":
+                end = min(value + rng.getrandbits(bitwidth // 2), (1 << bitwidth) - 1)
+                key.append((max(value - rng.getrandbits(bitwidth // 2), 0), end))
+            elif match_type == "lpm":
+                prefix_length = rng.randrange(bitwidth // 4, bitwidth // 2 + 1)
+                key.append((value & (((1 << prefix_length) - 1) << (bitwidth - prefix_length)),
+                            prefix_length))
+            else:
+                key.append((value, rng.getrandbits(bitwidth) & rng.getrandbits(bitwidth)))
+        if key not in keys:
+            keys.append(key)
+            table.insert_entry(
+                key=key, action_name="ProcessIngress.process_ingress_ipv4.act_miss",
+                action_data=[],
+            )
+    buses += _random_buses(process, rng, 300)
+
+    result = table.apply_batch(table.key_columns(buses))
+    assert result.apply_results() == [table.apply(bus) for bus in buses]
+    assert 0 < sum(result.hits) < len(buses)
+
+
 def test_exact_miss(ethernet_fib, bus):
     ethernet_fib.insert_entry(
         key=0x554433221100,
@@ -186,6 +368,27 @@ def test_remove_const_entry(ipv4_fib, bus):
     assert apply_result.action_run.action_name == "ProcessIngress.process_ingress_ipv4.act_hit"
 
 
+def test_entry_handle_reuse(ethernet_fib):
+    handles = [
+        ethernet_fib.insert_entry(key=key, action_name="ProcessIngress.act_hit", action_data=[0])
+        for key in range(4)
+    ]
+    ethernet_fib.remove_entry(handles[2])
+    ethernet_fib.remove_entry(handles[1])
+
+    # The lowest removed handle is reused first and const entry handles are never reused.
+    new_handles = [
+        ethernet_fib.insert_entry(key=key, action_name="ProcessIngress.act_hit", action_data=[0])
+        for key in range(4, 7)
+    ]
+    assert new_handles == [handles[1], handles[2], handles[3] + 1]
+
+    ethernet_fib.reset()
+    assert ethernet_fib.insert_entry(
+        key=0, action_name="ProcessIngress.act_hit", action_data=[0],
+    ) == handles[0]
+
+
 def test_lpm_miss(ipv4_fib, bus):
     ipv4_fib.insert_entry(
         key=(0x0b010200, 24),
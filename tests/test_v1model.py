@@ -1,9 +1,27 @@
 """Unit tests for V1Model processor features."""
 
+from concurrent.futures import ThreadPoolExecutor
+import json
+import random
+import sys
+import zlib
+
 import pytest
 
-from pyp4.packet import HeaderStack
-from pyp4.processors.v1model import V1ModelPortMeta
+from pyp4 import DeparseMode, PacketIO
+from pyp4.calculation import csum16
+from pyp4.packet import BinaryPacket, HeaderStack
+from pyp4.processors.v1model import (
+    Meter,
+    V1ModelInstanceType,
+    V1ModelMeterColor,
+    V1ModelPortMeta,
+    V1ModelPre,
+    V1ModelProcess,
+    V1ModelProcessor,
+    V1ModelRuntimeAbc,
+    Register,
+)
 
 from tests.mock_device import MockV1ModelDevice
 
@@ -35,6 +53,49 @@ def test_registers(process, device):
     header = ping.pop()
     assert header["count"].val == 6
 
+    register = device.processor.register("MyEgress.ping_count_reg")
+    assert len(register) == 8
+    assert register[:] == [6, 0, 0, 0, 0, 0, 0, 0]
+    with pytest.raises(ValueError):
+        device.processor.register("MyEgress.unknown_reg")
+
+
+@pytest.mark.parametrize("bitwidth", [9, 32, 48, 128])
+def test_register_storage(bitwidth):
+    register = Register({"name": "reg", "id": 0, "size": 6, "bitwidth": bitwidth})
+    assert register.name == "reg"
+    assert register.bitwidth == bitwidth
+    bytewidth = (bitwidth + 7) // 8
+
+    # Cells read as zero before the storage is allocated.
+    assert register[5] == 0
+    assert register[-1] == 0
+    assert register[1:3] == [0, 0]
+    assert register.to_bytes() == bytes(6 * bytewidth)
+    with pytest.raises(IndexError):
+        register[6]
+
+    # Writes are truncated to the bitwidth.
+    register[1] = -1
+    register[-1] = 0x1234
+    assert register[1] == (1 << bitwidth) - 1
+    assert register[5] == 0x1234 & ((1 << bitwidth) - 1)
+    register[2:5] = [1, 2, 3]
+    register[1] = 0
+    assert register[:] == [0, 0, 1, 2, 3, register[5]]
+    assert register[::2] == [0, 1, 3]
+    with pytest.raises(ValueError):
+        register[0:2] = [1]
+    with pytest.raises(IndexError):
+        register[6] = 1
+
+    assert register.to_bytes() == b"".join(
+        value.to_bytes(bytewidth, "big") for value in register[:]
+    )
+
+    register.reset()
+    assert register[:] == [0] * 6
+
 
 def test_ingress_tables(process, device):
     device.processor.table("ingress", "MyIngress.tbl_ping").insert_entry(
@@ -113,3 +174,832 @@ def test_missing_metadata(process, device):
             V1ModelPortMeta(standard_metadata={"egress_port": 5}),
             HeaderStack(),
         )
+
+
+class FixedTimeRuntime(V1ModelRuntimeAbc):
+    def time(self):
+        return 0
+
+
+class CountingRuntime(V1ModelRuntimeAbc):
+    def __init__(self):
+        self.calls = 0
+
+    def time(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_input_batch():
+    with open("tests/p4/complex.json") as program_file:
+        program_complex = json.load(program_file)
+    process = V1ModelProcess("batch", program_complex, PacketIO.BINARY)
+    runtime = CountingRuntime()
+    processor = V1ModelProcessor(runtime).load(process)
+
+    # Routed to ports 3 and 4 by the constant entries of the IPv4 FIB and dropped.
+    port_3 = bytes.fromhex("001122334455" "0800" "0a010203" "40") + b"port 3"
+    port_4 = bytes.fromhex("001122334455" "0800" "0a000001" "40") + b"port 4"
+    drop = bytes.fromhex("001122334455" "0800" "0b000001" "40") + b"drop"
+    binaries = [port_3, drop, port_4]
+
+    def packets_in():
+        for ingress_port, binary in enumerate(binaries):
+            yield V1ModelPortMeta(standard_metadata={"ingress_port": ingress_port}), binary
+
+    def outputs(packets_out):
+        return [[(meta.standard_metadata["ingress_port"], meta.standard_metadata["egress_port"],
+                  bytes(packet_out)) for meta, packet_out in packet] for packet in packets_out]
+
+    # The outputs of each input packet are at the index of the input packet.
+    serial = [processor.input(meta, BinaryPacket(binary)) for meta, binary in packets_in()]
+    assert runtime.calls == 5
+    runtime.calls = 0
+    batch = processor.input_batch(
+        (meta, BinaryPacket(binary)) for meta, binary in packets_in()
+    )
+    assert outputs(batch) == outputs(serial) == [[(0, 3, port_3)], [], [(2, 4, port_4)]]
+    assert runtime.calls == 5
+
+    # A single timestamp for the whole batch.
+    runtime.calls = 0
+    batch = processor.input_batch(
+        ((meta, BinaryPacket(binary)) for meta, binary in packets_in()), batch_timestamp=True,
+    )
+    assert outputs(batch) == outputs(serial)
+    assert runtime.calls == 1
+    timestamps = {
+        meta.standard_metadata[name]
+        for meta, _ in batch[0] + batch[2]
+        for name in ("ingress_global_timestamp", "egress_global_timestamp")
+    }
+    assert timestamps == {1}
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_input_batch_stage_major(packet_io):
+    with open("tests/p4/complex.json") as program_file:
+        program_complex = json.load(program_file)
+    process = V1ModelProcess("stage_major", program_complex, packet_io)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    processor.table("ingress", "ProcessIngress.ethernet_fib").insert_entry(
+        key=0x001122334455,
+        action_name="ProcessIngress.act_hit",
+        action_data=[0x07],
+    )
+    ethernet_ipv4_fib = "ProcessIngress.process_ingress_ipv4.ethernet_ipv4_fib"
+    processor.table("ingress", ethernet_ipv4_fib).insert_entry(
+        key=[0x665544332211, (0x0a020000, 16)],
+        action_name="ProcessIngress.process_ingress_ipv4.act_hit",
+        action_data=[0x05],
+    )
+
+    rng = random.Random(0)
+    packets = []
+    for ingress_port in range(200):
+        ethernet = process.header("ethernet")
+        ethernet["dst_addr"].val = rng.choice([0x001122334455, 0x665544332211])
+        ethernet["ethertype"].val = rng.choice([0x0800, 0x0800, 0x86dd])
+        ipv4 = process.header("ipv4")
+        ipv4["dst_addr"].val = rng.choice([0x0a010203, 0x0a020304, 0x0b000001])
+        ipv4["ttl"].val = rng.choice([64, 120])
+        packets.append((ingress_port, ethernet, ipv4))
+
+    def packets_in():
+        for ingress_port, ethernet, ipv4 in packets:
+            if packet_io == PacketIO.BINARY:
+                packet_in = BinaryPacket(
+                    bytes(ethernet.to_bytes() + ipv4.to_bytes()) + bytes([ingress_port]),
+                )
+            else:
+                packet_in = HeaderStack(bytes([ingress_port]))
+                if ethernet["ethertype"].val == 0x0800:
+                    packet_in.push(ipv4.copy())
+                packet_in.push(ethernet.copy())
+            yield V1ModelPortMeta(standard_metadata={"ingress_port": ingress_port}), packet_in
+
+    def outputs(packets_out):
+        return [
+            [(meta.standard_metadata, repr(packet_out)) for meta, packet_out in packet]
+            for packet in packets_out
+        ]
+
+    serial = outputs(processor.input_batch(packets_in()))
+    stage_major = outputs(processor.input_batch(packets_in(), stage_major=True))
+    assert stage_major == serial
+    assert {meta["egress_port"] for packet in serial for meta, _ in packet} == {3, 5}
+    assert not all(serial)
+
+
+@pytest.mark.parametrize("deparse_mode", [DeparseMode.COPY, DeparseMode.HEADROOM])
+def test_threads(deparse_mode):
+    with open("tests/p4/complex.json") as program_file:
+        program_complex = json.load(program_file)
+    process = V1ModelProcess("threads", program_complex, PacketIO.BINARY, deparse_mode)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    processor.table("ingress", "ProcessIngress.ethernet_fib").insert_entry(
+        key=0x001122334455,
+        action_name="ProcessIngress.act_hit",
+        action_data=[0x07],
+    )
+
+    rng = random.Random(0)
+    binaries = []
+    for _ in range(400):
+        ethernet = process.header("ethernet")
+        ethernet["dst_addr"].val = rng.choice([0x001122334455, 0x665544332211])
+        ethernet["ethertype"].val = rng.choice([0x0800, 0x0800, 0x86dd])
+        ipv4 = process.header("ipv4")
+        ipv4["dst_addr"].val = rng.choice([0x0a010203, 0x0a020304, 0x0b000001])
+        ipv4["ttl"].val = rng.randrange(256)
+        payload = bytes(rng.randrange(256) for _ in range(rng.randrange(8)))
+        binaries.append(bytes(ethernet.to_bytes() + ipv4.to_bytes()) + payload)
+
+    def run(binary):
+        packet_in = BinaryPacket(binary, headroom=16)
+        return [
+            (port_meta.standard_metadata["egress_port"], bytes(packet_out))
+            for port_meta, packet_out in processor.input(
+                V1ModelPortMeta(standard_metadata={"ingress_port": 1}), packet_in,
+            )
+        ]
+
+    serial = [run(binary) for binary in binaries]
+    assert any(serial) and not all(serial)
+
+    # Switch threads as often as possible to maximise the interleaving.
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            threaded = list(executor.map(run, binaries))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert threaded == serial
+
+
+def test_pre():
+    pre = V1ModelPre()
+    with pytest.raises(ValueError):
+        pre.mc_mgrp_create(0)
+    mgrp = pre.mc_mgrp_create(1)
+    with pytest.raises(ValueError):
+        pre.mc_mgrp_create(1)
+
+    node_1 = pre.mc_node_create(10, [3, 1, 2])
+    node_2 = pre.mc_node_create(20, [4])
+    pre.mc_node_associate(mgrp, node_1)
+    pre.mc_node_associate(mgrp, node_2)
+    with pytest.raises(ValueError):
+        pre.mc_node_associate(mgrp, node_2)
+    assert pre.replicas(1) == ((1, 10), (2, 10), (3, 10), (4, 20))
+    assert pre.replicas(2) == ()
+
+    pre.mc_node_update(node_1, [5])
+    assert pre.replicas(1) == ((5, 10), (4, 20))
+    pre.mc_node_dissociate(mgrp, node_1)
+    assert pre.replicas(1) == ((4, 20),)
+    with pytest.raises(ValueError):
+        pre.mc_node_dissociate(mgrp, node_1)
+
+    pre.mc_node_associate(mgrp, node_1)
+    pre.mc_node_destroy(node_2)
+    assert pre.replicas(1) == ((5, 10),)
+    with pytest.raises(ValueError):
+        pre.mc_node_update(node_2, [1])
+
+    pre.mc_mgrp_destroy(mgrp)
+    assert pre.replicas(1) == ()
+    with pytest.raises(ValueError):
+        pre.mc_mgrp_destroy(mgrp)
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_multicast(packet_io):
+    with open("tests/p4/complex.json") as program_file:
+        program_complex = json.load(program_file)
+    # The IPv4 FIB sets the multicast group instead of the egress port.
+    action = next(act for act in program_complex["actions"] if act["id"] == 6)
+    action["primitives"][0]["parameters"][0]["value"] = ["standard_metadata", "mcast_grp"]
+    process = V1ModelProcess("multicast", program_complex, packet_io)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+
+    # Group 3 broadcasts to 64 ports and group 4 has no nodes.
+    mgrp = processor.pre.mc_mgrp_create(3)
+    processor.pre.mc_node_associate(mgrp, processor.pre.mc_node_create(1, range(32)))
+    processor.pre.mc_node_associate(mgrp, processor.pre.mc_node_create(2, range(32, 64)))
+    processor.pre.mc_mgrp_create(4)
+
+    ethernet = process.header("ethernet")
+    ethernet["ethertype"].val = 0x0800
+    ipv4 = process.header("ipv4")
+    ipv4["ttl"].val = 64
+
+    def packet_in(dst_addr):
+        ipv4["dst_addr"].val = dst_addr
+        if packet_io == PacketIO.BINARY:
+            return BinaryPacket(bytes(ethernet.to_bytes() + ipv4.to_bytes()) + b"payload")
+        packet = HeaderStack(b"payload")
+        packet.push(ipv4.copy())
+        packet.push(ethernet.copy())
+        return packet
+
+    packets_out = processor.input(V1ModelPortMeta({"ingress_port": 1}), packet_in(0x0a010203))
+    assert len(packets_out) == 64
+    for port, (meta, packet_out) in enumerate(packets_out):
+        assert meta.standard_metadata["egress_port"] == port
+        assert meta.standard_metadata["egress_rid"] == (1 if port < 32 else 2)
+        assert meta.standard_metadata["instance_type"] == V1ModelInstanceType.REPLICATION
+        assert meta.standard_metadata["mcast_grp"] == 3
+        if packet_io == PacketIO.BINARY:
+            assert bytes(packet_out) == bytes(packet_in(0x0a010203))
+        else:
+            assert packet_out.payload == b"payload"
+            assert len(packet_out) == 2
+
+    # The replicas do not share headers.
+    if packet_io == PacketIO.STACK:
+        headers = [packet_out.pop() for _, packet_out in packets_out]
+        assert len({id(header) for header in headers}) == 64
+
+    assert not processor.input(V1ModelPortMeta({"ingress_port": 1}), packet_in(0x0a000001))
+
+
+def _program_with_hooks(ingress=(), egress=()):
+    """The complex program with a field list preserving ``standard_metadata.priority`` and a table
+    at the start of ingress and egress which runs the given primitives for the instance types that
+    have an entry."""
+    with open("tests/p4/complex.json") as program_file:
+        program = json.load(program_file)
+    program["field_lists"] = [{
+        "id": 1,
+        "name": "fl",
+        "elements": [{"type": "field", "value": ["standard_metadata", "priority"]}],
+    }]
+    for pipeline, primitives in (("ingress", ingress), ("egress", egress)):
+        action_id = len(program["actions"])
+        action_name = f"{pipeline}_hook"
+        program["actions"].append({
+            "name": action_name, "id": action_id, "runtime_data": [],
+            "primitives": [{"op": op, "parameters": params} for op, params in primitives],
+        })
+        block = next(block for block in program["pipelines"] if block["name"] == pipeline)
+        next_table = block["init_table"]
+        block["tables"].append({
+            "name": f"tbl_{action_name}",
+            "id": 100 + action_id,
+            "key": [{
+                "match_type": "exact",
+                "name": "standard_metadata.instance_type",
+                "target": ["standard_metadata", "instance_type"],
+                "mask": None,
+            }],
+            "match_type": "exact",
+            "type": "simple",
+            "max_size": 8,
+            "with_counters": False,
+            "support_timeout": False,
+            "direct_meters": None,
+            "action_ids": [0, action_id],
+            "actions": ["NoAction", action_name],
+            "base_default_next": next_table,
+            "next_tables": {"NoAction": next_table, action_name: next_table},
+            "default_entry": {
+                "action_id": 0, "action_const": False, "action_data": [],
+                "action_entry_const": False,
+            },
+        })
+        block["init_table"] = f"tbl_{action_name}"
+    return program
+
+
+def _hexstr(value):
+    return {"type": "hexstr", "value": hex(value)}
+
+
+def _field(header_name, field_name):
+    return {"type": "field", "value": [header_name, field_name]}
+
+
+def _hook(processor, pipeline, *instance_types):
+    for instance_type in instance_types:
+        processor.table(pipeline, f"tbl_{pipeline}_hook").insert_entry(
+            key=instance_type.value, action_name=f"{pipeline}_hook", action_data=[],
+        )
+
+
+def _packet_in(process, packet_io, **ipv4_fields):
+    """An IPv4 packet routed to port 3."""
+    ethernet = process.header("ethernet")
+    ethernet["dst_addr"].val = 0x001122334455
+    ethernet["ethertype"].val = 0x0800
+    ipv4 = process.header("ipv4")
+    ipv4["dst_addr"].val = 0x0a010203
+    ipv4["ttl"].val = 64
+    for field_name, value in ipv4_fields.items():
+        ipv4[field_name].val = value
+    if packet_io == PacketIO.BINARY:
+        return BinaryPacket(bytes(ethernet.to_bytes() + ipv4.to_bytes()) + b"payload")
+    packet = HeaderStack(b"payload")
+    packet.push(ipv4)
+    packet.push(ethernet)
+    return packet
+
+
+def _dst_addr(packet_out):
+    if isinstance(packet_out, BinaryPacket):
+        return int.from_bytes(bytes(packet_out)[:6], "big")
+    return packet_out.copy().pop()["dst_addr"].val
+
+
+def _outputs(packets_out):
+    return [
+        (meta.standard_metadata["egress_port"], meta.standard_metadata["instance_type"],
+         meta.standard_metadata["priority"], meta.standard_metadata["egress_rid"],
+         _dst_addr(packet_out))
+        for meta, packet_out in packets_out
+    ]
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_clone_ingress(packet_io):
+    program = _program_with_hooks(ingress=[
+        ("assign", [_field("standard_metadata", "priority"), _hexstr(5)]),
+        ("assign", [_field("ethernet", "dst_addr"), _hexstr(0xaaaaaaaaaaaa)]),
+        ("clone_ingress_pkt_to_egress", [_hexstr(7), _hexstr(1)]),
+    ])
+    process = V1ModelProcess("clone", program, packet_io)
+    assert process.needs_original_packet
+    assert process.field_list(1) == (("standard_metadata", "priority"),)
+    assert process.field_list(0) == ()
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "ingress", V1ModelInstanceType.NORMAL)
+    port_in_meta = V1ModelPortMeta({"ingress_port": 1})
+
+    # Without a session there is no clone.
+    assert _outputs(processor.input(port_in_meta, _packet_in(process, packet_io))) == [
+        (3, V1ModelInstanceType.NORMAL, 5, 0, 0xaaaaaaaaaaaa),
+    ]
+
+    # The clone is the input packet with the preserved priority.
+    processor.pre.mirroring_add(7, 9)
+    assert _outputs(processor.input(port_in_meta, _packet_in(process, packet_io))) == [
+        (9, V1ModelInstanceType.INGRESS_CLONE, 5, 0, 0x001122334455),
+        (3, V1ModelInstanceType.NORMAL, 5, 0, 0xaaaaaaaaaaaa),
+    ]
+
+    # A session to a multicast group.
+    mgrp = processor.pre.mc_mgrp_create(2)
+    processor.pre.mc_node_associate(mgrp, processor.pre.mc_node_create(4, [10, 11]))
+    processor.pre.mirroring_add_mc(7, mgrp)
+    assert [
+        output[:4] for output in processor.input(port_in_meta, _packet_in(process, packet_io))
+        for output in _outputs([output])
+    ] == [
+        (10, V1ModelInstanceType.INGRESS_CLONE, 5, 4),
+        (11, V1ModelInstanceType.INGRESS_CLONE, 5, 4),
+        (3, V1ModelInstanceType.NORMAL, 5, 0),
+    ]
+
+    processor.pre.mirroring_delete(7)
+    assert len(processor.input(port_in_meta, _packet_in(process, packet_io))) == 1
+    with pytest.raises(ValueError):
+        processor.pre.mirroring_delete(7)
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_resubmit(packet_io):
+    program = _program_with_hooks(ingress=[
+        ("assign", [_field("standard_metadata", "priority"), _hexstr(5)]),
+        ("assign", [_field("standard_metadata", "egress_rid"), _hexstr(5)]),
+        ("assign", [_field("ethernet", "dst_addr"), _hexstr(0xaaaaaaaaaaaa)]),
+        ("resubmit", [_hexstr(1)]),
+    ])
+    process = V1ModelProcess("resubmit", program, packet_io)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "ingress", V1ModelInstanceType.NORMAL)
+    port_in_meta = V1ModelPortMeta({"ingress_port": 1})
+
+    # The input packet is resubmitted with the priority but not the rid.
+    (meta, packet_out), = processor.input(port_in_meta, _packet_in(process, packet_io))
+    assert _outputs([(meta, packet_out)]) == [
+        (3, V1ModelInstanceType.RESUBMIT, 5, 0, 0x001122334455),
+    ]
+    assert meta.standard_metadata["ingress_port"] == 1
+
+    # A packet resubmitted over and over is dropped.
+    _hook(processor, "ingress", V1ModelInstanceType.RESUBMIT)
+    assert not processor.input(port_in_meta, _packet_in(process, packet_io))
+
+    with pytest.raises(ValueError):
+        V1ModelProcessor(FixedTimeRuntime(), loop_limit=-1)
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_recirculate(packet_io):
+    program = _program_with_hooks(egress=[
+        ("assign", [_field("standard_metadata", "priority"), _hexstr(3)]),
+        ("assign", [_field("ethernet", "dst_addr"), _hexstr(0xaaaaaaaaaaaa)]),
+        ("recirculate", [_hexstr(1)]),
+    ])
+    process = V1ModelProcess("recirculate", program, packet_io)
+    assert not process.needs_original_packet
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "egress", V1ModelInstanceType.NORMAL)
+    port_in_meta = V1ModelPortMeta({"ingress_port": 1})
+
+    # The deparsed packet is recirculated with the priority.
+    assert _outputs(processor.input(port_in_meta, _packet_in(process, packet_io))) == [
+        (3, V1ModelInstanceType.RECIRC, 3, 0, 0xaaaaaaaaaaaa),
+    ]
+
+    _hook(processor, "egress", V1ModelInstanceType.RECIRC)
+    assert not processor.input(port_in_meta, _packet_in(process, packet_io))
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_clone_egress(packet_io):
+    program = _program_with_hooks(egress=[
+        ("assign", [_field("standard_metadata", "priority"), _hexstr(2)]),
+        ("clone_egress_pkt_to_egress", [_hexstr(7), _hexstr(1)]),
+        ("assign", [_field("ethernet", "dst_addr"), _hexstr(0xaaaaaaaaaaaa)]),
+    ])
+    process = V1ModelProcess("clone", program, packet_io)
+    processor = V1ModelProcessor(FixedTimeRuntime(), loop_limit=2).load(process)
+    assert processor.loop_limit == 2
+    processor.pre.mirroring_add(7, 9)
+    _hook(processor, "egress", V1ModelInstanceType.NORMAL)
+    port_in_meta = V1ModelPortMeta({"ingress_port": 1})
+
+    # The clone is a copy of the packet at the end of egress which goes through egress again.
+    assert _outputs(processor.input(port_in_meta, _packet_in(process, packet_io))) == [
+        (3, V1ModelInstanceType.NORMAL, 2, 0, 0xaaaaaaaaaaaa),
+        (9, V1ModelInstanceType.EGRESS_CLONE, 2, 0, 0xaaaaaaaaaaaa),
+    ]
+
+    # Clones of clones are bounded by the loop limit.
+    _hook(processor, "egress", V1ModelInstanceType.EGRESS_CLONE)
+    assert [
+        output[:2] for output in _outputs(
+            processor.input(port_in_meta, _packet_in(process, packet_io)))
+    ] == [(3, 0), (9, 2), (9, 2)]
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+def test_loops_stage_major(packet_io):
+    program = _program_with_hooks(
+        ingress=[
+            ("clone_ingress_pkt_to_egress", [_hexstr(7), _hexstr(0)]),
+            ("resubmit", [_hexstr(0)]),
+        ],
+        egress=[("recirculate", [_hexstr(0)])],
+    )
+    process = V1ModelProcess("loops", program, packet_io)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    processor.pre.mirroring_add(7, 9)
+    _hook(processor, "ingress", V1ModelInstanceType.NORMAL)
+    _hook(processor, "egress", V1ModelInstanceType.RESUBMIT, V1ModelInstanceType.INGRESS_CLONE)
+
+    def packets_in():
+        return [
+            (V1ModelPortMeta({"ingress_port": port}), _packet_in(process, packet_io))
+            for port in range(8)
+        ]
+
+    serial = [_outputs(packets_out) for packets_out in processor.input_batch(packets_in())]
+    # Both the resubmitted packet and the clone are recirculated and then routed to port 3.
+    assert serial[0] == [(3, V1ModelInstanceType.RECIRC, 0, 0, 0x001122334455)] * 2
+    stage_major = processor.input_batch(packets_in(), stage_major=True)
+    assert [_outputs(packets_out) for packets_out in stage_major] == serial
+
+
+def _program_with_direct_resources(ingress=()):
+    """The hooked complex program with a counter and a meter and with a direct counter and a direct
+    meter on the IPv4 FIB. The entry for 10.1/16 has handle 0."""
+    program = _program_with_hooks(ingress=ingress)
+    ipv4_fib = "ProcessIngress.process_ingress_ipv4.ipv4_fib"
+    table = next(
+        table for table in program["pipelines"][0]["tables"] if table["name"] == ipv4_fib
+    )
+    table["with_counters"] = True
+    table["direct_meters"] = "direct_meter"
+    program["counter_arrays"] = [
+        {"name": "counter", "id": 0, "is_direct": False, "size": 4},
+        {"name": "direct_counter", "id": 1, "is_direct": True, "binding": ipv4_fib},
+    ]
+    program["meter_arrays"] = [
+        {"name": "meter", "id": 0, "is_direct": False, "size": 1, "rate_count": 2,
+         "type": "packets"},
+        {"name": "direct_meter", "id": 1, "is_direct": True, "binding": ipv4_fib,
+         "rate_count": 2, "type": "bytes", "result_target": ["standard_metadata", "priority"]},
+    ]
+    return program
+
+
+@pytest.mark.parametrize("stage_major", [False, True])
+def test_counters(stage_major):
+    program = _program_with_direct_resources(ingress=[
+        ("count", [{"type": "counter_array", "value": "counter"},
+                   _field("standard_metadata", "ingress_port")]),
+    ])
+    process = V1ModelProcess("counters", program, PacketIO.BINARY)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "ingress", V1ModelInstanceType.NORMAL)
+    length = len(_packet_in(process, PacketIO.BINARY))
+
+    def packets_in(ingress_port, count):
+        return [
+            (V1ModelPortMeta({"ingress_port": ingress_port}), _packet_in(process, PacketIO.BINARY))
+            for _ in range(count)
+        ]
+
+    processor.input_batch(packets_in(1, 3) + packets_in(2, 1), stage_major=stage_major)
+    counter = processor.counter("counter")
+    assert len(counter) == 4
+    assert counter[1] == (3, 3 * length)
+    assert counter[0:3] == [(0, 0), (3, 3 * length), (1, length)]
+    assert list(counter.packet_counts) == [0, 3, 1, 0]
+    assert list(counter.byte_counts) == [0, 3 * length, length, 0]
+    with pytest.raises(IndexError):
+        processor.input(*packets_in(4, 1)[0])
+
+    # The direct counter counts the hits of each entry.
+    direct_counter = processor.counter("direct_counter")
+    assert direct_counter.name == "direct_counter"
+    assert direct_counter.binding == "ProcessIngress.process_ingress_ipv4.ipv4_fib"
+    assert direct_counter[0] == (4, 4 * length)
+    assert direct_counter[100] == (0, 0)
+    # Tables without direct resources are ignored.
+    process.extern.table_hit("ProcessIngress.ethernet_fib", 0, process.bus())
+
+    counter.reset()
+    assert counter[:] == [(0, 0)] * 4
+    with pytest.raises(ValueError):
+        processor.counter("unknown")
+
+
+def test_direct_resources_reset():
+    process = V1ModelProcess("direct", _program_with_direct_resources(), PacketIO.BINARY)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    ipv4_fib = processor.table("ingress", "ProcessIngress.process_ingress_ipv4.ipv4_fib")
+    direct_counter = processor.counter("direct_counter")
+    direct_meter = processor.meter("direct_meter")
+    length = len(_packet_in(process, PacketIO.BINARY))
+
+    def packet_in(dst_addr):
+        return _packet_in(process, PacketIO.BINARY, dst_addr=dst_addr)
+
+    def insert_and_hit():
+        handle = ipv4_fib.insert_entry(
+            key=(0x0b010200, 24), action_name="ProcessIngress.process_ingress_ipv4.act_hit",
+            action_data=[3],
+        )
+        direct_meter.set_rates(handle, [(0.0, 1), (0.0, 1)])
+        processor.input(V1ModelPortMeta({"ingress_port": 1}), packet_in(0x0b010203))
+        assert direct_counter[handle] == (1, length)
+        return handle
+
+    # An entry inserted in place of a removed one does not inherit its counts and meter rates and
+    # the direct cells do not grow with the inserts.
+    handle = insert_and_hit()
+    assert handle == 2
+    for _ in range(100):
+        ipv4_fib.remove_entry(handle)
+        assert ipv4_fib.insert_entry(
+            key=(0x0b010200, 24), action_name="ProcessIngress.process_ingress_ipv4.act_hit",
+            action_data=[3],
+        ) == handle
+        assert direct_counter[handle] == (0, 0)
+        assert direct_meter.get_rates(handle) is None
+        ipv4_fib.remove_entry(handle)
+        assert insert_and_hit() == handle
+    assert len(direct_counter) <= 4
+    assert len(direct_meter) <= 4
+
+    # A table reset clears the cells of all entries, including those of the const entries.
+    processor.input(V1ModelPortMeta({"ingress_port": 1}), packet_in(0x0a020304))
+    assert direct_counter[1] == (1, length)
+    ipv4_fib.reset()
+    assert direct_counter[:] == [(0, 0)] * len(direct_counter)
+    assert direct_meter.get_rates(handle) is None
+    assert insert_and_hit() == handle
+    # Tables without direct resources are ignored.
+    process.extern.table_reset("ProcessIngress.ethernet_fib")
+
+
+def test_meters():
+    program = _program_with_direct_resources(ingress=[
+        ("execute_meter", [{"type": "meter_array", "value": "meter"}, _hexstr(0),
+                           _field("standard_metadata", "egress_rid")]),
+    ])
+    process = V1ModelProcess("meters", program, PacketIO.BINARY)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "ingress", V1ModelInstanceType.NORMAL)
+    length = len(_packet_in(process, PacketIO.BINARY))
+
+    # One packet per committed burst, two per peak burst and one byte per direct meter burst.
+    processor.meter("meter").set_rates(0, [(0.0, 1), (0.0, 2)])
+    processor.meter("direct_meter").set_rates(0, [(0.0, length), (0.0, length)])
+    colors = [
+        (meta.standard_metadata["egress_rid"], meta.standard_metadata["priority"])
+        for _ in range(3)
+        for meta, _ in processor.input(
+            V1ModelPortMeta({"ingress_port": 1}), _packet_in(process, PacketIO.BINARY),
+        )
+    ]
+    assert colors == [
+        (V1ModelMeterColor.GREEN, V1ModelMeterColor.GREEN),
+        (V1ModelMeterColor.YELLOW, V1ModelMeterColor.RED),
+        (V1ModelMeterColor.RED, V1ModelMeterColor.RED),
+    ]
+    assert processor.meter("direct_meter").binding is not None
+    with pytest.raises(ValueError):
+        processor.meter("unknown")
+
+
+def test_meter_buckets():
+    meter = Meter({"name": "meter", "id": 0, "is_direct": False, "size": 2, "type": "bytes"})
+    assert meter.name == "meter"
+    assert meter.binding is None
+    assert len(meter) == 2
+
+    # A meter without rates marks all packets green.
+    assert meter.get_rates(0) is None
+    assert meter.execute(0, 1000, 0) == V1ModelMeterColor.GREEN
+
+    # 1 byte/us committed with a burst of 100 bytes and 2 bytes/us peak with a burst of 200 bytes.
+    meter.set_rates(0, [(1.0, 100), (2.0, 200)])
+    assert meter.get_rates(0) == [(1.0, 100), (2.0, 200)]
+    assert [meter.execute(0, 60, 0) for _ in range(4)] == [
+        V1ModelMeterColor.GREEN, V1ModelMeterColor.YELLOW, V1ModelMeterColor.YELLOW,
+        V1ModelMeterColor.RED,
+    ]
+    # The buckets refill at their rates: 50 committed and 100 peak bytes in 50 us.
+    assert meter.execute(0, 50, 50) == V1ModelMeterColor.GREEN
+    assert meter.execute(0, 50, 50) == V1ModelMeterColor.YELLOW
+    # A clock that goes backwards does not refill the buckets.
+    assert meter.execute(0, 30, 40) == V1ModelMeterColor.RED
+    # The buckets do not exceed their burst sizes.
+    assert meter.execute(0, 101, 10_000) == V1ModelMeterColor.YELLOW
+
+    meter.set_all_rates([(1.0, 100), (1.0, 100)])
+    assert meter.get_rates(1) == [(1.0, 100), (1.0, 100)]
+    meter.reset_rates()
+    assert meter.get_rates(1) is None
+
+    with pytest.raises(ValueError):
+        meter.set_rates(0, [(2.0, 100), (1.0, 100)])
+    with pytest.raises(ValueError):
+        meter.set_rates(0, [(1.0, 100)])
+    with pytest.raises(IndexError):
+        meter.execute(2, 1, 0)
+
+    # Direct meters grow with the entry handles.
+    direct_meter = Meter({
+        "name": "direct_meter", "id": 1, "is_direct": True, "binding": "table",
+        "type": "packets", "result_target": ["meta", "color"],
+    })
+    assert direct_meter.binding == "table"
+    assert direct_meter.get_rates(5) is None
+    direct_meter.set_rates(5, [(0.0, 1), (0.0, 1)])
+    assert len(direct_meter) >= 6
+    assert [direct_meter.execute(5, 1, 0) for _ in range(2)] == [
+        V1ModelMeterColor.GREEN, V1ModelMeterColor.RED,
+    ]
+
+
+@pytest.mark.parametrize("stage_major", [False, True])
+def test_hash(stage_major):
+    def calculation(value):
+        return {"type": "calculation", "value": value}
+
+    program = _program_with_hooks(ingress=[
+        ("modify_field_with_hash_based_offset", [
+            _field("ethernet", "dst_addr"), _hexstr(0x100), calculation("calc_crc32"),
+            _hexstr(0x10000),
+        ]),
+        # The result is truncated to the 3-bit priority.
+        ("modify_field_with_hash_based_offset", [
+            _field("standard_metadata", "priority"), _hexstr(6), calculation("calc_crc16"),
+            _hexstr(4),
+        ]),
+    ])
+    program["calculations"] = [
+        {
+            "name": name,
+            "id": index,
+            "algo": algo,
+            "input": [_field("ipv4", "dst_addr"), _field("ipv4", "ttl")],
+        }
+        for index, (name, algo) in enumerate((("calc_crc32", "crc32"), ("calc_crc16", "crc16")))
+    ]
+    process = V1ModelProcess("hash", program, PacketIO.BINARY)
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "ingress", V1ModelInstanceType.NORMAL)
+    port_in_meta = V1ModelPortMeta({"ingress_port": 1})
+
+    packets_in = [_packet_in(process, PacketIO.BINARY) for _ in range(2)]
+    if stage_major:
+        packets_out = [output for outputs in processor.input_batch(
+            [(port_in_meta, packet) for packet in packets_in], stage_major=True,
+        ) for output in outputs]
+    else:
+        packets_out = [output for packet in packets_in for output in processor.input(
+            port_in_meta, packet,
+        )]
+
+    data = bytes.fromhex("0a01020340")
+    crc16 = process.extern.calculations["calc_crc16"].algorithm(data)
+    assert crc16 == 0x3d39
+    assert _outputs(packets_out) == 2 * [
+        (3, V1ModelInstanceType.NORMAL, (6 + crc16 % 4) & 0x7, 0,
+         0x100 + zlib.crc32(data) % 0x10000),
+    ]
+
+
+def _program_with_checksum():
+    """The complex program with an IPv4 header checksum that is verified and updated and with the
+    TTL decremented in egress."""
+    ttl = _field("ipv4", "ttl")
+    program = _program_with_hooks(egress=[("assign", [ttl, {
+        "type": "expression",
+        "value": {
+            "op": "&",
+            "left": {
+                "type": "expression",
+                "value": {"op": "+", "left": ttl, "right": _hexstr(0xff)},
+            },
+            "right": _hexstr(0xff),
+        },
+    }])])
+    ipv4_t = next(hdr_t for hdr_t in program["header_types"] if hdr_t["name"] == "ipv4_header_t")
+    ipv4_t["fields"].append(["checksum", 16, False])
+    program["calculations"] = [
+        {
+            "name": name,
+            "id": index,
+            "algo": "csum16",
+            "input": [_field("ipv4", "dst_addr"), _field("ipv4", "ttl")],
+        }
+        for index, name in enumerate(("calc_verify", "calc_update"))
+    ]
+    is_valid = {
+        "type": "expression",
+        "value": {"op": "d2b", "left": None, "right": _field("ipv4", "$valid$")},
+    }
+    program["checksums"] = [
+        {
+            "name": f"cksum_{operation}",
+            "id": index,
+            "target": ["ipv4", "checksum"],
+            "type": "generic",
+            "calculation": f"calc_{operation}",
+            "verify": operation == "verify",
+            "update": operation == "update",
+            "if_cond": is_valid,
+        }
+        for index, operation in enumerate(("verify", "update"))
+    ]
+    return program
+
+
+def _ipv4_checksum(ttl):
+    return csum16(bytes([10, 1, 2, 3, ttl]))
+
+
+@pytest.mark.parametrize("packet_io", [PacketIO.BINARY, PacketIO.STACK])
+@pytest.mark.parametrize("stage_major", [False, True])
+def test_checksums(packet_io, stage_major):
+    process = V1ModelProcess("checksum", _program_with_checksum(), packet_io)
+    assert [checksum.name for checksum in process.checksums] == ["cksum_verify", "cksum_update"]
+    processor = V1ModelProcessor(FixedTimeRuntime()).load(process)
+    _hook(processor, "egress", V1ModelInstanceType.NORMAL)
+    port_in_meta = V1ModelPortMeta({"ingress_port": 1})
+
+    packets_in = [
+        _packet_in(process, packet_io, checksum=_ipv4_checksum(64)),
+        _packet_in(process, packet_io, checksum=0x1234),
+    ]
+    if stage_major:
+        packets_out = [output for outputs in processor.input_batch(
+            [(port_in_meta, packet) for packet in packets_in], stage_major=True,
+        ) for output in outputs]
+    else:
+        packets_out = [output for packet in packets_in for output in processor.input(
+            port_in_meta, packet,
+        )]
+
+    # The checksum is updated for the decremented TTL whether or not it was right.
+    assert [meta.standard_metadata["checksum_error"] for meta, _ in packets_out] == [0, 1]
+    for _, packet_out in packets_out:
+        if packet_io == PacketIO.BINARY:
+            ipv4 = bytes(packet_out)[8:15]
+            assert ipv4[4] == 63
+            assert int.from_bytes(ipv4[5:], "big") == _ipv4_checksum(63)
+        else:
+            packet_out = packet_out.copy()
+            packet_out.pop()
+            ipv4 = packet_out.pop()
+            assert ipv4["ttl"].val == 63
+            assert ipv4["checksum"].val == _ipv4_checksum(63)